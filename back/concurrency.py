@@ -0,0 +1,77 @@
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Set
+
+from logs import get_logger
+
+log = get_logger(__name__)
+
+# Shared pool for blocking work (sync SDK calls, PIL, disk I/O).
+# Sized so a single worker can keep dozens of generations in flight.
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", "32"))
+
+# Per-endpoint concurrency limits - how many requests of each kind may be
+# running upstream at the same time on this worker.
+ENDPOINT_LIMITS = {
+    "chat": int(os.getenv("CHAT_CONCURRENCY", "24")),
+    "video": int(os.getenv("VIDEO_CONCURRENCY", "16")),
+    "io": int(os.getenv("IO_CONCURRENCY", "8")),
+}
+
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE, thread_name_prefix="blocking")
+_limiters: Dict[str, asyncio.Semaphore] = {}
+
+
+def get_limiter(name: str) -> asyncio.Semaphore:
+    """Return the semaphore guarding the given endpoint group"""
+    limiter = _limiters.get(name)
+    if limiter is None:
+        limiter = asyncio.Semaphore(ENDPOINT_LIMITS.get(name, BLOCKING_POOL_SIZE))
+        _limiters[name] = limiter
+    return limiter
+
+
+@asynccontextmanager
+async def limit(name: str):
+    """Hold a slot of the given endpoint group for the duration of the block"""
+    async with get_limiter(name):
+        yield
+
+
+async def run_blocking(func: Callable, *args, **kwargs):
+    """Run a blocking callable in the shared thread pool and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+async def run_limited(name: str, func: Callable, *args, **kwargs):
+    """Run a blocking callable in the thread pool under an endpoint limit"""
+    async with limit(name):
+        return await run_blocking(func, *args, **kwargs)
+
+
+# Background tasks started with spawn(). The event loop only keeps weak
+# references to tasks, so they are kept here until they finish.
+_tasks: Set[asyncio.Task] = set()
+
+
+def spawn(coro) -> asyncio.Task:
+    """Start a background task, keep a reference until it is done and log its failure"""
+    task = asyncio.create_task(coro)
+    _tasks.add(task)
+    task.add_done_callback(_task_done)
+    return task
+
+
+def _task_done(task: asyncio.Task):
+    _tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        log.error("Background task failed", task=task.get_name(), exc_info=task.exception())
+
+
+def shutdown():
+    """Stop accepting blocking work (called on app shutdown)"""
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,44 @@
+import os
+import tempfile
+
+from concurrency import run_limited
+from metrics import FILE_WRITE_BYTES
+from retry import call_with_retry
+
+# Write buffer for streamed downloads. The SDK hands us 1 MB chunks, so peak
+# memory per download stays around one chunk plus this buffer.
+DOWNLOAD_BUFFER_SIZE = int(os.getenv("DOWNLOAD_BUFFER_SIZE", str(1024 * 1024)))
+
+
+def download_to_file(client, video, output_dir: str, filename: str) -> str:
+    """
+    Stream a generated video to output_dir/filename without holding it in memory.
+    Writes to a hidden temp file in the same directory and renames it into place,
+    so a half-written file is never served from /outputs.
+    """
+    final_path = os.path.join(output_dir, filename)
+    fd, temp_path = tempfile.mkstemp(dir=output_dir, prefix=f".{filename}.", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb", buffering=DOWNLOAD_BUFFER_SIZE) as f:
+            video_bytes = getattr(video, "video_bytes", None)
+            if video_bytes:
+                # Already inlined in the operation response, nothing to fetch
+                f.write(video_bytes)
+            else:
+                client.files.download(file=video, destination=f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, final_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    FILE_WRITE_BYTES.inc(os.path.getsize(final_path), kind="video")
+    return final_path
+
+
+async def download_video(client, video, output_dir: str, filename: str) -> str:
+    """Stream a generated video to disk off the event loop and return its path"""
+    return await call_with_retry("files_download", run_limited, "io", download_to_file, client, video, output_dir, filename)
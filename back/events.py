@@ -0,0 +1,120 @@
+import os
+import json
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+# Seconds between keep-alive comments on idle event streams, so proxies
+# don't close the connection while a video is still rendering.
+KEEPALIVE_INTERVAL = 15
+
+# How often the stream of an operation run by another worker re-reads its
+# journaled state, in seconds
+JOURNAL_POLL_INTERVAL = float(os.getenv("EVENTS_JOURNAL_POLL_INTERVAL", "2"))
+
+# Statuses after which no further events are sent for an operation
+TERMINAL_STATUSES = ("completed", "error")
+
+
+class OperationEvents:
+    """In-process pub/sub for video operation state transitions"""
+
+    def __init__(self, max_queue_size: int = 100):
+        self.max_queue_size = max_queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def subscribe(self, operation_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._subscribers.setdefault(operation_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, operation_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(operation_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[operation_id]
+
+    def publish(self, operation_id: str, event: dict):
+        """Push an event to every subscriber of the operation (never blocks)"""
+        for queue in self._subscribers.get(operation_id, ()):
+            if queue.full():
+                # Slow consumer: drop the oldest event, the newest state matters most
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def subscriber_count(self, operation_id: Optional[str] = None) -> int:
+        if operation_id is not None:
+            return len(self._subscribers.get(operation_id, ()))
+        return sum(len(queues) for queues in self._subscribers.values())
+
+
+def format_sse(event: dict, event_type: Optional[str] = None) -> str:
+    """Encode an event as a Server-Sent Events message"""
+    message = f"data: {json.dumps(event)}\n\n"
+    if event_type:
+        message = f"event: {event_type}\n{message}"
+    return message
+
+
+async def stream_operation_events(
+    events: OperationEvents,
+    operation_id: str,
+    snapshot: Callable[[], dict],
+) -> AsyncIterator[str]:
+    """
+    Yield SSE messages for one operation: the current state first, then every
+    published transition until the operation completes or fails.
+    """
+    queue = events.subscribe(operation_id)
+    try:
+        current = snapshot()
+        yield format_sse(current, "snapshot")
+        if current.get("status") in TERMINAL_STATUSES:
+            return
+
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+
+            yield format_sse(event, event.get("event"))
+            if event.get("status") in TERMINAL_STATUSES:
+                return
+    finally:
+        events.unsubscribe(operation_id, queue)
+
+
+async def poll_operation_events(
+    load: Callable[[], Awaitable[Optional[dict]]],
+    payload: Callable[[dict], dict],
+) -> AsyncIterator[str]:
+    """
+    Yield SSE messages for an operation this process does not run (another
+    worker, or one before a restart): its record is re-read with load()
+    every JOURNAL_POLL_INTERVAL seconds and sent, as an event named after
+    its status, whenever it changed; until it completes, fails or is gone.
+    """
+    record = await load()
+    if record is None:
+        return
+    current = payload(record)
+    yield format_sse(current, "snapshot")
+
+    quiet = 0.0
+    while current.get("status") not in TERMINAL_STATUSES:
+        await asyncio.sleep(JOURNAL_POLL_INTERVAL)
+        latest = await load()
+        if latest is None:
+            return
+        if latest == record:
+            quiet += JOURNAL_POLL_INTERVAL
+            if quiet >= KEEPALIVE_INTERVAL:
+                quiet = 0.0
+                yield ": keep-alive\n\n"
+            continue
+        record, quiet = latest, 0.0
+        current = payload(record)
+        yield format_sse({**current, "event": current.get("status")}, current.get("status"))
@@ -0,0 +1,147 @@
+import os
+import time
+import heapq
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from logs import get_logger
+
+log = get_logger(__name__)
+
+# How often the background reaper sweeps expired entries, in seconds
+REAPER_INTERVAL = float(os.getenv("REAPER_INTERVAL", "60"))
+
+
+class ExpiryIndex:
+    """
+    Min-heap of (deadline, key). Scheduling is O(log n) and popping expired
+    keys costs O(expired log n), instead of scanning every entry.
+    Rescheduled or discarded keys leave stale heap entries behind; they are
+    skipped on pop and compacted away when they outnumber live ones.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, Hashable]] = []
+        self._deadlines: Dict[Hashable, float] = {}
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def schedule(self, key: Hashable, deadline: float):
+        """Set (or move) the deadline of a key"""
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._compact()
+
+    def discard(self, key: Hashable):
+        self._deadlines.pop(key, None)
+
+    def deadline(self, key: Hashable) -> Optional[float]:
+        return self._deadlines.get(key)
+
+    def pop_expired(self, now: Optional[float] = None) -> List[Hashable]:
+        """Remove and return every key whose deadline has passed"""
+        now = time.time() if now is None else now
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, key = heapq.heappop(self._heap)
+            if self._deadlines.get(key) == deadline:
+                del self._deadlines[key]
+                expired.append(key)
+        return expired
+
+    def _compact(self):
+        self._heap = [(deadline, key) for key, deadline in self._deadlines.items()]
+        heapq.heapify(self._heap)
+
+
+class ExpiringRegistry(dict):
+    """
+    Dict of records that expire a fixed time after their timestamp field.
+    Assigning a record schedules it in an ExpiryIndex; pop_expired() then
+    removes expired records without scanning the whole registry.
+    With an `expires` predicate only matching records (e.g. finished ones)
+    are scheduled; call touch() when a record changes state to (re)start
+    or cancel its countdown.
+    """
+
+    def __init__(self, ttl: float, timestamp_key: str = 'created_at',
+                 expires: Optional[Callable[[dict], bool]] = None):
+        super().__init__()
+        self.ttl = ttl
+        self.timestamp_key = timestamp_key
+        self.expires = expires or (lambda record: True)
+        self.index = ExpiryIndex()
+
+    def __setitem__(self, key, record):
+        super().__setitem__(key, record)
+        if self.expires(record):
+            self.index.schedule(key, (record.get(self.timestamp_key) or time.time()) + self.ttl)
+        else:
+            self.index.discard(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.index.discard(key)
+
+    def pop(self, key, *default):
+        self.index.discard(key)
+        return super().pop(key, *default)
+
+    def touch(self, key, now: Optional[float] = None):
+        """Restart a record's TTL from now, or stop it when the record no longer expires"""
+        record = self.get(key)
+        if record is None:
+            return
+        if self.expires(record):
+            self.index.schedule(key, (time.time() if now is None else now) + self.ttl)
+        else:
+            self.index.discard(key)
+
+    def pop_expired(self, now: Optional[float] = None) -> List[Tuple[Hashable, dict]]:
+        """Remove expired records and return them as (key, record) pairs"""
+        return [
+            (key, dict.pop(self, key)) for key in self.index.pop_expired(now)
+            if key in self and self.expires(self[key])
+        ]
+
+
+class Reaper:
+    """Background task running cleanup callbacks every REAPER_INTERVAL seconds"""
+
+    def __init__(self, interval: float = REAPER_INTERVAL):
+        self.interval = interval
+        self._jobs: List[Tuple[str, Callable[[], Awaitable]]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def add_job(self, name: str, job: Callable[[], Awaitable]):
+        self._jobs.append((name, job))
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run_once(self):
+        for name, job in self._jobs:
+            try:
+                await job()
+            except Exception as e:
+                log.exception("Cleanup job failed", job=name)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.run_once()
@@ -0,0 +1,111 @@
+import io
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from google.genai import types
+
+from expiry import ExpiryIndex
+from retry import call_with_retry
+
+# Reuse uploaded Gemini files for repeated images instead of re-sending bytes
+GEMINI_FILE_CACHE = os.getenv("GEMINI_FILE_CACHE", "true").lower() in ("1", "true", "yes")
+
+# Uploaded files live 48h upstream; stop handing a file out this long before
+# it expires so a request in flight never references a deleted file
+FILE_CACHE_EXPIRY_MARGIN = float(os.getenv("FILE_CACHE_EXPIRY_MARGIN", "600"))
+
+# Used when the API does not report an expiration time
+FILE_CACHE_DEFAULT_TTL = float(os.getenv("FILE_CACHE_DEFAULT_TTL", str(47 * 3600)))
+
+# Number of file handles kept per worker
+FILE_CACHE_MAX_ENTRIES = int(os.getenv("FILE_CACHE_MAX_ENTRIES", "1000"))
+
+
+class FileCache:
+    """
+    Content digest -> uploaded Gemini file handle. The first use of an image
+    uploads it through the Files API; later uses with the same bytes get the
+    cached handle until shortly before the upstream file expires. Concurrent
+    requests for the same digest share one upload.
+    """
+
+    def __init__(self, client, max_entries: int = FILE_CACHE_MAX_ENTRIES,
+                 expiry_margin: float = FILE_CACHE_EXPIRY_MARGIN):
+        self.client = client
+        self.max_entries = max_entries
+        self.expiry_margin = expiry_margin
+        self._files: "OrderedDict[str, types.File]" = OrderedDict()
+        self._expiry = ExpiryIndex()
+        self._uploads: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.uploads = 0
+
+    def __len__(self):
+        return len(self._files)
+
+    def _deadline(self, file: types.File) -> float:
+        if file.expiration_time is not None:
+            return file.expiration_time.timestamp() - self.expiry_margin
+        return time.time() + FILE_CACHE_DEFAULT_TTL - self.expiry_margin
+
+    def get(self, digest: str) -> Optional[types.File]:
+        """Cached, unexpired handle for a digest, or None"""
+        for expired in self._expiry.pop_expired():
+            self._files.pop(expired, None)
+        file = self._files.get(digest)
+        if file is not None:
+            self._files.move_to_end(digest)
+            self.hits += 1
+        return file
+
+    def put(self, digest: str, file: types.File):
+        deadline = self._deadline(file)
+        if deadline <= time.time():
+            return
+        self._files[digest] = file
+        self._files.move_to_end(digest)
+        self._expiry.schedule(digest, deadline)
+        while len(self._files) > self.max_entries:
+            evicted, _ = self._files.popitem(last=False)
+            self._expiry.discard(evicted)
+
+    def discard(self, digest: str):
+        """Forget a handle (e.g. after the API rejected it)"""
+        self._files.pop(digest, None)
+        self._expiry.discard(digest)
+
+    async def get_or_upload(self, digest: str, data: bytes, mime_type: str) -> types.File:
+        file = self.get(digest)
+        if file is not None:
+            return file
+
+        pending = self._uploads.get(digest)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._uploads[digest] = future
+        try:
+            # Fresh stream per attempt, a retried upload starts from the first byte
+            file = await call_with_retry("files_upload", lambda: self.client.aio.files.upload(
+                file=io.BytesIO(data),
+                config=types.UploadFileConfig(mime_type=mime_type, display_name=digest[:32]),
+            ))
+            self.uploads += 1
+            self.put(digest, file)
+            future.set_result(file)
+            return file
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            del self._uploads[digest]
+
@@ -0,0 +1,198 @@
+import io
+import os
+import hashlib
+from typing import BinaryIO, NamedTuple, Optional, Tuple, Union
+
+from PIL import Image, ImageOps
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+
+from metrics import IMAGE_SECONDS, timed
+
+# Largest upload accepted, in bytes
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(32 * 1024 ** 2)))
+
+# Largest multipart request body accepted, refused while it is received:
+# the most images a request takes (3 reference images) plus the form fields
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(3 * UPLOAD_MAX_BYTES + 1024 ** 2)))
+
+# Largest image accepted, in pixels (checked from the header, before decoding)
+INPUT_IMAGE_MAX_PIXELS = int(os.getenv("INPUT_IMAGE_MAX_PIXELS", str(64 * 1000 ** 2)))
+
+# Longest side sent to the models; larger images are downscaled first
+INPUT_IMAGE_MAX_SIDE = int(os.getenv("INPUT_IMAGE_MAX_SIDE", "2048"))
+
+# Formats accepted for upload, and the MIME type they are sent as when the
+# original bytes can go to the model unchanged (None: must be converted)
+UPLOAD_FORMATS = {
+    "JPEG": "image/jpeg",
+    "MPO": "image/jpeg",  # multi-picture JPEG from phone cameras, first frame is plain JPEG
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "GIF": None,
+    "BMP": None,
+    "TIFF": None,
+}
+
+# File extension uploads of each format are stored under
+FORMAT_EXTENSIONS = {
+    "JPEG": "jpg",
+    "MPO": "jpg",
+    "PNG": "png",
+    "WEBP": "webp",
+    "GIF": "gif",
+    "BMP": "bmp",
+    "TIFF": "tiff",
+}
+
+# Images larger than this are re-encoded even when their dimensions are fine,
+# which bounds the bytes held in memory for the model request
+INPUT_IMAGE_PASSTHROUGH_BYTES = int(os.getenv("INPUT_IMAGE_PASSTHROUGH_BYTES", str(8 * 1024 ** 2)))
+
+# Read size when hashing and copying uploads
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Quality for downscaled photos
+NORMALIZED_JPEG_QUALITY = int(os.getenv("NORMALIZED_JPEG_QUALITY", "90"))
+
+
+class InvalidImage(ValueError):
+    """Upload rejected by ingestion; status_code is the HTTP status to answer with"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ImageInfo(NamedTuple):
+    format: str
+    width: int
+    height: int
+    mime_type: Optional[str]  # what the image is sent as; None if it needs converting
+
+
+ImageSource = Union[bytes, BinaryIO]
+
+
+def _open_source(source: ImageSource) -> BinaryIO:
+    """File object for an image given as bytes or as a (spooled) upload file"""
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    source.seek(0)
+    return source
+
+
+def _source_size(source: ImageSource) -> int:
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    return source.seek(0, io.SEEK_END)
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware answering multipart requests larger than
+    UPLOAD_MAX_REQUEST_BYTES with a 413 as soon as that is known: from
+    Content-Length up front, otherwise by counting the body while it is
+    received, before the multipart parser has spooled the rest to disk.
+    """
+
+    def __init__(self, app, max_bytes: Optional[int] = None):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            return await self.app(scope, receive, send)
+        max_bytes = UPLOAD_MAX_REQUEST_BYTES if self.max_bytes is None else self.max_bytes
+        detail = f"Upload is larger than {max_bytes // 1024 ** 2} MB"
+        content_length = headers.get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > max_bytes:
+            return await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    # Raised inside form parsing, answered by the app's HTTPException handler
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def scan_upload(fileobj: BinaryIO) -> Tuple[str, int]:
+    """
+    SHA-256 and size of an upload file, read in chunks (run via run_blocking).
+    Stops with a 413 as soon as the upload passes UPLOAD_MAX_BYTES.
+    """
+    fileobj.seek(0)
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = fileobj.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > UPLOAD_MAX_BYTES:
+            raise InvalidImage(f"Image is larger than {UPLOAD_MAX_BYTES // 1024 ** 2} MB", 413)
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest(), size
+
+
+@timed(IMAGE_SECONDS, step="inspect")
+def inspect_image(source: ImageSource) -> ImageInfo:
+    """
+    Validate an upload from its header only (PIL opens lazily, nothing is
+    decoded): size in bytes, format and pixel count.
+    """
+    if _source_size(source) > UPLOAD_MAX_BYTES:
+        raise InvalidImage(f"Image is larger than {UPLOAD_MAX_BYTES // 1024 ** 2} MB", 413)
+    try:
+        with Image.open(_open_source(source)) as image:
+            image_format, (width, height) = image.format, image.size
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        raise InvalidImage("Image dimensions are too large", 413)
+    except Exception:
+        raise InvalidImage("Unsupported or corrupt image file")
+    if image_format not in UPLOAD_FORMATS:
+        raise InvalidImage(f"Unsupported image format: {image_format}")
+    if width * height > INPUT_IMAGE_MAX_PIXELS:
+        raise InvalidImage(f"Image has {width}x{height} pixels, limit is {INPUT_IMAGE_MAX_PIXELS}", 413)
+    return ImageInfo(image_format, width, height, UPLOAD_FORMATS[image_format])
+
+
+@timed(IMAGE_SECONDS, step="normalize")
+def normalize_image(source: ImageSource, max_side: int = INPUT_IMAGE_MAX_SIDE) -> Tuple[bytes, str]:
+    """
+    Bytes and MIME type to send to the model for an upload given as bytes or
+    as a file (run via run_blocking). Images already small enough in a format
+    the model takes are passed through untouched. Larger ones are downscaled
+    while decoding where the format allows it (JPEG draft mode decodes at 1/2,
+    1/4 or 1/8 scale), then with reduce() and a final resample, and re-encoded
+    once. Files are read lazily by the decoder, never whole into memory.
+    """
+    info = inspect_image(source)
+    if (info.mime_type and max(info.width, info.height) <= max_side
+            and _source_size(source) <= INPUT_IMAGE_PASSTHROUGH_BYTES):
+        if isinstance(source, (bytes, bytearray)):
+            return bytes(source), info.mime_type
+        return _open_source(source).read(), info.mime_type
+
+    with Image.open(_open_source(source)) as image:
+        image.draft("RGB", (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+        buffered = io.BytesIO()
+        if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+            image.save(buffered, format="PNG")
+            return buffered.getvalue(), "image/png"
+        image.convert("RGB").save(buffered, format="JPEG", quality=NORMALIZED_JPEG_QUALITY)
+        return buffered.getvalue(), "image/jpeg"
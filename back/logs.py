@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+# Minimum level written (DEBUG, INFO, WARNING, ERROR)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# "json" (one object per line, for ingestion) or "text" (for a terminal)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+# Share of high-volume lines (logged with sampled=True) that are kept
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+
+# Records waiting for the writer thread; beyond this they are dropped, never waited on
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Every application logger lives under this one, uvicorn's are left alone
+ROOT_LOGGER = "app"
+
+# Correlation IDs, attached to every record logged from the task that set
+# them (and from tasks it creates, which copy the context)
+request_id_var: contextvars.ContextVar = contextvars.ContextVar("request_id", default=None)
+operation_id_var: contextvars.ContextVar = contextvars.ContextVar("operation_id", default=None)
+session_id_var: contextvars.ContextVar = contextvars.ContextVar("session_id", default=None)
+
+CONTEXT_VARS = {
+    "request_id": request_id_var,
+    "operation_id": operation_id_var,
+    "session_id": session_id_var,
+}
+
+
+def bind(**ids):
+    """
+    Set correlation IDs for the rest of the current task, e.g. at the top of
+    a background task: bind(operation_id=operation_id). None values are skipped.
+    """
+    for name, value in ids.items():
+        if value is not None:
+            CONTEXT_VARS[name].set(value)
+
+
+@contextmanager
+def log_context(**ids):
+    """Correlation IDs for a block only (tasks shared by many operations, like the poller)"""
+    tokens = [(CONTEXT_VARS[name], CONTEXT_VARS[name].set(value)) for name, value in ids.items() if value is not None]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class StructuredLogger:
+    """
+    Thin wrapper over a stdlib logger: keyword arguments become fields of the
+    JSON record, and sampled=True keeps only LOG_SAMPLE_RATE of a line.
+    Disabled levels and sampled-out lines cost one comparison.
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+
+    def log(self, level: int, msg: str, *args, exc_info=None, sampled: bool = False, **fields):
+        if not self.logger.isEnabledFor(level):
+            return
+        if sampled:
+            if random.random() >= LOG_SAMPLE_RATE:
+                return
+            fields['sample_rate'] = LOG_SAMPLE_RATE
+        self.logger.log(level, msg, *args, exc_info=exc_info, extra={'fields': fields}, stacklevel=3)
+
+    def debug(self, msg: str, *args, **fields):
+        self.log(logging.DEBUG, msg, *args, **fields)
+
+    def info(self, msg: str, *args, **fields):
+        self.log(logging.INFO, msg, *args, **fields)
+
+    def warning(self, msg: str, *args, **fields):
+        self.log(logging.WARNING, msg, *args, **fields)
+
+    def error(self, msg: str, *args, **fields):
+        self.log(logging.ERROR, msg, *args, **fields)
+
+    def exception(self, msg: str, *args, **fields):
+        """Error with the current exception's traceback (formatted by the writer thread)"""
+        self.log(logging.ERROR, msg, *args, exc_info=True, **fields)
+
+
+def get_logger(name: str) -> StructuredLogger:
+    return StructuredLogger(logging.getLogger(f"{ROOT_LOGGER}.{name}"))
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, correlation IDs, fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for name in CONTEXT_VARS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Human readable variant: message followed by key=value pairs"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        pairs = {name: getattr(record, name, None) for name in CONTEXT_VARS}
+        pairs.update(getattr(record, 'fields', None) or {})
+        extra = " ".join(f"{key}={value}" for key, value in pairs.items() if value is not None)
+        if not extra:
+            return line
+        head, _, tail = line.partition("\n")  # keep any traceback below the fields
+        return f"{head} {extra}" + (f"\n{tail}" if tail else "")
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    Request-path half of the logging pipeline: stamps the correlation IDs
+    (they live in the caller's context) and hands the record to the writer
+    thread without blocking. Formatting and stdout writes happen on that
+    thread; when it falls behind, records are dropped and counted.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args now (they may change after the call); the rest is left to the writer
+        record.msg = record.getMessage()
+        record.args = None
+        for name, var in CONTEXT_VARS.items():
+            setattr(record, name, var.get())
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_handler: Optional[ContextQueueHandler] = None
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT, stream=None):
+    """Install the queue handler and its writer thread on the app logger (idempotent)"""
+    global _handler, _listener
+    if _listener is not None:
+        return
+    writer = logging.StreamHandler(stream or sys.stdout)
+    writer.setFormatter(TextFormatter() if log_format == "text" else JsonFormatter())
+    log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+    _handler = ContextQueueHandler(log_queue)
+    _listener = QueueListener(log_queue, writer)
+
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.setLevel(level)
+    logger.addHandler(_handler)
+    logger.propagate = False
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    logging.getLogger(ROOT_LOGGER).removeHandler(_handler)
+    _listener = None
+
+
+def dropped_records() -> int:
+    return _handler.dropped if _handler is not None else 0
+
+
+class RequestContextMiddleware:
+    """
+    ASGI middleware giving every request a request_id (the caller's
+    X-Request-ID header when present), bound for the request's task and
+    echoed back in the response headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request_id = None
+        for key, value in scope.get("headers", ()):
+            if key == b"x-request-id":
+                request_id = value.decode("latin-1")[:128]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
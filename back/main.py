@@ -1,20 +1,50 @@
 import os
 import base64
 import io
+import math
 import uuid
 import time
-from typing import List, Optional, Dict
+import asyncio
+from typing import Awaitable, Callable, List, Optional
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from google import genai
 from google.genai import types
 from PIL import Image
 from dotenv import load_dotenv
+from concurrency import limit, run_blocking, run_limited, spawn, shutdown as shutdown_executor
+from polling import OperationFailed, OperationPoller, generated_video, refresh_operation, wait_for_operation
+from events import OperationEvents, format_sse, poll_operation_events, stream_operation_events, TERMINAL_STATUSES
+from downloads import download_video
+from session_store import create_session_store
+from expiry import ExpiringRegistry, Reaper
+from operation_journal import OperationJournal
+from upload_store import UploadStore
+from video_jobs import (
+    InvalidVideoJob, VideoJobSpec, submit_video_job, validate_job,
+    EXTENSION_DURATION, MAX_SINGLE_DURATION, VALID_DURATIONS,
+)
+from scheduler import JobScheduler, INTERACTIVE, BATCH
+from file_cache import FileCache, GEMINI_FILE_CACHE
+from image_ingest import InvalidImage, FORMAT_EXTENSIONS, UploadLimitMiddleware, inspect_image, normalize_image, scan_upload
+from retry import call_with_retry, stream_with_retry
+from mp4_concat import concat_videos
+from response_cache import ResponseCache, cache_key, RESPONSE_CACHE
+from logs import get_logger, bind, setup_logging, shutdown_logging, RequestContextMiddleware
+from metrics import (
+    registry, loop_watchdog, LoopLagMonitor, MetricsMiddleware, CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    FILE_WRITE_BYTES, FILE_WRITE_SECONDS, IMAGE_SECONDS, EVENT_LOOP_LAG_MAX, RESPONSE_CACHE_LOOKUPS,
+)
 
 load_dotenv()
 
+# Structured JSON logs, written off the request path (LOG_LEVEL, LOG_FORMAT)
+setup_logging()
+log = get_logger(__name__)
+
 MODELE_NANO_BANANA = "gemini-3-pro-image-preview"
 app = FastAPI()
 
@@ -24,6 +54,16 @@ OUTPUT_DIR = "outputs"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Uploads are stored once per distinct content (sha256-named, size-bounded)
+upload_store = UploadStore(UPLOAD_DIR)
+
+# Responses to identical stateless chat requests (RESPONSE_CACHE=true, opt-in)
+response_cache = ResponseCache() if RESPONSE_CACHE else None
+
+# Oversized uploads are refused while they are received, not once spooled
+# (added first, so its 413 still goes through the CORS middleware)
+app.add_middleware(UploadLimitMiddleware)
+
 # CORS Setup
 app.add_middleware(
     CORSMiddleware,
@@ -33,6 +73,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency per route, exported on /metrics
+app.add_middleware(MetricsMiddleware)
+
+# request_id correlation ID for every log line of a request (X-Request-ID)
+app.add_middleware(RequestContextMiddleware)
+
 # Mount static files to serve images if needed (optional, but good for persistence)
 app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 app.mount("/outputs", StaticFiles(directory=OUTPUT_DIR), name="outputs")
@@ -41,35 +87,94 @@ app.mount("/outputs", StaticFiles(directory=OUTPUT_DIR), name="outputs")
 try:
     client = genai.Client()
 except Exception as e:
-    print(f"Error initializing Gemini client: {e}")
+    log.error("Gemini client not initialized", error=str(e))
     client = None
 
-# Session Registry - In-memory storage for active chat sessions
-# For production, replace with Redis or database
-sessions: Dict[str, any] = {}
+# Uploaded Gemini file handles by content digest (the Files API is Gemini
+# Developer API only; Vertex clients keep sending image bytes)
+file_cache = FileCache(client) if client and GEMINI_FILE_CACHE and not getattr(client, 'vertexai', False) else None
+
+@app.on_event("startup")
+async def on_startup():
+    setup_logging()
+    await resume_video_operations()
+    operation_poller.start()
+    reaper.start()
+    loop_lag_monitor.start()
+    loop_watchdog.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await operation_poller.stop()
+    await reaper.stop()
+    await loop_lag_monitor.stop()
+    loop_watchdog.stop()
+    shutdown_executor()
+    shutdown_logging()
+
+# Generated images are stored in the format the model returned them in
+GENERATED_IMAGE_EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/webp": "webp",
+    "image/gif": "gif",
+}
+
+# Return generated images as base64 data URIs instead of /outputs URLs (opt-in)
+INLINE_GENERATED_IMAGES = os.getenv("INLINE_GENERATED_IMAGES", "false").lower() == "true"
 
 # Session cleanup configuration
-SESSION_TIMEOUT = 3600  # 1 hour in seconds
-last_cleanup = time.time()
+SESSION_TIMEOUT = 3600  # 1 hour of inactivity, in seconds
 
-def cleanup_old_sessions():
-    """Remove sessions older than SESSION_TIMEOUT"""
-    global last_cleanup
-    current_time = time.time()
-    
-    # Only run cleanup every 5 minutes
-    if current_time - last_cleanup < 300:
-        return
-    
-    last_cleanup = current_time
-    expired_sessions = [
-        sid for sid, data in sessions.items()
-        if current_time - data.get('created_at', 0) > SESSION_TIMEOUT
-    ]
+CHAT_CONFIG = types.GenerateContentConfig(
+    response_modalities=['TEXT', 'IMAGE'],
+    tools=[{"google_search": {}}]  # Enable Google Search grounding
+)
+
+def create_chat(history=None):
+    """Create a chat (optionally rebuilt from a stored history)"""
+    return client.aio.chats.create(
+        model=MODELE_NANO_BANANA,
+        config=CHAT_CONFIG,
+        history=history,
+    )
+
+# Session Registry - pluggable store (SESSION_STORE=memory|sqlite), LRU + idle TTL
+sessions = create_session_store(create_chat, SESSION_TIMEOUT)
+
+async def cleanup_old_sessions():
+    """Remove sessions idle for longer than SESSION_TIMEOUT (run by the reaper)"""
+    for sid in await sessions.expire():
+        log.info("Expired session removed", session_id=sid)
+
+def write_bytes(path: str, data: bytes):
+    """Write raw bytes to disk (run via run_blocking)"""
+    with open(path, "wb") as f:
+        f.write(data)
+
+def read_bytes(path: str) -> bytes:
+    """Read a file from disk (run via run_blocking)"""
+    with open(path, "rb") as f:
+        return f.read()
+
+def save_generated_image(data: bytes, mime_type: Optional[str]) -> tuple:
+    """
+    Save a generated image to OUTPUT_DIR and return (path, mime_type) (run via run_blocking).
+    Bytes are written exactly as returned by the model when the MIME type is a
+    known image format; anything else is decoded once and stored as PNG.
+    """
+    ext = GENERATED_IMAGE_EXTENSIONS.get(mime_type or "")
+    if ext:
+        output_path = os.path.join(OUTPUT_DIR, f"gen_{uuid.uuid4()}.{ext}")
+        with FILE_WRITE_SECONDS.time(kind="generated_image"):
+            write_bytes(output_path, data)
+        FILE_WRITE_BYTES.inc(len(data), kind="generated_image")
+        return output_path, mime_type
     
-    for sid in expired_sessions:
-        del sessions[sid]
-        print(f"Cleaned up expired session: {sid}")
+    output_path = os.path.join(OUTPUT_DIR, f"gen_{uuid.uuid4()}.png")
+    with IMAGE_SECONDS.time(step="convert_generated"):
+        Image.open(io.BytesIO(data)).save(output_path, format="PNG")
+    return output_path, "image/png"
 
 @app.get("/")
 async def root():
@@ -82,29 +187,16 @@ async def create_chat_session():
         raise HTTPException(status_code=500, detail="Gemini client not initialized. Check GOOGLE_API_KEY.")
     
     try:
-        # Create new chat session
-        chat = client.chats.create(
-            model=MODELE_NANO_BANANA,
-            config=types.GenerateContentConfig(
-                response_modalities=['TEXT', 'IMAGE'],
-                tools=[{"google_search": {}}]  # Enable Google Search grounding
-            )
-        )
+        # Create new chat session (async client, so send_message never blocks the loop)
+        chat = create_chat()
         
         # Generate session ID
         session_id = str(uuid.uuid4())
         
         # Store in registry
-        sessions[session_id] = {
-            'chat': chat,
-            'created_at': time.time(),
-            'last_used': time.time()
-        }
+        await sessions.add(session_id, chat)
         
-        print(f"Created new session: {session_id}")
-        
-        # Cleanup old sessions
-        cleanup_old_sessions()
+        log.info("Chat session created", session_id=session_id)
         
         return {
             "session_id": session_id,
@@ -112,133 +204,379 @@ async def create_chat_session():
         }
         
     except Exception as e:
-        print(f"Error creating chat session: {e}")
+        log.exception("Chat session creation failed")
         raise HTTPException(status_code=500, detail=f"Failed to create session: {str(e)}")
 
+async def get_or_create_chat(session_id: Optional[str]):
+    """Return (chat, session_id) for an existing session, or start a new one"""
+    if session_id:
+        record = await sessions.get(session_id)
+        if record is not None:
+            # Use existing session
+            bind(session_id=session_id)
+            return record['chat'], session_id
+    
+    # Create new session
+    chat = create_chat()
+    current_session_id = str(uuid.uuid4())
+    await sessions.add(current_session_id, chat)
+    bind(session_id=current_session_id)
+    log.info("Chat session created")
+    return chat, current_session_id
+
+async def store_upload(upload: UploadFile, acquire: bool = False):
+    """
+    Validate an uploaded image and add it to the upload store; returns (digest, path).
+    Works on the spooled temp file the multipart parser wrote, in chunks, so
+    the upload is never held in memory whole. The file is named after the
+    detected format, whatever the client called it. With acquire=True it is
+    pinned in the same step (the caller must release it).
+    """
+    # Header checks first (size, format, pixels), so a rejected upload is never hashed
+    info = await run_blocking(inspect_image, upload.file)
+    digest, _ = await run_blocking(scan_upload, upload.file)
+    return await run_blocking(
+        upload_store.put_file, upload.file, digest, FORMAT_EXTENSIONS[info.format], acquire
+    )
+
+async def release_uploads(digests: List[str]):
+    """Drop references taken on stored uploads"""
+    for digest in digests:
+        await run_blocking(upload_store.release, digest)
+
+def load_input_image(path: str) -> types.Image:
+    """Video input image from a stored upload (run via run_blocking)"""
+    with open(path, 'rb') as f:
+        image_bytes, mime_type = normalize_image(f)
+    return types.Image(image_bytes=image_bytes, mime_type=mime_type)
+
+async def read_input_image(image_file: UploadFile):
+    """
+    Read an uploaded video input image; returns (types.Image, content digest, stored path).
+    The upload is validated before anything is stored, the original bytes are
+    stored, and the model gets them as-is or downscaled to INPUT_IMAGE_MAX_SIDE.
+    The stored copy is pinned (see pin_input_images).
+    """
+    digest, input_path = await store_upload(image_file, acquire=True)
+    try:
+        image_bytes, mime_type = await run_blocking(normalize_image, image_file.file)
+    except BaseException:
+        await release_uploads([digest])
+        raise
+    return types.Image(image_bytes=image_bytes, mime_type=mime_type), digest, input_path
+
+def pin_input_images(operation_id: str, digests: List[str]):
+    """
+    Keep an operation's input images on disk until the operation is cleaned
+    up: the references taken when they were stored now belong to the operation.
+    """
+    video_operations[operation_id]['input_digests'] = list(digests)
+
+async def chat_image_part(upload: UploadFile, digest: str):
+    """
+    Message part for an uploaded image. With the file cache enabled the image
+    is uploaded once through the Files API and referenced by URI afterwards
+    (also on every later turn, since the history keeps the reference).
+    """
+    if file_cache is not None:
+        file = file_cache.get(digest)
+        if file is not None:
+            return types.Part.from_uri(file_uri=file.uri, mime_type=file.mime_type)
+    image_bytes, mime_type = await run_blocking(normalize_image, upload.file)
+    if file_cache is not None:
+        try:
+            file = await file_cache.get_or_upload(digest, image_bytes, mime_type)
+            return types.Part.from_uri(file_uri=file.uri, mime_type=file.mime_type or mime_type)
+        except Exception as e:
+            log.warning("File upload failed, sending image inline", error=str(e))
+    return types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
+
+async def store_chat_uploads(files: Optional[List[UploadFile]]) -> List[str]:
+    """Validate and persist uploaded chat images; returns their content digests"""
+    # Save to disk (Persistence) - repeat uploads are deduplicated by content
+    return [(await store_upload(file))[0] for file in files or []]
+
+async def prepare_chat_contents(message: str, files: Optional[List[UploadFile]],
+                                digests: Optional[List[str]] = None) -> list:
+    """Persist uploaded files (unless already stored) and build the message contents for Gemini"""
+    if digests is None:
+        digests = await store_chat_uploads(files)
+    contents = [message]
+    for file, digest in zip(files or [], digests):
+        # Reference for Gemini (uploaded file handle, or inline bytes)
+        contents.append(await chat_image_part(file, digest))
+    return contents
+
+async def response_part_payload(part, inline: bool) -> Optional[dict]:
+    """Convert a model response part to the JSON shape sent to the frontend (None to skip)"""
+    # Skip thought parts (internal reasoning, not for display)
+    if hasattr(part, 'thought') and part.thought:
+        return None
+    
+    if part.text:
+        return {"type": "text", "content": part.text}
+    
+    if part.inline_data:
+        # Store the original bytes (no decode / re-encode) off the event loop
+        output_path, mime_type = await run_blocking(
+            save_generated_image, part.inline_data.data, part.inline_data.mime_type
+        )
+        image_url = f"/outputs/{os.path.basename(output_path)}"
+        
+        if inline:
+            image_bytes = part.inline_data.data
+            if mime_type != part.inline_data.mime_type:
+                # Converted on save, inline what was actually stored
+                image_bytes = await run_blocking(read_bytes, output_path)
+            with IMAGE_SECONDS.time(step="base64_encode"):
+                img_str = base64.b64encode(image_bytes).decode("utf-8")
+            content = f"data:{mime_type};base64,{img_str}"
+        else:
+            content = image_url
+        
+        return {
+            "type": "image", 
+            "content": content,
+            "url": image_url,
+            "mime_type": mime_type,
+            "path": output_path
+        }
+    
+    return None
+
+def cacheable_payload(payload: dict) -> dict:
+    """Response part as stored in the response cache (images by URL, never inlined)"""
+    if payload["type"] == "image":
+        return {**payload, "content": payload["url"]}
+    return payload
+
+def cached_part_payloads(parts: List[dict], inline: bool) -> Optional[List[dict]]:
+    """
+    Response parts for a cache hit (run via run_blocking), or None when a
+    stored image is no longer in OUTPUT_DIR and the entry cannot be served.
+    """
+    payloads = []
+    for part in parts:
+        if part["type"] == "image":
+            if not os.path.exists(part["path"]):
+                return None
+            if inline:
+                img_str = base64.b64encode(read_bytes(part["path"])).decode("utf-8")
+                part = {**part, "content": f"data:{part['mime_type']};base64,{img_str}"}
+        payloads.append(part)
+    return payloads
+
+async def cached_chat_response(message: str, files: Optional[List[UploadFile]], session_id: Optional[str],
+                               cache: Optional[str], inline: bool) -> tuple:
+    """
+    Response cache lookup of a chat request: (key, digests, payloads).
+    Only stateless requests are cached (key None otherwise); the uploads
+    are stored to hash them (digests, None when not looked up). payloads is
+    the earlier answer, or None on a miss.
+    """
+    if response_cache is None or session_id:
+        return None, None, None
+    if cache == "bypass":
+        RESPONSE_CACHE_LOOKUPS.inc(result="bypass")
+        return None, None, None
+    digests = await store_chat_uploads(files)
+    key = cache_key(
+        model=MODELE_NANO_BANANA,
+        config=CHAT_CONFIG.model_dump(mode="json", exclude_none=True),
+        message=message,
+        images=digests,
+    )
+    cached_parts = await response_cache.get(key)
+    if cached_parts is not None:
+        payloads = await run_blocking(cached_part_payloads, cached_parts, inline)
+        if payloads is not None:
+            return key, digests, payloads
+        await response_cache.discard(key)
+    return key, digests, None
+
+async def cache_chat_response(key: Optional[str], payloads: List[dict]):
+    """Store the answer of a cacheable chat request (no-op without a key or parts)"""
+    if key is None or not payloads:
+        return
+    try:
+        await response_cache.put(key, [cacheable_payload(payload) for payload in payloads])
+    except OSError as e:
+        log.warning("Response cache write failed", error=str(e))
+
 @app.post("/api/chat")
 async def chat_endpoint(
     message: str = Form(...),
     files: List[UploadFile] = File(None),
     session_id: Optional[str] = Form(None),
+    inline_images: Optional[bool] = Form(None),
+    cache: Optional[str] = Form(None),
 ):
     """
     Send a message in a chat session.
     If session_id is provided, continues existing conversation.
     If not, creates a new session automatically.
+    Generated images are returned as /outputs URLs; set inline_images=true
+    to get base64 data URIs instead.
+    With RESPONSE_CACHE enabled, a request without session_id that matches an
+    earlier one is answered from the cache ("cached": true, no session);
+    set cache=bypass to always generate.
     """
     if not client:
         raise HTTPException(status_code=500, detail="Gemini client not initialized. Check GOOGLE_API_KEY.")
+    if cache not in (None, "bypass"):
+        raise HTTPException(status_code=400, detail="cache must be 'bypass' when set")
 
     try:
+        inline = INLINE_GENERATED_IMAGES if inline_images is None else inline_images
+
+        # Stateless requests: look for an identical earlier one first
+        key, digests, cached_payloads = await cached_chat_response(message, files, session_id, cache, inline)
+        if cached_payloads is not None:
+            return {"parts": cached_payloads, "session_id": None, "cached": True}
+
         # Get or create chat session
-        chat = None
-        current_session_id = session_id
-        
-        if session_id and session_id in sessions:
-            # Use existing session
-            chat = sessions[session_id]['chat']
-            sessions[session_id]['last_used'] = time.time()
-            print(f"Using existing session: {session_id}")
-        else:
-            # Create new session
-            chat = client.chats.create(
-                model=MODELE_NANO_BANANA,
-                config=types.GenerateContentConfig(
-                    response_modalities=['TEXT', 'IMAGE'],
-                    tools=[{"google_search": {}}]
-                )
-            )
-            current_session_id = str(uuid.uuid4())
-            sessions[current_session_id] = {
-                'chat': chat,
-                'created_at': time.time(),
-                'last_used': time.time()
-            }
-            print(f"Created new session: {current_session_id}")
+        chat, current_session_id = await get_or_create_chat(session_id)
         
         # 1. Prepare Content
-        contents = [message]
-        saved_file_paths = []
-
-        if files:
-            for file in files:
-                # Read file
-                file_content = await file.read()
-                
-                # Save to disk (Persistence)
-                file_ext = file.filename.split('.')[-1] if '.' in file.filename else "png"
-                filename = f"{uuid.uuid4()}.{file_ext}"
-                filepath = os.path.join(UPLOAD_DIR, filename)
-                with open(filepath, "wb") as f:
-                    f.write(file_content)
-                saved_file_paths.append(filepath)
-
-                # Load for Gemini
-                image = Image.open(io.BytesIO(file_content))
-                contents.append(image)
-
-        # 2. Send message to chat
-        print(f"Sending message to session {current_session_id}...")
-        response = chat.send_message(contents)
+        contents = await prepare_chat_contents(message, files, digests)
+
+        # 2. Send message to chat (bounded number of generations in flight)
+        log.debug("Sending chat message", parts=len(contents), sampled=True)
+        async with limit("chat"):
+            response = await call_with_retry("chat", chat.send_message, contents)
+        await sessions.save(current_session_id, chat)
         
         # 3. Process Response
         response_data = []
         if response.parts:
             for part in response.parts:
-                # Skip thought parts (internal reasoning, not for display)
-                if hasattr(part, 'thought') and part.thought:
-                    continue
-                
-                if part.text:
-                    response_data.append({"type": "text", "content": part.text})
-                elif part.inline_data:
-                    # Convert to image
-                    img = Image.open(io.BytesIO(part.inline_data.data))
-                    
-                    # Save generated image
-                    output_filename = f"gen_{uuid.uuid4()}.png"
-                    output_path = os.path.join(OUTPUT_DIR, output_filename)
-                    img.save(output_path)
-                    
-                    # Convert to base64 for immediate frontend display
-                    buffered = io.BytesIO()
-                    img.save(buffered, format="PNG")
-                    img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-                    
-                    response_data.append({
-                        "type": "image", 
-                        "content": f"data:image/png;base64,{img_str}",
-                        "path": output_path
-                    })
+                payload = await response_part_payload(part, inline)
+                if payload:
+                    response_data.append(payload)
         
-        # Cleanup old sessions
-        cleanup_old_sessions()
+        await cache_chat_response(key, response_data)
         
         return {
             "parts": response_data,
             "session_id": current_session_id
         }
 
+    except InvalidImage as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
-        print(f"Error in chat: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Chat request failed")
         # Return a text error to the chat
         return {"parts": [{"type": "text", "content": f"Error: {str(e)}"}]}
 
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(
+    message: str = Form(...),
+    files: List[UploadFile] = File(None),
+    session_id: Optional[str] = Form(None),
+    inline_images: Optional[bool] = Form(None),
+    cache: Optional[str] = Form(None),
+):
+    """
+    Streaming variant of /api/chat (Server-Sent Events).
+    Emits a `session` event first, then `text` deltas as soon as they arrive,
+    `image` parts as they complete, and a final `done` (or `error`) event.
+    Cached answers (see /api/chat) are sent as whole parts, with a null
+    session and "cached": true on `done`.
+    """
+    if not client:
+        raise HTTPException(status_code=500, detail="Gemini client not initialized. Check GOOGLE_API_KEY.")
+    if cache not in (None, "bypass"):
+        raise HTTPException(status_code=400, detail="cache must be 'bypass' when set")
+    inline = INLINE_GENERATED_IMAGES if inline_images is None else inline_images
+    
+    # Uploads must be consumed before the response starts streaming
+    try:
+        key, digests, cached_payloads = await cached_chat_response(message, files, session_id, cache, inline)
+        if cached_payloads is None:
+            contents = await prepare_chat_contents(message, files, digests)
+    except InvalidImage as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    
+    if cached_payloads is not None:
+        async def cached_stream():
+            yield format_sse({"session_id": None}, "session")
+            for payload in cached_payloads:
+                yield format_sse(payload, payload["type"])
+            yield format_sse({"session_id": None, "cached": True}, "done")
+        
+        return StreamingResponse(
+            cached_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    
+    chat, current_session_id = await get_or_create_chat(session_id)
+    
+    # The chat slot is only held while the answer is generated, not while it
+    # is written to the client: parts go through a queue the response drains
+    # at the client's pace (one answer, so bounded by the answer's size)
+    parts: asyncio.Queue = asyncio.Queue()
+    
+    async def generate():
+        try:
+            log.debug("Streaming chat message", parts=len(contents), sampled=True)
+            response_data = []
+            async with limit("chat"):
+                async for chunk in await stream_with_retry("chat", chat.send_message_stream, contents):
+                    for part in chunk.parts or []:
+                        payload = await response_part_payload(part, inline)
+                        if payload:
+                            parts.put_nowait(payload)
+                            if key is None:
+                                continue
+                            if payload["type"] == "text" and response_data and response_data[-1]["type"] == "text":
+                                # Cached as whole text parts, not deltas
+                                response_data[-1] = {**response_data[-1], "content": response_data[-1]["content"] + payload["content"]}
+                            else:
+                                response_data.append(payload)
+            
+            await sessions.save(current_session_id, chat)
+            await cache_chat_response(key, response_data)
+        finally:
+            parts.put_nowait(None)
+    
+    async def event_stream():
+        yield format_sse({"session_id": current_session_id}, "session")
+        generation = asyncio.create_task(generate())
+        try:
+            while (payload := await parts.get()) is not None:
+                yield format_sse(payload, payload["type"])
+            await generation
+            yield format_sse({"session_id": current_session_id}, "done")
+        
+        except Exception as e:
+            log.exception("Chat stream failed")
+            yield format_sse({"type": "text", "content": f"Error: {str(e)}"}, "error")
+        
+        finally:
+            # Client gone: stop generating
+            generation.cancel()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.get("/api/sessions")
 async def list_sessions():
     """List active sessions (for debugging)"""
+    active_sessions = await sessions.list_sessions()
     return {
-        "active_sessions": len(sessions),
+        "active_sessions": len(active_sessions),
         "sessions": [
             {
-                "session_id": sid,
+                "session_id": data['session_id'],
                 "created_at": data['created_at'],
                 "last_used": data['last_used'],
                 "age_seconds": time.time() - data['created_at']
             }
-            for sid, data in sessions.items()
+            for data in active_sessions
         ]
     }
 
@@ -262,13 +600,55 @@ class LongVideoGenerationRequest(BaseModel):
     negative_prompt: Optional[str] = None
     session_id: Optional[str] = None
     extension_prompts: Optional[List[str]] = None  # Optional prompts for each extension
+    # "extend": one continuous shot, each segment extends the previous one.
+    # "storyboard": independent shots (prompt, then extension_prompts) generated
+    # in parallel and joined losslessly.
+    mode: str = "extend"
 
 class VideoOperationRequest(BaseModel):
     """Request model to check video generation status"""
     operation_id: str
 
-# Store video operations for polling
-video_operations: Dict[str, any] = {}
+# Attempts per long video segment before the whole job is marked failed
+# (it can still be continued from its last checkpoint via /resume)
+LONG_VIDEO_SEGMENT_ATTEMPTS = int(os.getenv("LONG_VIDEO_SEGMENT_ATTEMPTS", "3"))
+LONG_VIDEO_RETRY_DELAY = float(os.getenv("LONG_VIDEO_RETRY_DELAY", "10"))  # doubled per attempt
+
+# Each extension contains the whole video so far, so only the final segment
+# is downloaded; set to also keep every intermediate segment on disk
+LONG_VIDEO_SAVE_SEGMENTS = os.getenv("LONG_VIDEO_SAVE_SEGMENTS", "false").lower() == "true"
+
+# Long video modes: one continuous extended shot, or independent shots in parallel
+LONG_VIDEO_MODES = ("extend", "storyboard")
+
+# Store video operations for polling; finished entries expire 2 hours after
+# their last status change (running ones never do)
+VIDEO_OPERATION_TTL = 7200
+video_operations = ExpiringRegistry(
+    VIDEO_OPERATION_TTL,
+    timestamp_key='completed_at',
+    expires=lambda record: record.get('status') in TERMINAL_STATUSES,
+)
+
+# Durable copy of video_operations (survives restarts, shared by workers)
+operation_journal = OperationJournal()
+
+# Push channel for operation state transitions (consumed by the SSE endpoint)
+operation_events = OperationEvents()
+
+# Admission control for Veo submissions (global and per-session caps, priorities)
+video_scheduler = JobScheduler()
+
+async def notify_operation(operation_id: str, event_type: str, **extra):
+    """Journal the current state of an operation and publish it to event stream subscribers"""
+    if operation_id not in video_operations:
+        return
+    video_operations.touch(operation_id)
+    await operation_journal.save(operation_id, video_operations[operation_id])
+    event = video_status_payload(operation_id)
+    event.update(extra)
+    event['event'] = event_type
+    operation_events.publish(operation_id, event)
 
 # Helper functions for automatic video extension
 def calculate_video_segments(total_duration: int) -> List[int]:
@@ -289,6 +669,22 @@ def calculate_video_segments(total_duration: int) -> List[int]:
     
     return segments
 
+def calculate_storyboard_shots(total_duration: int, shot_count: int = 0) -> List[int]:
+    """
+    Split a storyboard into shot durations Veo accepts (4, 6 or 8 seconds),
+    at least `shot_count` shots. Shots are as even as possible; the total is
+    rounded up when the durations can't add up to it exactly.
+    """
+    shots = max(shot_count, math.ceil(total_duration / MAX_SINGLE_DURATION), 1)
+    durations = []
+    remaining = total_duration
+    for index in range(shots):
+        target = remaining / (shots - index)
+        duration = next((d for d in VALID_DURATIONS if d >= target), MAX_SINGLE_DURATION)
+        durations.append(duration)
+        remaining -= duration
+    return durations
+
 def generate_extension_prompts(base_prompt: str, segment_index: int, total_segments: int) -> str:
     """
     Generate continuation prompts for video extensions
@@ -308,71 +704,91 @@ def generate_extension_prompts(base_prompt: str, segment_index: int, total_segme
     phrase = continuation_phrases[min(segment_index - 1, len(continuation_phrases) - 1)]
     return f"{phrase}. {base_prompt}"
 
-async def extend_video_automatically(
-    base_video_path: str,
-    extension_prompt: str,
-    aspect_ratio: str = "16:9",
-    resolution: str = "720p",
-    negative_prompt: Optional[str] = None
-) -> str:
+def long_video_segment_prompt(request: LongVideoGenerationRequest, segment_index: int, total_segments: int) -> str:
+    """Prompt of one segment: custom extension prompts win over generated continuations"""
+    if segment_index > 0 and request.extension_prompts and segment_index - 1 < len(request.extension_prompts):
+        return request.extension_prompts[segment_index - 1]
+    return generate_extension_prompts(request.prompt, segment_index, total_segments)
+
+def video_handle(video) -> Optional[dict]:
+    """JSON-safe upstream reference to a generated video (uri, mime type), without its bytes"""
+    if video is None:
+        return None
+    return video.model_dump(mode='json', exclude_none=True, exclude={'video_bytes'}) or None
+
+async def finish_segment(operation, filename: Optional[str] = None) -> tuple:
     """
-    Extend a video using Veo 3.1 extension capability
-    Returns the path to the extended video
+    Wait for a segment's operation; returns (path, upstream video). The video
+    is only downloaded when a filename is given (path is None otherwise).
     """
-    if not client:
-        raise Exception("Gemini client not initialized")
-    
-    # Load the base video file
-    # For video extension, we need to pass the video file object from a previous generation
-    # This is a simplified approach - in practice, the video should come from operation.response.generated_videos[0].video
-    with open(base_video_path, 'rb') as f:
-        video_data = f.read()
-    
-    # Create a temporary file object for the video
-    import tempfile
-    with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_file:
-        temp_file.write(video_data)
-        temp_file_path = temp_file.name
-    
-    # Use the file path for video extension (this may need adjustment based on actual API requirements)
-    base_video = temp_file_path
-    
-    # Build config for extension
-    config = types.GenerateVideosConfig(
-        aspect_ratio=aspect_ratio,
-        resolution=resolution,
-        duration_seconds="7",  # Extensions are 7 seconds
-        number_of_videos=1
-    )
-    
-    if negative_prompt:
-        config.negative_prompt = negative_prompt
-    
-    # Generate extension
-    operation = client.models.generate_videos(
-        model="veo-3.1-generate-preview",
-        video=base_video,
-        prompt=extension_prompt,
-        config=config,
-    )
+    # Poll until completion (non-blocking, with backoff)
+    operation = await wait_for_operation(client, operation)
+    video = generated_video(operation).video
     
-    # Poll until completion
-    while not operation.done:
-        time.sleep(10)
-        operation = client.operations.get(operation)
+    # Stream the segment to disk
+    path = None
+    if filename:
+        path = await download_video(client, video, OUTPUT_DIR, filename)
     
-    # Download the extended video
-    generated_video = operation.response.generated_videos[0]
-    video_file = client.files.download(file=generated_video.video)
-    
-    # Save extended video
-    extended_filename = f"extended_{uuid.uuid4()}.mp4"
-    extended_path = os.path.join(OUTPUT_DIR, extended_filename)
-    
-    with open(extended_path, 'wb') as f:
-        f.write(video_file.read() if hasattr(video_file, 'read') else video_file)
-    
-    return extended_path
+    return path, video
+
+async def run_segment_with_retries(
+    operation_id: str,
+    job_id: str,
+    session_id: Optional[str],
+    segment_index: int,
+    spec: VideoJobSpec,
+    remember: Callable[[Optional[str]], None],
+    filename: Optional[str] = None,
+    operation=None,
+    on_started: Optional[Callable[[], Awaitable[None]]] = None,
+) -> tuple:
+    """
+    Generate one segment of a long video (or one storyboard shot) as scheduler
+    job `job_id`; returns (path, upstream video) like finish_segment, still
+    holding the job's slot. A failed attempt frees the slot while it backs
+    off, then polls (and downloads) the same upstream job again; a new job is
+    only submitted when the job itself failed upstream or its submission
+    failed. Gives up after LONG_VIDEO_SEGMENT_ATTEMPTS attempts.
+    `operation` re-attaches to a job submitted before a restart.
+    `remember(name)` records the upstream job in flight in the operation
+    record (None once it is gone), which is journaled before waiting on it.
+    `on_started()` is awaited every time the job is admitted.
+    """
+    if operation is not None:
+        remember(operation.name)
+    attempt = 1
+    while True:
+        try:
+            if operation is not None:
+                video_scheduler.adopt(job_id, session_id)
+            else:
+                await video_scheduler.acquire(job_id, session_id, BATCH)
+            if on_started:
+                await on_started()
+            
+            if operation is None:
+                operation = await submit_video_job(client, spec)
+                # Journal the upstream job before waiting on it, so a restart can re-attach
+                remember(operation.name)
+                await operation_journal.save(operation_id, video_operations[operation_id])
+            return await finish_segment(operation, filename)
+        except InvalidVideoJob:
+            raise
+        except Exception as e:
+            video_scheduler.release(job_id)
+            if isinstance(e, OperationFailed):
+                operation = None
+                remember(None)
+            if attempt >= LONG_VIDEO_SEGMENT_ATTEMPTS:
+                raise
+            delay = LONG_VIDEO_RETRY_DELAY * 2 ** (attempt - 1)
+            log.warning("Segment failed, retrying", segment_index=segment_index, attempt=attempt,
+                        attempts=LONG_VIDEO_SEGMENT_ATTEMPTS, retry_in=delay, error=str(e),
+                        resubmit=operation is None)
+            await notify_operation(operation_id, 'segment_retry', segment_index=segment_index, attempt=attempt, error=str(e))
+            await asyncio.sleep(delay)
+            attempt += 1
 
 @app.post("/api/video_chat/generate_long")
 async def generate_long_video(request: LongVideoGenerationRequest):
@@ -384,16 +800,32 @@ async def generate_long_video(request: LongVideoGenerationRequest):
         raise HTTPException(status_code=500, detail="Gemini client not initialized. Check GOOGLE_API_KEY.")
     
     try:
-        # Calculate video segments
-        segments = calculate_video_segments(request.duration)
-        total_segments = len(segments)
+        validate_job(VideoJobSpec(
+            prompt=request.prompt,
+            aspect_ratio=request.aspect_ratio,
+            resolution=request.resolution,
+            duration=request.duration,
+            negative_prompt=request.negative_prompt,
+        ))
+        
+        if request.mode not in LONG_VIDEO_MODES:
+            raise InvalidVideoJob(f"Invalid mode. Must be one of {list(LONG_VIDEO_MODES)}")
         
-        print(f"Generating {request.duration}s video in {total_segments} segments: {segments}")
+        # Calculate video segments (shots in storyboard mode)
+        if request.mode == "storyboard":
+            segments = calculate_storyboard_shots(request.duration, len(request.extension_prompts or []) + 1)
+        else:
+            segments = calculate_video_segments(request.duration)
+        total_segments = len(segments)
         
         # Create operation tracking
         operation_id = str(uuid.uuid4())
+        bind(operation_id=operation_id, session_id=request.session_id)
+        log.info("Long video requested", mode=request.mode, duration=request.duration, segments=segments,
+                 prompt_chars=len(request.prompt))
         video_operations[operation_id] = {
             'type': 'long_video',
+            'mode': request.mode,
             'status': 'processing',
             'created_at': time.time(),
             'prompt': request.prompt,
@@ -401,126 +833,468 @@ async def generate_long_video(request: LongVideoGenerationRequest):
             'segments': segments,
             'current_segment': 0,
             'completed_segments': [],
+            'checkpoints': [],
             'current_video_path': None,
-            'progress_percentage': 0
+            'progress_percentage': 0,
+            'params': request.model_dump(),
+            'segment_operation': None
         }
+        await notify_operation(operation_id, 'processing')
         
         # Start background task for long video generation
-        import asyncio
-        asyncio.create_task(process_long_video_generation(
+        spawn(long_video_task(request.mode)(
             operation_id, request, segments
         ))
         
+        # Rough estimate: 2 minutes per segment, storyboard shots run side by side
+        waves = math.ceil(total_segments / video_scheduler.max_per_session) if request.session_id else math.ceil(total_segments / video_scheduler.max_concurrent)
         return {
             "operation_id": operation_id,
             "status": "processing",
-            "message": f"Long video generation started. Will create {total_segments} segments totaling {request.duration} seconds.",
+            "message": f"Long video generation started. Will create {total_segments} segments totaling {sum(segments)} seconds.",
             "segments": segments,
-            "estimated_time_minutes": total_segments * 2  # Rough estimate: 2 minutes per segment
+            "mode": request.mode,
+            "estimated_time_minutes": (waves if request.mode == "storyboard" else total_segments) * 2
         }
         
+    except InvalidVideoJob as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print(f"Error starting long video generation: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Long video could not be started")
         raise HTTPException(status_code=500, detail=f"Failed to start long video generation: {str(e)}")
 
 async def process_long_video_generation(
     operation_id: str,
     request: LongVideoGenerationRequest,
-    segments: List[int]
+    segments: List[int],
+    start_segment: int = 0,
+    current_video: Optional[types.Video] = None,
+    pending_operation=None,
 ):
     """
-    Background task to process long video generation with automatic extensions
+    Background task to process long video generation with automatic extensions.
+    Each extension is submitted with the upstream video handle of the previous
+    segment, and only the final video is downloaded (intermediate segments too
+    with LONG_VIDEO_SAVE_SEGMENTS). Every finished segment is checkpointed in
+    the operation record (upstream video handle, prompt, file if downloaded),
+    and a failed segment is retried on its own up to LONG_VIDEO_SEGMENT_ATTEMPTS
+    times. After a restart or a resume request it continues from
+    `start_segment` with `current_video`, re-attaching to the upstream
+    operation of the segment that was in flight if there was one.
     """
+    bind(operation_id=operation_id, session_id=request.session_id)
+    record = video_operations[operation_id]
+    # Forget checkpoints past the resume point (e.g. restarting from scratch)
+    record['checkpoints'] = record.get('checkpoints', [])[:start_segment]
+    record['completed_segments'] = record.get('completed_segments', [])[:start_segment]
+    current_video_path = record['checkpoints'][-1]['video_path'] if record['checkpoints'] else None
+    
+    def remember(name: Optional[str]):
+        record['segment_operation'] = name
+    
+    def segment_spec(segment_index: int, segment_duration: int, prompt: str) -> VideoJobSpec:
+        if segment_index == 0:
+            return VideoJobSpec(
+                prompt=prompt,
+                aspect_ratio=request.aspect_ratio,
+                resolution=request.resolution,
+                duration=segment_duration,
+                negative_prompt=request.negative_prompt,
+            )
+        # Extend the previous segment by its upstream handle, nothing is re-uploaded
+        return VideoJobSpec(
+            prompt=prompt,
+            generation_type="extension",
+            video=current_video,
+            aspect_ratio=request.aspect_ratio,
+            resolution=request.resolution,
+            duration=EXTENSION_DURATION,
+            negative_prompt=request.negative_prompt,
+        )
+    
     try:
-        current_video_path = None
-        
         for segment_index, segment_duration in enumerate(segments):
-            print(f"Processing segment {segment_index + 1}/{len(segments)} ({segment_duration}s)")
+            if segment_index < start_segment:
+                continue
+            prompt = long_video_segment_prompt(request, segment_index, len(segments))
+            log.info("Segment started", segment_index=segment_index, segments=len(segments), duration=segment_duration,
+                     extension=segment_index > 0)
             
             # Update progress
-            video_operations[operation_id]['current_segment'] = segment_index
-            video_operations[operation_id]['progress_percentage'] = int((segment_index / len(segments)) * 100)
+            record['current_segment'] = segment_index
+            record['progress_percentage'] = int((segment_index / len(segments)) * 100)
+            await notify_operation(operation_id, 'segment_started', segment_index=segment_index)
             
-            if segment_index == 0:
-                # Generate initial video
-                prompt = request.prompt
-                
-                # Build config for first segment
-                config = types.GenerateVideosConfig(
-                    aspect_ratio=request.aspect_ratio,
-                    resolution=request.resolution,
-                    duration_seconds=str(segment_duration),
-                )
-                
-                if request.negative_prompt:
-                    config.negative_prompt = request.negative_prompt
-                
-                # Generate first video
-                operation = client.models.generate_videos(
-                    model="veo-3.1-generate-preview",
-                    prompt=prompt,
-                    config=config,
-                )
-                
-                # Poll until completion
-                while not operation.done:
-                    await asyncio.sleep(10)
-                    operation = client.operations.get(operation)
-                
-                # Download first video
-                generated_video = operation.response.generated_videos[0]
-                video_file = client.files.download(file=generated_video.video)
-                
-                # Save first video
-                video_filename = f"long_video_seg0_{uuid.uuid4()}.mp4"
-                current_video_path = os.path.join(OUTPUT_DIR, video_filename)
-                
-                with open(current_video_path, 'wb') as f:
-                    f.write(video_file.read() if hasattr(video_file, 'read') else video_file)
-                
-                print(f"First segment completed: {video_filename}")
-                
-            else:
-                # Extend existing video
-                extension_prompt = generate_extension_prompts(request.prompt, segment_index, len(segments))
-                
-                # Use custom extension prompt if provided
-                if request.extension_prompts and segment_index - 1 < len(request.extension_prompts):
-                    extension_prompt = request.extension_prompts[segment_index - 1]
-                
-                print(f"Extending with prompt: {extension_prompt}")
-                
-                # Extend the video
-                current_video_path = await extend_video_automatically(
-                    current_video_path,
-                    extension_prompt,
-                    request.aspect_ratio,
-                    request.resolution,
-                    request.negative_prompt
-                )
-                
-                print(f"Extension {segment_index} completed")
+            # One upstream job at a time, admitted behind interactive requests, and retried
+            # on its own: everything before it is checkpointed
+            last_segment = segment_index == len(segments) - 1
+            video_path, current_video = await run_segment_with_retries(
+                operation_id,
+                operation_id,
+                request.session_id,
+                segment_index,
+                segment_spec(segment_index, segment_duration, prompt),
+                remember,
+                filename=f"long_video_seg{segment_index}_{uuid.uuid4()}.mp4" if last_segment or LONG_VIDEO_SAVE_SEGMENTS else None,
+                operation=pending_operation if segment_index == start_segment else None,
+            )
+            
+            log.info("Segment completed", segment_index=segment_index, segments=len(segments),
+                     file=os.path.basename(video_path) if video_path else None)
+            if video_path:
+                current_video_path = video_path
             
-            # Update completed segments
-            video_operations[operation_id]['completed_segments'].append(segment_index)
-            video_operations[operation_id]['current_video_path'] = current_video_path
+            # Checkpoint: enough to continue from here after a failure or a restart
+            record['checkpoints'].append({
+                'segment_index': segment_index,
+                'video_path': video_path,
+                'video': video_handle(current_video),
+                'prompt': prompt,
+                'duration': segment_duration,
+                'completed_at': time.time(),
+            })
+            record['completed_segments'].append(segment_index)
+            record['current_video_path'] = current_video_path
+            record['segment_operation'] = None
+            video_scheduler.release(operation_id)
+            await notify_operation(operation_id, 'segment_completed', segment_index=segment_index)
         
         # Final completion
-        video_operations[operation_id]['status'] = 'completed'
-        video_operations[operation_id]['video_path'] = current_video_path
-        video_operations[operation_id]['progress_percentage'] = 100
-        video_operations[operation_id]['completed_at'] = time.time()
+        record['status'] = 'completed'
+        record['video_path'] = current_video_path
+        record['progress_percentage'] = 100
+        record['completed_at'] = time.time()
+        record.pop('failed_segment', None)
         
-        print(f"Long video generation completed: {operation_id}")
+        await notify_operation(operation_id, 'completed')
+        log.info("Long video completed", segments=len(segments))
         
     except Exception as e:
-        print(f"Error in long video generation: {e}")
-        import traceback
-        traceback.print_exc()
-        video_operations[operation_id]['status'] = 'error'
-        video_operations[operation_id]['error'] = str(e)
+        log.exception("Long video failed", failed_segment=record.get('current_segment', 0))
+        record['status'] = 'error'
+        record['error'] = str(e)
+        record['failed_segment'] = record.get('current_segment', 0)
+        await notify_operation(operation_id, 'error')
+    
+    finally:
+        video_scheduler.release(operation_id)
+
+def long_video_resume_point(record: dict) -> tuple:
+    """
+    (next segment, upstream video of the last finished one) from a long video
+    record's checkpoints. Extensions need that upstream handle, so records
+    without one start over.
+    """
+    checkpoints = record.get('checkpoints')
+    if checkpoints and checkpoints[-1].get('video'):
+        return len(checkpoints), types.Video(**checkpoints[-1]['video'])
+    return 0, None
+
+def storyboard_job_id(operation_id: str, shot_index: int) -> str:
+    """Scheduler job of one storyboard shot"""
+    return f"{operation_id}:shot{shot_index}"
+
+async def process_storyboard_generation(
+    operation_id: str,
+    request: LongVideoGenerationRequest,
+    segments: List[int],
+    pending_operations: Optional[dict] = None,
+):
+    """
+    Background task for storyboard mode: every shot is an independent
+    text-to-video job, so all of them are submitted at once and the
+    scheduler caps how many run upstream together. Finished shots are
+    downloaded and checkpointed as they complete; a failed shot is retried on
+    its own, and a failed storyboard resumes with only the missing shots.
+    The clips are then joined without re-encoding.
+    `pending_operations` ({shot index: operation}) re-attaches to shots that
+    were in flight before a restart.
+    """
+    bind(operation_id=operation_id, session_id=request.session_id)
+    record = video_operations[operation_id]
+    record.setdefault('checkpoints', [])
+    record['shot_operations'] = {}
+    pending_operations = pending_operations or {}
+    done = {checkpoint['segment_index'] for checkpoint in record['checkpoints']
+            if checkpoint.get('video_path') and os.path.exists(checkpoint['video_path'])}
+    
+    async def run_shot(shot_index: int, shot_duration: int):
+        job_id = storyboard_job_id(operation_id, shot_index)
+        prompt = long_video_segment_prompt(request, shot_index, len(segments))
+        
+        def remember(name: Optional[str]):
+            if name:
+                record['shot_operations'][str(shot_index)] = name
+            else:
+                record['shot_operations'].pop(str(shot_index), None)
+        
+        async def on_started():
+            await notify_operation(operation_id, 'segment_started', segment_index=shot_index)
+        
+        try:
+            video_path, video = await run_segment_with_retries(
+                operation_id,
+                job_id,
+                # Without a session the shots still share one, so a storyboard is held to the per-session cap
+                request.session_id or operation_id,
+                shot_index,
+                VideoJobSpec(
+                    prompt=prompt,
+                    aspect_ratio=request.aspect_ratio,
+                    resolution=request.resolution,
+                    duration=shot_duration,
+                    negative_prompt=request.negative_prompt,
+                ),
+                remember,
+                filename=f"storyboard_shot{shot_index}_{uuid.uuid4()}.mp4",
+                operation=pending_operations.get(shot_index),
+                on_started=on_started,
+            )
+        finally:
+            video_scheduler.release(job_id)
+            remember(None)
+        
+        log.info("Shot completed", segment_index=shot_index, segments=len(segments), file=os.path.basename(video_path))
+        record['checkpoints'].append({
+            'segment_index': shot_index,
+            'video_path': video_path,
+            'video': video_handle(video),
+            'prompt': prompt,
+            'duration': shot_duration,
+            'completed_at': time.time(),
+        })
+        record['completed_segments'] = sorted(checkpoint['segment_index'] for checkpoint in record['checkpoints'])
+        # The final 10% is the join
+        record['progress_percentage'] = int(len(record['checkpoints']) / len(segments) * 90)
+        await notify_operation(operation_id, 'segment_completed', segment_index=shot_index)
+    
+    try:
+        record.pop('failed_segment', None)
+        # Drop checkpoints whose clip is gone, they are generated again
+        record['checkpoints'] = [checkpoint for checkpoint in record['checkpoints'] if checkpoint['segment_index'] in done]
+        shots = [(index, duration) for index, duration in enumerate(segments) if index not in done]
+        results = await asyncio.gather(*(run_shot(index, duration) for index, duration in shots), return_exceptions=True)
+        failures = [(index, result) for (index, _), result in zip(shots, results) if isinstance(result, BaseException)]
+        if failures:
+            record['failed_segment'] = failures[0][0]
+            raise failures[0][1]
+        
+        # Join the shots in storyboard order without re-encoding
+        clips = [checkpoint['video_path'] for checkpoint in sorted(record['checkpoints'], key=lambda c: c['segment_index'])]
+        video_filename = f"storyboard_{uuid.uuid4()}.mp4"
+        video_path = await run_limited("io", concat_videos, clips, os.path.join(OUTPUT_DIR, video_filename))
+        if not LONG_VIDEO_SAVE_SEGMENTS:
+            for checkpoint in record['checkpoints']:
+                await run_blocking(remove_file, checkpoint['video_path'])
+                checkpoint['video_path'] = None
+        
+        record['status'] = 'completed'
+        record['video_path'] = video_path
+        record['current_video_path'] = video_path
+        record['progress_percentage'] = 100
+        record['completed_at'] = time.time()
+        record.pop('failed_segment', None)
+        await notify_operation(operation_id, 'completed')
+        log.info("Storyboard completed", segments=len(segments))
+    
+    except Exception as e:
+        log.exception("Storyboard failed", failed_segment=record.get('failed_segment'))
+        record['status'] = 'error'
+        record['error'] = str(e)
+        record.setdefault('failed_segment', None)
+        await notify_operation(operation_id, 'error')
+
+def long_video_task(mode: Optional[str]):
+    """Background task running a long video of the given mode"""
+    return process_storyboard_generation if mode == "storyboard" else process_long_video_generation
+
+@app.post("/api/video_chat/resume")
+async def resume_long_video(request: VideoOperationRequest):
+    """
+    Continue a failed long video from its last checkpoint: finished segments
+    are kept and generation restarts at the segment that failed.
+    """
+    if not client:
+        raise HTTPException(status_code=500, detail="Gemini client not initialized. Check GOOGLE_API_KEY.")
+    
+    operation_id = request.operation_id
+    bind(operation_id=operation_id)
+    record = video_operations.get(operation_id)
+    if record is None:
+        # Failed on another worker (or before a restart): take it over from the journal
+        stored = await operation_journal.load(operation_id)
+        if stored is None:
+            raise HTTPException(status_code=404, detail="Operation not found")
+        if stored.get('type') != 'long_video':
+            raise HTTPException(status_code=400, detail="Only long videos can be resumed")
+        record = await operation_journal.claim(operation_id, 'error', 'processing')
+        if record is None:
+            raise HTTPException(status_code=409, detail="Only failed long videos can be resumed")
+        record['status'] = 'error'
+        video_operations[operation_id] = record
+    
+    if record.get('type') != 'long_video':
+        raise HTTPException(status_code=400, detail="Only long videos can be resumed")
+    if record['status'] != 'error':
+        raise HTTPException(status_code=409, detail=f"Operation is {record['status']}, only failed long videos can be resumed")
+    
+    record['status'] = 'processing'
+    record.pop('error', None)
+    record['segment_operation'] = None
+    await notify_operation(operation_id, 'processing')
+    
+    long_video_request = LongVideoGenerationRequest(**record['params'])
+    if long_video_request.mode == "storyboard":
+        # Only the shots without a checkpoint are generated again
+        start_segment = record.get('failed_segment') or 0
+        spawn(process_storyboard_generation(operation_id, long_video_request, record['segments']))
+    else:
+        start_segment, current_video = long_video_resume_point(record)
+        spawn(process_long_video_generation(
+            operation_id,
+            long_video_request,
+            record['segments'],
+            start_segment=start_segment,
+            current_video=current_video,
+        ))
+    log.info("Long video resumed", start_segment=start_segment)
+    
+    payload = video_status_payload(operation_id)
+    payload['resumed_from_segment'] = start_segment
+    return payload
+
+async def read_input_images(image_files: Optional[List[UploadFile]]) -> tuple:
+    """Read a request's input images; returns (images, stored paths, digests)"""
+    images, input_paths, input_digests = [], [], []
+    try:
+        for image_file in image_files or []:
+            if not image_file.filename:
+                continue
+            # Stored once per distinct image (re-sent references cost a hash, no write)
+            image, digest, input_path = await read_input_image(image_file)
+            images.append(image)
+            input_digests.append(digest)
+            input_paths.append(input_path)
+    except BaseException:
+        await release_uploads(input_digests)
+        raise
+    return images, input_paths, input_digests
+
+async def start_video_job(spec: VideoJobSpec) -> dict:
+    """
+    Shared path of every video endpoint: validate the spec, submit it to Veo,
+    register the operation for polling and answer with its id.
+    Long text-to-video jobs are handed to the long video pipeline.
+    Takes over the references on spec.input_digests.
+    """
+    try:
+        validate_job(spec)
+    except InvalidVideoJob:
+        await release_uploads(spec.input_digests)
+        raise
+    if spec.needs_extension:
+        return await generate_long_video(LongVideoGenerationRequest(
+            prompt=spec.prompt,
+            aspect_ratio=spec.aspect_ratio,
+            resolution=spec.resolution,
+            duration=spec.duration,
+            negative_prompt=spec.negative_prompt,
+            session_id=spec.session_id,
+        ))
+    
+    # Register the job, then submit it now or once the scheduler admits it
+    operation_id = str(uuid.uuid4())
+    bind(operation_id=operation_id, session_id=spec.session_id)
+    video_operations[operation_id] = {
+        'created_at': time.time(),
+        'prompt': spec.prompt,
+        'status': 'queued',
+        'params': spec.params(),
+    }
+    if spec.images:
+        video_operations[operation_id]['input_images'] = spec.input_paths
+        video_operations[operation_id]['generation_type'] = spec.generation_type
+        pin_input_images(operation_id, spec.input_digests)
+    
+    if spec.session_id:
+        await sessions.touch(spec.session_id)
+    
+    admission = video_scheduler.enqueue(operation_id, spec.session_id, INTERACTIVE)
+    if not admission.done():
+        await notify_operation(operation_id, 'queued')
+        spawn(run_queued_video_job(operation_id, spec, admission))
+        position = video_scheduler.position(operation_id)
+        log.info("Video queued", mode=spec.mode, queue_position=position, prompt_chars=len(spec.prompt))
+        return {
+            "operation_id": operation_id,
+            "status": "queued",
+            "queue_position": position,
+            "message": f"Video generation queued ({spec.mode}). Poll for status updates."
+        }
+    
+    try:
+        await submit_scheduled_video_job(operation_id, spec)
+    except Exception:
+        # Nothing was started upstream: forget the job, as if never registered
+        record = video_operations.pop(operation_id, None) or {}
+        await release_uploads(record.get('input_digests', []))
+        await operation_journal.delete(operation_id)
+        raise
+    
+    log.info("Video started", mode=spec.mode, prompt_chars=len(spec.prompt))
+    
+    return {
+        "operation_id": operation_id,
+        "status": "pending",
+        "message": f"Video generation started ({spec.mode}). Poll for status updates."
+    }
+
+async def submit_scheduled_video_job(operation_id: str, spec: VideoJobSpec):
+    """
+    Submit a job that holds a scheduler slot and hand it to the poller. The slot
+    is released when the operation finishes (finalize_video_operation), or here
+    if the submission fails.
+    """
+    try:
+        operation = await submit_video_job(client, spec)
+    except BaseException:
+        video_scheduler.release(operation_id)
+        raise
+    
+    record = video_operations.get(operation_id)
+    if record is None:
+        return  # removed while queued
+    record['operation'] = operation
+    record['status'] = 'pending'
+    operation_poller.watch(operation_id)
+    await notify_operation(operation_id, 'pending')
+
+async def run_queued_video_job(operation_id: str, spec: VideoJobSpec, admission: asyncio.Future):
+    """Background task of a queued job: wait for admission, then submit"""
+    bind(operation_id=operation_id, session_id=spec.session_id)
+    try:
+        await admission
+        await submit_scheduled_video_job(operation_id, spec)
+    except asyncio.CancelledError:
+        video_scheduler.cancel(operation_id)
+        raise
+    except Exception as e:
+        log.exception("Queued video could not be started")
+        if operation_id in video_operations:
+            video_operations[operation_id]['status'] = 'error'
+            video_operations[operation_id]['error'] = str(e)
+            await notify_operation(operation_id, 'error')
+
+def video_job_error(e: Exception) -> HTTPException:
+    """HTTP error for a failed video submission (client errors are 4xx)"""
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, InvalidImage):
+        return HTTPException(status_code=e.status_code, detail=str(e))
+    if isinstance(e, InvalidVideoJob):
+        return HTTPException(status_code=400, detail=str(e))
+    log.exception("Video could not be started")
+    return HTTPException(status_code=500, detail=f"Failed to start video generation: {str(e)}")
 
 @app.post("/api/video_chat/generate_unified")
 async def generate_video_unified(
@@ -536,158 +1310,27 @@ async def generate_video_unified(
     """
     Unified video generation endpoint that handles both text-only and image+text generation.
     Automatically chooses the right method based on whether images are provided.
+    Text-only requests longer than 8 seconds are generated as long videos.
     """
     if not client:
         raise HTTPException(status_code=500, detail="Gemini client not initialized. Check GOOGLE_API_KEY.")
     
     try:
-        has_images = image_files and len(image_files) > 0 and image_files[0].filename
-        
-        if has_images:
-            # Process images and use image-based generation
-            images = []
-            input_paths = []
-            
-            for i, image_file in enumerate(image_files):
-                file_content = await image_file.read()
-                image = Image.open(io.BytesIO(file_content))
-                images.append(image)
-                
-                # Save input image
-                input_filename = f"input_{i}_{uuid.uuid4()}.png"
-                input_path = os.path.join(UPLOAD_DIR, input_filename)
-                image.save(input_path)
-                input_paths.append(input_path)
-            
-            # Validate image count for generation type
-            if generation_type == "reference" and len(images) > 3:
-                raise ValueError("Maximum 3 images allowed for reference generation")
-            elif generation_type == "first_frame" and len(images) != 1:
-                raise ValueError("First frame requires exactly 1 image")
-            elif generation_type == "interpolation" and len(images) != 2:
-                raise ValueError("Interpolation requires exactly 2 images")
-            
-            print(f"Starting {generation_type} video generation with {len(images)} images...")
-            
-        else:
-            # Text-only generation
-            print(f"Starting text-to-video generation...")
-        
-        # Check if this requires long video generation (> 8 seconds)
-        if duration > 8 and not has_images:
-            # Redirect to long video generation for text-only requests > 8 seconds
-            long_request = LongVideoGenerationRequest(
-                prompt=prompt,
-                aspect_ratio=aspect_ratio,
-                resolution=resolution,
-                duration=duration,
-                negative_prompt=negative_prompt,
-                session_id=session_id
-            )
-            return await generate_long_video(long_request)
-        
-        # Validate parameters for standard generation
-        valid_aspect_ratios = ["16:9", "9:16"]
-        valid_resolutions = ["720p", "1080p"]
-        
-        if aspect_ratio not in valid_aspect_ratios:
-            raise ValueError(f"Invalid aspect_ratio. Must be one of {valid_aspect_ratios}")
-        if resolution not in valid_resolutions:
-            raise ValueError(f"Invalid resolution. Must be one of {valid_resolutions}")
-        if duration > 8:
-            raise ValueError(f"Duration > 8 seconds not supported for image-based generation. Use text-only for long videos.")
-        if duration < 1:
-            raise ValueError(f"Duration must be at least 1 second")
-        
-        # Build config
-        config = types.GenerateVideosConfig(
+        images, input_paths, input_digests = await read_input_images(image_files)
+        return await start_video_job(VideoJobSpec(
+            prompt=prompt,
+            generation_type=generation_type if images else "text",
+            images=images,
             aspect_ratio=aspect_ratio,
             resolution=resolution,
-            duration_seconds=str(duration),
-        )
-        
-        if negative_prompt:
-            config.negative_prompt = negative_prompt
-        
-        # Generate video based on whether images are provided
-        if has_images:
-            # Image-based generation
-            if generation_type == "reference" and len(images) <= 3:
-                # Reference images mode
-                reference_images = []
-                for image in images:
-                    reference_images.append(types.VideoGenerationReferenceImage(
-                        image=image,
-                        reference_type="asset"
-                    ))
-                
-                config.reference_images = reference_images
-                
-                operation = client.models.generate_videos(
-                    model="veo-3.1-generate-preview",
-                    prompt=prompt,
-                    config=config,
-                )
-                
-            elif generation_type == "first_frame" and len(images) == 1:
-                # Single image as first frame
-                operation = client.models.generate_videos(
-                    model="veo-3.1-generate-preview",
-                    prompt=prompt,
-                    image=images[0],
-                    config=config,
-                )
-                
-            elif generation_type == "interpolation" and len(images) == 2:
-                # First and last frame interpolation
-                config.last_frame = images[1]
-                
-                operation = client.models.generate_videos(
-                    model="veo-3.1-generate-preview",
-                    prompt=prompt,
-                    image=images[0],  # First frame
-                    config=config,
-                )
-            else:
-                raise ValueError(f"Invalid combination: {generation_type} with {len(images)} images")
-        else:
-            # Text-only generation
-            operation = client.models.generate_videos(
-                model="veo-3.1-generate-preview",
-                prompt=prompt,
-                config=config,
-            )
-        
-        # Store operation for polling
-        operation_id = str(uuid.uuid4())
-        video_operations[operation_id] = {
-            'operation': operation,
-            'created_at': time.time(),
-            'prompt': prompt,
-            'status': 'pending'
-        }
-        
-        if has_images:
-            video_operations[operation_id]['input_images'] = input_paths
-            video_operations[operation_id]['generation_type'] = generation_type
-        
-        if session_id and session_id in sessions:
-            sessions[session_id]['last_used'] = time.time()
-        
-        generation_mode = f"{generation_type} with {len(images)} images" if has_images else "text-to-video"
-        print(f"Video generation started with operation_id: {operation_id} ({generation_mode})")
-        
-        return {
-            "operation_id": operation_id,
-            "status": "pending",
-            "message": f"Video generation started ({generation_mode}). Poll for status updates."
-        }
-    
+            duration=duration,
+            negative_prompt=negative_prompt,
+            session_id=session_id,
+            input_paths=input_paths,
+            input_digests=input_digests,
+        ))
     except Exception as e:
-        print(f"Error starting video generation: {e}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Failed to start video generation: {str(e)}")
+        raise video_job_error(e)
 
 @app.post("/api/video_chat/generate")
 async def generate_video(request: VideoGenerationRequest):
@@ -699,169 +1342,230 @@ async def generate_video(request: VideoGenerationRequest):
         raise HTTPException(status_code=500, detail="Gemini client not initialized. Check GOOGLE_API_KEY.")
     
     try:
-        # Validate parameters
-        valid_aspect_ratios = ["16:9", "9:16"]
-        valid_resolutions = ["720p", "1080p"]
-        valid_durations = ["4", "6", "8"]
-        
-        if request.aspect_ratio not in valid_aspect_ratios:
-            raise ValueError(f"Invalid aspect_ratio. Must be one of {valid_aspect_ratios}")
-        if request.resolution not in valid_resolutions:
-            raise ValueError(f"Invalid resolution. Must be one of {valid_resolutions}")
-        if request.duration not in valid_durations:
-            raise ValueError(f"Invalid duration. Must be one of {valid_durations}")
-        
-        # Build config
-        config = types.GenerateVideosConfig(
+        return await start_video_job(VideoJobSpec(
+            prompt=request.prompt,
             aspect_ratio=request.aspect_ratio,
             resolution=request.resolution,
-            duration_seconds=request.duration,
-        )
-        
-        if request.negative_prompt:
-            config.negative_prompt = request.negative_prompt
+            duration=request.duration,
+            negative_prompt=request.negative_prompt,
+            session_id=request.session_id,
+        ))
+    except Exception as e:
+        raise video_job_error(e)
+
+async def finalize_video_operation(operation_id: str, operation):
+    """Download a finished video once and mark its operation completed (called by the poller)"""
+    bind(operation_id=operation_id)
+    operation_data = video_operations.get(operation_id)
+    if operation_data is None:
+        video_scheduler.release(operation_id)
+        return
+    
+    try:
+        video = generated_video(operation).video
         
-        print(f"Starting video generation with prompt: {request.prompt[:100]}...")
+        # Stream video to the outputs directory (constant memory, atomic rename)
+        video_filename = f"gen_video_{uuid.uuid4()}.mp4"
+        video_path = await download_video(client, video, OUTPUT_DIR, video_filename)
         
-        # Start video generation (async operation)
-        operation = client.models.generate_videos(
-            model="veo-3.1-generate-preview",
-            prompt=request.prompt,
-            config=config,
-        )
+        # Update operation status
+        operation_data['video_path'] = video_path
+        operation_data['completed_at'] = time.time()
+        operation_data['status'] = 'completed'
+        await notify_operation(operation_id, 'completed')
         
-        # Store operation for polling
-        operation_id = str(uuid.uuid4())
-        video_operations[operation_id] = {
-            'operation': operation,
-            'created_at': time.time(),
-            'prompt': request.prompt,
-            'status': 'pending'
+        log.info("Video completed", file=video_filename)
+    
+    except Exception as e:
+        log.exception("Video could not be finalized")
+        operation_data['status'] = 'error'
+        operation_data['error'] = str(e)
+        await notify_operation(operation_id, 'error')
+    
+    finally:
+        video_scheduler.release(operation_id)
+
+# Single background task refreshing every pending operation
+operation_poller = OperationPoller(
+    video_operations,
+    refresh=lambda operation: refresh_operation(client, operation, retry=False),
+    on_done=finalize_video_operation,
+)
+
+def video_status_payload(operation_id: str, operation_data: Optional[dict] = None) -> dict:
+    """Build the status response for an operation (from the in-memory registry by default)"""
+    if operation_data is None:
+        operation_data = video_operations[operation_id]
+    
+    # Handle long video operations differently
+    if operation_data.get('type') == 'long_video':
+        segments = operation_data.get('segments', [])
+        if operation_data.get('mode') == 'storyboard':
+            message = f"Storyboard: {len(operation_data.get('completed_segments', []))}/{len(segments)} shots done"
+            positions = [video_scheduler.position(storyboard_job_id(operation_id, index)) for index in range(len(segments))]
+            queue_position = min((p for p in positions if p is not None), default=None)
+        else:
+            message = f"Long video generation: segment {operation_data.get('current_segment', 0) + 1}/{len(segments)}"
+            queue_position = video_scheduler.position(operation_id)
+        # Return progress for long video generation
+        return {
+            "status": operation_data['status'],
+            "operation_id": operation_id,
+            "message": message,
+            "mode": operation_data.get('mode', 'extend'),
+            "progress_percentage": operation_data.get('progress_percentage', 0),
+            "segments": operation_data.get('segments', []),
+            "completed_segments": operation_data.get('completed_segments', []),
+            "elapsed_seconds": time.time() - operation_data['created_at'],
+            "video_url": f"/outputs/{os.path.basename(operation_data['video_path'])}" if operation_data.get('video_path') else None,
+            "video_path": operation_data.get('video_path'),
+            "prompt": operation_data['prompt'],
+            "total_duration": operation_data.get('total_duration', 0),
+            "queue_position": queue_position,
+            "error": operation_data.get('error'),
+            "failed_segment": operation_data.get('failed_segment'),
+            "resumable": operation_data['status'] == 'error'
         }
-        
-        # Update session if provided
-        if request.session_id and request.session_id in sessions:
-            sessions[request.session_id]['last_used'] = time.time()
-        
-        print(f"Video generation started with operation_id: {operation_id}")
-        
+    
+    if operation_data['status'] == 'queued':
+        position = video_scheduler.position(operation_id)
         return {
+            "status": "queued",
             "operation_id": operation_id,
-            "status": "pending",
-            "message": "Video generation started. Poll for status updates."
+            "message": f"Waiting for a generation slot (position {position})" if position else "Waiting for a generation slot",
+            "queue_position": position,
+            "elapsed_seconds": time.time() - operation_data['created_at']
         }
     
-    except Exception as e:
-        print(f"Error starting video generation: {e}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Failed to start video generation: {str(e)}")
-
-@app.post("/api/video_chat/status")
-async def check_video_status(request: VideoOperationRequest):
-    """
-    Check the status of a video generation operation.
-    Returns video URL when ready.
-    """
-    if not client:
-        raise HTTPException(status_code=500, detail="Gemini client not initialized.")
+    if operation_data['status'] == 'completed':
+        return {
+            "status": "completed",
+            "operation_id": operation_id,
+            "video_url": f"/outputs/{os.path.basename(operation_data['video_path'])}",
+            "video_path": operation_data['video_path'],
+            "prompt": operation_data['prompt'],
+            "duration": operation_data.get('completed_at', time.time()) - operation_data['created_at']
+        }
     
-    try:
-        operation_id = request.operation_id
-        
-        if operation_id not in video_operations:
-            raise HTTPException(status_code=404, detail="Operation not found")
-        
-        operation_data = video_operations[operation_id]
+    if operation_data['status'] == 'error':
+        return {
+            "status": "error",
+            "operation_id": operation_id,
+            "message": f"Error processing video: {operation_data.get('error', 'Unknown error')}",
+            "elapsed_seconds": time.time() - operation_data['created_at']
+        }
+    
+    # Still processing
+    return {
+        "status": "processing",
+        "operation_id": operation_id,
+        "message": "Video generation in progress...",
+        "elapsed_seconds": time.time() - operation_data['created_at'],
+        "last_checked_seconds_ago": time.time() - operation_data['last_polled_at'] if operation_data.get('last_polled_at') else None
+    }
+
+async def resume_video_operations():
+    """Re-attach to upstream jobs left unfinished by a previous (dead) worker, from the journal"""
+    for record in await operation_journal.claim_unfinished():
+        operation_id = record.pop('operation_id')
+        upstream_name = record.pop('upstream_operation', None)
         
-        # Handle long video operations differently
-        if operation_data.get('type') == 'long_video':
-            # Return progress for long video generation
-            return {
-                "status": operation_data['status'],
-                "operation_id": operation_id,
-                "message": f"Long video generation: segment {operation_data.get('current_segment', 0) + 1}/{len(operation_data.get('segments', []))}",
-                "progress_percentage": operation_data.get('progress_percentage', 0),
-                "segments": operation_data.get('segments', []),
-                "completed_segments": operation_data.get('completed_segments', []),
-                "elapsed_seconds": time.time() - operation_data['created_at'],
-                "video_url": f"/outputs/{os.path.basename(operation_data['video_path'])}" if operation_data.get('video_path') else None,
-                "video_path": operation_data.get('video_path'),
-                "prompt": operation_data['prompt'],
-                "total_duration": operation_data.get('total_duration', 0)
-            }
+        if record.get('type') == 'long_video' and record.get('mode') == 'storyboard':
+            video_operations[operation_id] = record
+            spawn(process_storyboard_generation(
+                operation_id,
+                LongVideoGenerationRequest(**record['params']),
+                record['segments'],
+                pending_operations={
+                    int(index): types.GenerateVideosOperation(name=name)
+                    for index, name in record.get('shot_operations', {}).items()
+                },
+            ))
+            log.info("Storyboard resumed after restart", operation_id=operation_id,
+                     shots_done=len(record.get('checkpoints', [])), segments=len(record['segments']))
         
-        operation = operation_data['operation']
+        elif record.get('type') == 'long_video':
+            segment_operation = record.get('segment_operation')
+            start_segment, current_video = long_video_resume_point(record)
+            video_operations[operation_id] = record
+            spawn(process_long_video_generation(
+                operation_id,
+                LongVideoGenerationRequest(**record['params']),
+                record['segments'],
+                start_segment=start_segment,
+                current_video=current_video,
+                pending_operation=types.GenerateVideosOperation(name=segment_operation) if segment_operation else None,
+            ))
+            log.info("Long video resumed after restart", operation_id=operation_id, start_segment=start_segment)
         
-        # Refresh operation status
-        operation = client.operations.get(operation)
+        elif upstream_name:
+            # The poller picks it up again; 'finalizing' jobs are simply re-downloaded
+            record['operation'] = types.GenerateVideosOperation(name=upstream_name)
+            record['status'] = 'pending'
+            for digest in record.get('input_digests', []):
+                upload_store.acquire(digest)
+            video_operations[operation_id] = record
+            video_scheduler.adopt(operation_id, record.get('params', {}).get('session_id'))
+            operation_poller.watch(operation_id)
+            log.info("Video polling resumed after restart", operation_id=operation_id)
         
-        if operation.done:
-            # Check if we already processed this video
-            if video_operations[operation_id]['status'] == 'completed':
-                # Already processed, return existing data
-                return {
-                    "status": "completed",
-                    "operation_id": operation_id,
-                    "video_url": f"/outputs/{os.path.basename(video_operations[operation_id]['video_path'])}",
-                    "video_path": video_operations[operation_id]['video_path'],
-                    "prompt": operation_data['prompt'],
-                    "duration": video_operations[operation_id].get('completed_at', time.time()) - operation_data['created_at']
-                }
-            
-            # Video is ready - download only once
+        elif record.get('status') == 'queued' and record.get('params'):
+            # Never submitted: rebuild the job from its stored inputs and queue it again
+            params = dict(record['params'])
+            for digest in record.get('input_digests', []):
+                upload_store.acquire(digest)
+            video_operations[operation_id] = record
             try:
-                generated_video = operation.response.generated_videos[0]
-                
-                # Download video
-                video_file = client.files.download(file=generated_video.video)
-                
-                # Save video to outputs directory
-                video_filename = f"gen_video_{uuid.uuid4()}.mp4"
-                video_path = os.path.join(OUTPUT_DIR, video_filename)
-                
-                # Write video file
-                with open(video_path, 'wb') as f:
-                    f.write(video_file.read() if hasattr(video_file, 'read') else video_file)
-                
-                # Update operation status
-                video_operations[operation_id]['status'] = 'completed'
-                video_operations[operation_id]['video_path'] = video_path
-                video_operations[operation_id]['completed_at'] = time.time()
-                
-                print(f"Video generation completed: {video_filename}")
-                
-                return {
-                    "status": "completed",
-                    "operation_id": operation_id,
-                    "video_url": f"/outputs/{video_filename}",
-                    "video_path": video_path,
-                    "prompt": operation_data['prompt'],
-                    "duration": time.time() - operation_data['created_at']
-                }
-            
+                images = [await run_blocking(load_input_image, path) for path in params.get('input_paths', [])]
             except Exception as e:
-                print(f"Error processing completed video: {e}")
-                video_operations[operation_id]['status'] = 'error'
-                video_operations[operation_id]['error'] = str(e)
-                raise HTTPException(status_code=500, detail=f"Error processing video: {str(e)}")
-        
-        else:
-            # Still processing
-            return {
-                "status": "processing",
-                "operation_id": operation_id,
-                "message": "Video generation in progress...",
-                "elapsed_seconds": time.time() - operation_data['created_at']
-            }
+                record['status'] = 'error'
+                record['error'] = f"Input images are no longer available: {e}"
+                await notify_operation(operation_id, 'error')
+                continue
+            spec = VideoJobSpec(images=images, **params)
+            admission = video_scheduler.enqueue(operation_id, spec.session_id, INTERACTIVE)
+            spawn(run_queued_video_job(operation_id, spec, admission))
+            log.info("Video re-queued after restart", operation_id=operation_id)
+
+@app.post("/api/video_chat/status")
+async def check_video_status(request: VideoOperationRequest):
+    """
+    Check the status of a video generation operation.
+    Returns video URL when ready. Pure in-memory read - the background
+    operation poller keeps video_operations up to date. Operations owned
+    by another worker are read from the journal.
+    """
+    if request.operation_id not in video_operations:
+        record = await operation_journal.load(request.operation_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail="Operation not found")
+        return video_status_payload(request.operation_id, record)
     
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"Error checking video status: {e}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Failed to check status: {str(e)}")
+    return video_status_payload(request.operation_id)
+
+@app.get("/api/video_chat/events/{operation_id}")
+async def video_operation_events(operation_id: str):
+    """
+    Server-Sent Events stream of an operation's state transitions
+    (pending, processing, per-segment progress, completed, error).
+    Sends the current state first and closes once the operation finishes.
+    Operations owned by another worker are followed through the journal.
+    """
+    if operation_id in video_operations:
+        stream = stream_operation_events(operation_events, operation_id, lambda: video_status_payload(operation_id))
+    elif await operation_journal.load(operation_id) is not None:
+        stream = poll_operation_events(
+            lambda: operation_journal.load(operation_id),
+            lambda record: video_status_payload(operation_id, record),
+        )
+    else:
+        raise HTTPException(status_code=404, detail="Operation not found")
+    
+    return StreamingResponse(
+        stream,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.post("/api/video_chat/generate_with_images")
 async def generate_video_with_images(
@@ -882,122 +1586,23 @@ async def generate_video_with_images(
         raise HTTPException(status_code=500, detail="Gemini client not initialized.")
     
     try:
-        # Validate number of images
-        if len(image_files) == 0:
-            raise ValueError("At least one image is required")
-        if len(image_files) > 3:
-            raise ValueError("Maximum 3 images allowed for reference generation")
-        
-        # Process uploaded images
-        images = []
-        input_paths = []
-        
-        for i, image_file in enumerate(image_files):
-            file_content = await image_file.read()
-            image = Image.open(io.BytesIO(file_content))
-            images.append(image)
-            
-            # Save input image
-            input_filename = f"input_{i}_{uuid.uuid4()}.png"
-            input_path = os.path.join(UPLOAD_DIR, input_filename)
-            image.save(input_path)
-            input_paths.append(input_path)
-        
-        # Validate parameters
-        valid_aspect_ratios = ["16:9", "9:16"]
-        valid_resolutions = ["720p", "1080p"]
-        valid_durations = ["4", "6", "8"]
-        valid_generation_types = ["reference", "first_frame", "interpolation"]
-        
-        if aspect_ratio not in valid_aspect_ratios:
-            raise ValueError(f"Invalid aspect_ratio. Must be one of {valid_aspect_ratios}")
-        if resolution not in valid_resolutions:
-            raise ValueError(f"Invalid resolution. Must be one of {valid_resolutions}")
-        if duration not in valid_durations:
-            raise ValueError(f"Invalid duration. Must be one of {valid_durations}")
-        if generation_type not in valid_generation_types:
-            raise ValueError(f"Invalid generation_type. Must be one of {valid_generation_types}")
-        
-        # Build config
-        config = types.GenerateVideosConfig(
+        if generation_type == "text":
+            raise InvalidVideoJob("At least one image is required")
+        images, input_paths, input_digests = await read_input_images(image_files)
+        return await start_video_job(VideoJobSpec(
+            prompt=prompt,
+            generation_type=generation_type,
+            images=images,
             aspect_ratio=aspect_ratio,
             resolution=resolution,
-            duration_seconds=duration,
-        )
-        
-        if negative_prompt:
-            config.negative_prompt = negative_prompt
-        
-        print(f"Starting {generation_type} video generation with {len(images)} images...")
-        
-        # Generate video based on type
-        if generation_type == "reference" and len(images) <= 3:
-            # Reference images mode (up to 3 images)
-            reference_images = []
-            for image in images:
-                reference_images.append(types.VideoGenerationReferenceImage(
-                    image=image,
-                    reference_type="asset"
-                ))
-            
-            config.reference_images = reference_images
-            
-            operation = client.models.generate_videos(
-                model="veo-3.1-generate-preview",
-                prompt=prompt,
-                config=config,
-            )
-            
-        elif generation_type == "first_frame" and len(images) == 1:
-            # Single image as first frame
-            operation = client.models.generate_videos(
-                model="veo-3.1-generate-preview",
-                prompt=prompt,
-                image=images[0],
-                config=config,
-            )
-            
-        elif generation_type == "interpolation" and len(images) == 2:
-            # First and last frame interpolation
-            config.last_frame = images[1]
-            
-            operation = client.models.generate_videos(
-                model="veo-3.1-generate-preview",
-                prompt=prompt,
-                image=images[0],  # First frame
-                config=config,
-            )
-            
-        else:
-            raise ValueError(f"Invalid combination: {generation_type} with {len(images)} images")
-        
-        # Store operation for polling
-        operation_id = str(uuid.uuid4())
-        video_operations[operation_id] = {
-            'operation': operation,
-            'created_at': time.time(),
-            'prompt': prompt,
-            'input_images': input_paths,
-            'generation_type': generation_type,
-            'status': 'pending'
-        }
-        
-        if session_id and session_id in sessions:
-            sessions[session_id]['last_used'] = time.time()
-        
-        print(f"{generation_type} video generation started with operation_id: {operation_id}")
-        
-        return {
-            "operation_id": operation_id,
-            "status": "pending",
-            "message": f"{generation_type} video generation started. Poll for status updates."
-        }
-    
+            duration=duration,
+            negative_prompt=negative_prompt,
+            session_id=session_id,
+            input_paths=input_paths,
+            input_digests=input_digests,
+        ))
     except Exception as e:
-        print(f"Error starting image-to-video generation: {e}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Failed to start video generation: {str(e)}")
+        raise video_job_error(e)
 
 @app.get("/api/video_chat/operations")
 async def list_video_operations():
@@ -1016,32 +1621,104 @@ async def list_video_operations():
         ]
     }
 
-def cleanup_old_video_operations():
-    """Remove video operations older than 2 hours"""
-    current_time = time.time()
-    expired_operations = [
-        op_id for op_id, data in video_operations.items()
-        if current_time - data.get('created_at', 0) > 7200  # 2 hours
-    ]
-    
-    for op_id in expired_operations:
-        # Clean up video file if it exists
-        if 'video_path' in video_operations[op_id]:
-            video_path = video_operations[op_id]['video_path']
-            try:
-                if os.path.exists(video_path):
-                    os.remove(video_path)
-                    print(f"Cleaned up video file: {video_path}")
-            except Exception as e:
-                print(f"Error cleaning up video file {video_path}: {e}")
+def remove_file(path: str) -> bool:
+    """Delete a file if it exists (run via run_blocking)"""
+    if os.path.exists(path):
+        os.remove(path)
+        return True
+    return False
+
+async def remove_operation_files(operation_id: str, data: dict):
+    """Delete an operation's video file and any long video segment checkpoints"""
+    video_paths = {checkpoint['video_path'] for checkpoint in data.get('checkpoints', []) if checkpoint.get('video_path')}
+    if data.get('video_path'):
+        video_paths.add(data['video_path'])
+    for video_path in video_paths:
+        try:
+            if await run_blocking(remove_file, video_path):
+                log.debug("Video file removed", operation_id=operation_id, file=os.path.basename(video_path))
+        except Exception as e:
+            log.warning("Video file could not be removed", operation_id=operation_id, file=video_path, error=str(e))
+
+async def cleanup_old_video_operations():
+    """Remove video operations finished more than 2 hours ago (run by the reaper)"""
+    for op_id, data in video_operations.pop_expired():
+        # Frees the scheduler slot (or queue place) of jobs that never finished
+        video_scheduler.cancel(op_id)
+        if data.get('mode') == 'storyboard':
+            for index in range(len(data.get('segments', []))):
+                video_scheduler.cancel(storyboard_job_id(op_id, index))
         
-        del video_operations[op_id]
-        print(f"Cleaned up expired video operation: {op_id}")
+        # Input images may now be evicted from the upload store
+        for digest in data.get('input_digests', []):
+            await run_blocking(upload_store.release, digest)
+        
+        await remove_operation_files(op_id, data)
+        await operation_journal.delete(op_id)
+        log.info("Expired video operation removed", operation_id=op_id)
+    
+    # Finished operations of earlier processes are only in the journal
+    for record in await operation_journal.expire_finished(time.time() - VIDEO_OPERATION_TTL):
+        op_id = record.pop('operation_id')
+        if op_id in video_operations:
+            continue  # still served here, removed with the registry entry
+        await remove_operation_files(op_id, record)
+        log.info("Expired journaled video operation removed", operation_id=op_id)
+
+async def cleanup_response_cache():
+    """Delete expired response cache entries (run by the reaper)"""
+    removed = await response_cache.expire()
+    if removed:
+        log.info("Expired cached responses removed", count=removed)
+
+async def journal_heartbeat():
+    """Keep this worker's unfinished jobs owned in the journal (run by the reaper)"""
+    await operation_journal.heartbeat()
+
+# Background reaper: keeps both registries bounded without manual calls
+reaper = Reaper()
+reaper.add_job("sessions", cleanup_old_sessions)
+reaper.add_job("video_operations", cleanup_old_video_operations)
+reaper.add_job("journal_heartbeat", journal_heartbeat)
+if response_cache is not None:
+    reaper.add_job("response_cache", cleanup_response_cache)
 
 @app.post("/api/video_chat/cleanup")
 async def cleanup_videos():
-    """Manual cleanup endpoint"""
-    cleanup_old_video_operations()
+    """Manual cleanup endpoint (the background reaper also runs this periodically)"""
+    await reaper.run_once()
     return {"message": "Cleanup completed"}
 
 
+
+# ==================== METRICS ====================
+
+# Samples event loop lag in the background (started with the app)
+loop_lag_monitor = LoopLagMonitor()
+
+def video_operation_counts() -> dict:
+    """Video operations by status, for the scrape-time gauge"""
+    counts = {(status,): 0 for status in ('queued', 'pending', 'processing', 'finalizing', 'completed', 'error')}
+    for data in list(video_operations.values()):
+        key = (data.get('status', 'unknown'),)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+registry.gauge("video_operations", "Video operations held by this worker, by status", ["status"],
+               collect=video_operation_counts)
+registry.gauge("video_jobs_running", "Veo jobs holding a scheduler slot", collect=lambda: video_scheduler.running)
+registry.gauge("video_jobs_queued", "Veo jobs waiting for a scheduler slot", collect=lambda: video_scheduler.queued)
+chat_sessions_gauge = registry.gauge("chat_sessions", "Chat sessions in the session store")
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """
+    Prometheus text exposition. Values are per worker process: scrape every
+    worker (or run one) to get the whole picture.
+    """
+    if hasattr(sessions, '__len__'):
+        chat_sessions_gauge.set(len(sessions))
+    else:
+        chat_sessions_gauge.set(len(await sessions.list_sessions()))
+    EVENT_LOOP_LAG_MAX.set(loop_lag_monitor.take_max())
+    return PlainTextResponse(registry.render(), media_type=METRICS_CONTENT_TYPE)
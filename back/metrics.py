@@ -0,0 +1,426 @@
+import os
+import sys
+import time
+import weakref
+import asyncio
+import bisect
+import functools
+import threading
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from logs import get_logger, dropped_records
+
+log = get_logger(__name__)
+
+# Turn instrumentation off entirely (observations become no-ops)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# How often the event loop lag is sampled (seconds)
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+
+# Debug mode: report callbacks that hold the event loop longer than the
+# threshold (seconds), with their stack and the endpoint they belong to
+LOOP_WATCHDOG = os.getenv("LOOP_WATCHDOG", "false").lower() in ("1", "true", "yes")
+LOOP_WATCHDOG_THRESHOLD = float(os.getenv("LOOP_WATCHDOG_THRESHOLD", "0.1"))
+LOOP_WATCHDOG_STACK_DEPTH = int(os.getenv("LOOP_WATCHDOG_STACK_DEPTH", "20"))
+
+# Latency buckets (seconds): sub-ms disk writes up to multi-minute video downloads
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """Base of the metric types: a name, help text and label names, values keyed by label values"""
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()  # observed from worker threads too
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        """(suffix, formatted labels, value) rows of the exposition"""
+        return []
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{self.name}{suffix}{labels} {_format_value(value)}" for suffix, labels, value in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [("", _format_labels(self.label_names, key), value) for key, value in items]
+
+
+class Gauge(Metric):
+    """
+    Current value. Either set() by the code, or computed at scrape time by
+    `collect`, which returns a number (no labels) or {label values: number}.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 collect: Optional[Callable[[], Union[float, Dict[LabelValues, float]]]] = None):
+        super().__init__(name, help, labels)
+        self.collect = collect
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        if self.collect is not None:
+            collected = self.collect()
+            values = collected if isinstance(collected, dict) else {(): collected}
+            items = sorted((tuple(str(v) for v in key), value) for key, value in values.items())
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [("", _format_labels(self.label_names, key), value) for key, value in items]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[LabelValues, List[int]] = {}  # per bucket (not cumulative), plus +Inf
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+
+    def samples(self):
+        rows = []
+        with self._lock:
+            items = sorted((key, list(counts), self._sums[key]) for key, counts in self._counts.items())
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                rows.append(("_bucket", _format_labels(self.label_names, key, f'le="{_format_value(bound)}"'), cumulative))
+            rows.append(("_sum", _format_labels(self.label_names, key), total))
+            rows.append(("_count", _format_labels(self.label_names, key), cumulative))
+        return rows
+
+
+class Registry:
+    """Metrics of this worker, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = (), collect=None) -> Gauge:
+        return self.register(Gauge(name, help, labels, collect))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        blocks = []
+        for metric in self.metrics.values():
+            try:
+                blocks.append(metric.render())
+            except Exception as e:
+                # One broken collector must not take the whole scrape down
+                blocks.append(f"# {metric.name} unavailable: {e}")
+        return "\n".join(blocks) + "\n"
+
+
+registry = Registry()
+
+# Upstream (per attempt, so retries show up as separate observations)
+GEMINI_CALL_SECONDS = registry.histogram(
+    "gemini_call_duration_seconds", "Latency of one Gemini SDK call attempt", ["call", "outcome"])
+GEMINI_RETRIES = registry.counter("gemini_retries_total", "Gemini calls retried", ["call"])
+GEMINI_THROTTLED_SECONDS = registry.counter(
+    "gemini_throttled_seconds_total", "Time spent waiting on client-side rate limits", ["call"])
+
+# Local work on the request path
+IMAGE_SECONDS = registry.histogram(
+    "image_processing_duration_seconds", "Image decode/resize/encode time", ["step"])
+FILE_WRITE_SECONDS = registry.histogram(
+    "file_write_duration_seconds", "Time to write a file to disk", ["kind"])
+FILE_WRITE_BYTES = registry.counter("file_write_bytes_total", "Bytes written to disk", ["kind"])
+HTTP_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "Time to response headers per route", ["method", "route", "status"])
+
+# Chat response cache (hit rate = memory + disk over all lookups)
+RESPONSE_CACHE_LOOKUPS = registry.counter(
+    "response_cache_lookups_total", "Chat response cache lookups by result (memory, disk, miss, bypass)", ["result"])
+
+# Event loop health
+EVENT_LOOP_LAG = registry.gauge("event_loop_lag_seconds", "Latest event loop scheduling delay")
+EVENT_LOOP_LAG_MAX = registry.gauge("event_loop_lag_max_seconds", "Worst event loop scheduling delay since the last scrape")
+EVENT_LOOP_LAG_SECONDS = registry.histogram(
+    "event_loop_lag_distribution_seconds", "Event loop scheduling delay samples",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+EVENT_LOOP_BLOCKED = registry.counter(
+    "event_loop_blocked_total", "Callbacks that held the event loop past the watchdog threshold", ["endpoint"])
+EVENT_LOOP_BLOCKED_SECONDS = registry.histogram(
+    "event_loop_blocked_duration_seconds", "How long the event loop was held, per watchdog report", ["endpoint"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+
+# Logging pipeline health
+LOG_RECORDS_DROPPED = registry.gauge(
+    "log_records_dropped", "Log records dropped because the writer thread fell behind", collect=dropped_records)
+
+
+def timed(histogram: Histogram, **labels):
+    """Decorator observing the duration of each call of a (sync) function"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class LoopLagMonitor:
+    """
+    Background task measuring how late the event loop wakes up a sleeping
+    task. Anything above a few ms means a callback is blocking the loop.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._max = 0.0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def take_max(self) -> float:
+        """Worst lag since the previous call (read on scrape)"""
+        worst, self._max = self._max, 0.0
+        return worst
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self._max = max(self._max, lag)
+            EVENT_LOOP_LAG.set(lag)
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+
+
+class LoopWatchdog:
+    """
+    Blocking-call detector (opt-in, LOOP_WATCHDOG=true). A thread pings the
+    event loop every threshold/2; a ping left unanswered for `threshold` means
+    a callback is holding the loop, so the loop thread's stack is captured
+    right then, together with the request route (or background task) it runs
+    for. The report is printed once the loop is free again, with the total
+    time, and counted in event_loop_blocked_total.
+    """
+
+    def __init__(self, threshold: float = LOOP_WATCHDOG_THRESHOLD, enabled: bool = LOOP_WATCHDOG):
+        self.threshold = threshold
+        self.enabled = enabled
+        self.reports: deque = deque(maxlen=50)
+        self._scopes: "weakref.WeakKeyDictionary[asyncio.Task, dict]" = weakref.WeakKeyDictionary()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        log.info("Event loop watchdog on", threshold_ms=round(self.threshold * 1000))
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+    def track_request(self, scope: dict):
+        """Remember which request the current task serves (called by the middleware)"""
+        if self._thread is not None:
+            task = asyncio.current_task()
+            if task is not None:
+                self._scopes[task] = scope
+
+    def _run(self):
+        answered = threading.Event()
+        while not self._stopped.is_set():
+            answered.clear()
+            sent = time.monotonic()
+            try:
+                self._loop.call_soon_threadsafe(answered.set)
+            except RuntimeError:
+                return  # loop closed
+            if not answered.wait(self.threshold):
+                endpoint, label, stack = self._capture()
+                while not answered.wait(self.threshold) and not self._stopped.is_set():
+                    pass
+                self._report(time.monotonic() - sent, endpoint, label, stack)
+            self._stopped.wait(self.threshold / 2)
+
+    def _capture(self) -> Tuple[str, str, str]:
+        """(endpoint for the log, bounded metric label, stack) of what the loop runs right now"""
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = "".join(traceback.format_stack(frame, limit=LOOP_WATCHDOG_STACK_DEPTH)) if frame else ""
+        task = asyncio.current_task(self._loop)
+        if task is None:
+            return "callback", "callback", stack
+        scope = self._scopes.get(task)
+        if scope is not None:
+            route = getattr(scope.get("route"), "path", None)
+            endpoint = f"{scope.get('method')} {scope.get('path')}"
+            return endpoint, f"{scope.get('method')} {route or 'unmatched'}", stack
+        coro = task.get_coro()
+        name = f"task {getattr(coro, '__qualname__', task.get_name())}"
+        return name, name, stack
+
+    def _report(self, duration: float, endpoint: str, label: str, stack: str):
+        self.reports.append({'duration': duration, 'endpoint': endpoint, 'stack': stack, 'at': time.time()})
+        EVENT_LOOP_BLOCKED.inc(endpoint=label)
+        EVENT_LOOP_BLOCKED_SECONDS.observe(duration, endpoint=label)
+        log.warning("Event loop blocked", blocked_ms=round(duration * 1000), endpoint=endpoint, stack=stack)
+
+
+# Process-wide watchdog (started with the app when LOOP_WATCHDOG is on)
+loop_watchdog = LoopWatchdog()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request up to its response headers,
+    labelled by route template (not raw path, which would explode the label
+    set). Streaming bodies (SSE, chat streams) are not included. Also tells
+    the loop watchdog which request each task serves.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            loop_watchdog.track_request(scope)
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        responded = False
+
+        async def timed_send(message):
+            nonlocal responded
+            if message["type"] == "http.response.start" and not responded:
+                responded = True
+                self._observe(scope, message["status"], started)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        except Exception:
+            if not responded:
+                self._observe(scope, 500, started)
+            raise
+
+    @staticmethod
+    def _observe(scope, status: int, started: float):
+        route = scope.get("route")
+        HTTP_SECONDS.observe(time.perf_counter() - started, method=scope["method"],
+                             route=getattr(route, "path", "unmatched"), status=status)
@@ -0,0 +1,421 @@
+import os
+import shutil
+import struct
+import tempfile
+import subprocess
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+# How clips are joined: "ffmpeg" (concat demuxer), "python" (box-level
+# concatenation below) or "auto" (ffmpeg when installed). Both copy the
+# encoded samples as they are, nothing is re-encoded.
+VIDEO_CONCAT = os.getenv("VIDEO_CONCAT", "auto").lower()
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+FFMPEG_TIMEOUT = float(os.getenv("FFMPEG_TIMEOUT", "300"))
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Boxes whose payload is a list of boxes (the path down to the sample tables)
+CONTAINER_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+
+class Box:
+    """An MP4 box: either raw payload bytes or a list of child boxes"""
+
+    def __init__(self, kind: bytes, payload: bytes = b"", children: Optional[List["Box"]] = None):
+        self.kind = kind
+        self.payload = payload
+        self.children = children
+
+    def child(self, kind: bytes) -> Optional["Box"]:
+        return next((box for box in self.children or [] if box.kind == kind), None)
+
+    def to_bytes(self) -> bytes:
+        payload = b"".join(box.to_bytes() for box in self.children) if self.children is not None else self.payload
+        if len(payload) + 8 > 0xFFFFFFFF:
+            return struct.pack(">I4sQ", 1, self.kind, len(payload) + 16) + payload
+        return struct.pack(">I4s", len(payload) + 8, self.kind) + payload
+
+
+def parse_boxes(data: bytes) -> List[Box]:
+    boxes = []
+    pos = 0
+    while pos + 8 <= len(data):
+        size, kind = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = len(data) - pos
+        payload = data[pos + header:pos + size]
+        if kind in CONTAINER_BOXES:
+            boxes.append(Box(kind, children=parse_boxes(payload)))
+        else:
+            boxes.append(Box(kind, payload))
+        pos += size
+    return boxes
+
+
+def top_level_boxes(f: BinaryIO) -> List[Tuple[bytes, int, int, int]]:
+    """(type, offset, header size, total size) of each top-level box, without reading payloads"""
+    f.seek(0, os.SEEK_END)
+    end = f.tell()
+    boxes = []
+    pos = 0
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            raise ValueError(f"Corrupt MP4: bad {kind!r} box size at {pos}")
+        boxes.append((kind, pos, header, size))
+        pos += size
+    return boxes
+
+
+def full_box(payload: bytes) -> Tuple[int, bytes]:
+    """(version, payload after version and flags)"""
+    return payload[0], payload[4:]
+
+
+@dataclass
+class Track:
+    """Sample tables of one track, expanded per sample and per chunk"""
+    handler: bytes
+    timescale: int
+    descriptions: List[bytes]  # raw sample entries (stsd)
+    chunks: List[Tuple[int, List[int], int]]  # (file offset, sample sizes, description index)
+    deltas: List[int]  # decode duration of each sample
+    composition_offsets: Optional[List[int]] = None  # ctts, per sample
+    sync_samples: Optional[List[int]] = None  # 1-based sample numbers (stss); None = all
+
+
+def read_track(trak: Box) -> Track:
+    mdia = trak.child(b"mdia")
+    stbl = mdia.child(b"minf").child(b"stbl")
+
+    version, body = full_box(mdia.child(b"mdhd").payload)
+    timescale = struct.unpack_from(">I", body, 16 if version == 1 else 8)[0]
+    handler = full_box(mdia.child(b"hdlr").payload)[1][4:8]
+
+    _, body = full_box(stbl.child(b"stsd").payload)
+    descriptions = [box.to_bytes() for box in parse_boxes(body[4:])]
+
+    _, body = full_box(stbl.child(b"stts").payload)
+    deltas = []
+    for i in range(struct.unpack_from(">I", body)[0]):
+        count, delta = struct.unpack_from(">II", body, 4 + 8 * i)
+        deltas.extend([delta] * count)
+
+    if stbl.child(b"stz2") is not None:
+        raise ValueError("Compact sample sizes (stz2) are not supported")
+    _, body = full_box(stbl.child(b"stsz").payload)
+    uniform, count = struct.unpack_from(">II", body)
+    sizes = [uniform] * count if uniform else list(struct.unpack_from(f">{count}I", body, 8))
+
+    stco = stbl.child(b"stco")
+    if stco is not None:
+        _, body = full_box(stco.payload)
+        count = struct.unpack_from(">I", body)[0]
+        offsets = list(struct.unpack_from(f">{count}I", body, 4))
+    else:
+        _, body = full_box(stbl.child(b"co64").payload)
+        count = struct.unpack_from(">I", body)[0]
+        offsets = list(struct.unpack_from(f">{count}Q", body, 4))
+
+    _, body = full_box(stbl.child(b"stsc").payload)
+    runs = [struct.unpack_from(">III", body, 4 + 12 * i) for i in range(struct.unpack_from(">I", body)[0])]
+    chunks = []
+    sample = 0
+    for i, (first_chunk, per_chunk, description) in enumerate(runs):
+        last_chunk = runs[i + 1][0] - 1 if i + 1 < len(runs) else len(offsets)
+        for chunk in range(first_chunk, last_chunk + 1):
+            chunks.append((offsets[chunk - 1], sizes[sample:sample + per_chunk], description))
+            sample += per_chunk
+    if sample != len(sizes) or len(deltas) != len(sizes):
+        raise ValueError("Corrupt MP4: sample tables disagree")
+
+    composition_offsets = None
+    ctts = stbl.child(b"ctts")
+    if ctts is not None:
+        version, body = full_box(ctts.payload)
+        composition_offsets = []
+        for i in range(struct.unpack_from(">I", body)[0]):
+            count, offset = struct.unpack_from(">Ii" if version == 1 else ">II", body, 4 + 8 * i)
+            composition_offsets.extend([offset] * count)
+
+    sync_samples = None
+    stss = stbl.child(b"stss")
+    if stss is not None:
+        _, body = full_box(stss.payload)
+        count = struct.unpack_from(">I", body)[0]
+        sync_samples = list(struct.unpack_from(f">{count}I", body, 4))
+
+    return Track(handler, timescale, descriptions, chunks, deltas, composition_offsets, sync_samples)
+
+
+def read_movie(path: str) -> Tuple[bytes, Box, List[Track]]:
+    """(raw ftyp box, moov tree, tracks) of a progressive MP4 file"""
+    with open(path, "rb") as f:
+        boxes = top_level_boxes(f)
+        found = {kind: (offset, size) for kind, offset, _, size in boxes}
+        if b"moov" not in found:
+            raise ValueError(f"{os.path.basename(path)}: no moov box")
+        if b"moof" in found:
+            raise ValueError(f"{os.path.basename(path)}: fragmented MP4 is not supported")
+        ftyp = b""
+        if b"ftyp" in found:
+            f.seek(found[b"ftyp"][0])
+            ftyp = f.read(found[b"ftyp"][1])
+        f.seek(found[b"moov"][0])
+        moov = parse_boxes(f.read(found[b"moov"][1]))[0]
+    tracks = [read_track(trak) for trak in moov.children if trak.kind == b"trak"]
+    return ftyp, moov, tracks
+
+
+def run_length(values: List[int]) -> List[Tuple[int, int]]:
+    """[(count, value)] runs of equal consecutive values"""
+    runs: List[List[int]] = []
+    for value in values:
+        if runs and runs[-1][1] == value:
+            runs[-1][0] += 1
+        else:
+            runs.append([1, value])
+    return [(count, value) for count, value in runs]
+
+
+def full_box_payload(version: int, body: bytes) -> bytes:
+    return struct.pack(">B3x", version) + body
+
+
+def set_duration(box: Box, duration: int, offsets: Tuple[int, int]):
+    """Patch the duration field of an mvhd/tkhd/mdhd box (offset for version 0, version 1)"""
+    version = box.payload[0]
+    payload = bytearray(box.payload)
+    if version == 1:
+        struct.pack_into(">Q", payload, offsets[1], duration)
+    else:
+        if duration > 0xFFFFFFFF:
+            raise ValueError("Joined video is too long for a version 0 header")
+        struct.pack_into(">I", payload, offsets[0], duration)
+    box.payload = bytes(payload)
+
+
+# Offset of the duration field in each header (including version and flags)
+MVHD_DURATION = (16, 24)
+TKHD_DURATION = (20, 28)
+MDHD_DURATION = (16, 24)
+
+
+def sample_table(descriptions: List[bytes], chunks: List[Tuple[int, List[int], int]], deltas: List[int],
+                 composition_offsets: Optional[List[int]], sync_samples: Optional[List[int]],
+                 co64: bool) -> Box:
+    sizes = [size for _, chunk_sizes, _ in chunks for size in chunk_sizes]
+    stts = run_length(deltas)
+    children = [
+        Box(b"stsd", full_box_payload(0, struct.pack(">I", len(descriptions)) + b"".join(descriptions))),
+        Box(b"stts", full_box_payload(0, struct.pack(">I", len(stts)) + b"".join(struct.pack(">II", c, d) for c, d in stts))),
+    ]
+    if composition_offsets is not None:
+        ctts = run_length(composition_offsets)
+        signed = any(offset < 0 for offset in composition_offsets)
+        entry = ">Ii" if signed else ">II"
+        children.append(Box(b"ctts", full_box_payload(1 if signed else 0, struct.pack(">I", len(ctts)) + b"".join(struct.pack(entry, c, o) for c, o in ctts))))
+    if sync_samples is not None:
+        children.append(Box(b"stss", full_box_payload(0, struct.pack(f">I{len(sync_samples)}I", len(sync_samples), *sync_samples))))
+    if sizes and all(size == sizes[0] for size in sizes):
+        children.append(Box(b"stsz", full_box_payload(0, struct.pack(">II", sizes[0], len(sizes)))))
+    else:
+        children.append(Box(b"stsz", full_box_payload(0, struct.pack(f">II{len(sizes)}I", 0, len(sizes), *sizes))))
+    stsc = []
+    for index, (_, chunk_sizes, description) in enumerate(chunks, 1):
+        if not stsc or stsc[-1][1:] != (len(chunk_sizes), description):
+            stsc.append((index, len(chunk_sizes), description))
+    children.append(Box(b"stsc", full_box_payload(0, struct.pack(">I", len(stsc)) + b"".join(struct.pack(">III", *run) for run in stsc))))
+    offsets = [offset for offset, _, _ in chunks]
+    if co64:
+        children.append(Box(b"co64", full_box_payload(0, struct.pack(f">I{len(offsets)}Q", len(offsets), *offsets))))
+    else:
+        children.append(Box(b"stco", full_box_payload(0, struct.pack(f">I{len(offsets)}I", len(offsets), *offsets))))
+    return Box(b"stbl", children=children)
+
+
+def concat_mp4(paths: List[str], output_path: str) -> str:
+    """
+    Join MP4 clips with the same track layout (e.g. Veo shots) into one file
+    without re-encoding: the sample tables are concatenated, the encoded
+    samples are copied into a single mdat, and moov is written first (fast
+    start). Clips whose codec settings differ get their own sample entry.
+    Edit lists are dropped, so per-clip priming offsets (a few ms) are not
+    trimmed.
+    """
+    if not paths:
+        raise ValueError("Nothing to concatenate")
+    movies = [read_movie(path) for path in paths]
+    ftyp, moov, first_tracks = movies[0]
+    handlers = [track.handler for track in first_tracks]
+    for path, (_, _, tracks) in zip(paths, movies):
+        if [track.handler for track in tracks] != handlers:
+            raise ValueError(f"{os.path.basename(path)}: track layout differs from the first clip")
+        for track, first in zip(tracks, first_tracks):
+            if track.timescale != first.timescale:
+                raise ValueError(f"{os.path.basename(path)}: {track.handler.decode()} timescale differs from the first clip")
+
+    # Per output track: sample entries, chunks (source offset, sizes, entry), timing
+    merged = []
+    for t in range(len(handlers)):
+        descriptions: List[bytes] = []
+        chunks, deltas, composition, sync = [], [], [], []
+        has_composition = any(movie[2][t].composition_offsets is not None for movie in movies)
+        has_sync = any(movie[2][t].sync_samples is not None for movie in movies)
+        for _, _, tracks in movies:
+            track = tracks[t]
+            remap = {}
+            for index, description in enumerate(track.descriptions, 1):
+                if description not in descriptions:
+                    descriptions.append(description)
+                remap[index] = descriptions.index(description) + 1
+            first_sample = len(deltas)
+            chunks.extend((offset, sizes, remap[description]) for offset, sizes, description in track.chunks)
+            deltas.extend(track.deltas)
+            composition.extend(track.composition_offsets or [0] * len(track.deltas))
+            if track.sync_samples is None:
+                sync.extend(range(first_sample + 1, first_sample + len(track.deltas) + 1))
+            else:
+                sync.extend(first_sample + number for number in track.sync_samples)
+        merged.append((descriptions, chunks, deltas, composition if has_composition else None, sync if has_sync else None))
+
+    # mdat layout: clip by clip, each clip's chunks in their original (interleaved) order
+    placement: Dict[Tuple[int, int], int] = {}  # (track, chunk index) -> offset within mdat data
+    copies = []  # (clip, source offset, length)
+    position = 0
+    for clip, (_, _, tracks) in enumerate(movies):
+        order = []
+        for t, track in enumerate(tracks):
+            first_chunk = sum(len(movie[2][t].chunks) for movie in movies[:clip])
+            order.extend((offset, t, first_chunk + i, sum(sizes)) for i, (offset, sizes, _) in enumerate(track.chunks))
+        for offset, t, chunk, length in sorted(order):
+            placement[(t, chunk)] = position
+            copies.append((clip, offset, length))
+            position += length
+    data_size = position
+
+    def build_moov(data_start: int, co64: bool) -> bytes:
+        version, body = full_box(moov.child(b"mvhd").payload)
+        movie_timescale = struct.unpack_from(">I", body, 16 if version == 1 else 8)[0]
+        children = []
+        movie_duration = 0
+        t = 0
+        for box in moov.children:
+            if box.kind != b"trak":
+                if box.kind != b"mvex":
+                    children.append(Box(box.kind, box.payload, box.children))
+                continue
+            descriptions, chunks, deltas, composition, sync = merged[t]
+            chunks = [(data_start + placement[(t, i)], sizes, description) for i, (_, sizes, description) in enumerate(chunks)]
+            media_duration = sum(deltas)
+            track_duration = round(media_duration * movie_timescale / first_tracks[t].timescale)
+            movie_duration = max(movie_duration, track_duration)
+
+            mdia = box.child(b"mdia")
+            minf = mdia.child(b"minf")
+            mdhd = Box(b"mdhd", mdia.child(b"mdhd").payload)
+            set_duration(mdhd, media_duration, MDHD_DURATION)
+            new_minf = Box(b"minf", children=[
+                sample_table(descriptions, chunks, deltas, composition, sync, co64) if child.kind == b"stbl" else child
+                for child in minf.children
+            ])
+            new_mdia = Box(b"mdia", children=[
+                mdhd if child.kind == b"mdhd" else new_minf if child.kind == b"minf" else child
+                for child in mdia.children
+            ])
+            tkhd = Box(b"tkhd", box.child(b"tkhd").payload)
+            set_duration(tkhd, track_duration, TKHD_DURATION)
+            children.append(Box(b"trak", children=[
+                tkhd if child.kind == b"tkhd" else new_mdia if child.kind == b"mdia" else child
+                for child in box.children if child.kind != b"edts"
+            ]))
+            t += 1
+        for box in children:
+            if box.kind == b"mvhd":
+                set_duration(box, movie_duration, MVHD_DURATION)
+        return Box(b"moov", children=children).to_bytes()
+
+    mdat_header = 8 if data_size + 8 <= 0xFFFFFFFF else 16
+    co64 = len(ftyp) + len(build_moov(0, False)) + mdat_header + data_size > 0xFFFFFFFF
+    moov_size = len(build_moov(0, co64))
+    moov_bytes = build_moov(len(ftyp) + moov_size + mdat_header, co64)
+
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    fd, temp_path = tempfile.mkstemp(dir=output_dir, prefix=f".{os.path.basename(output_path)}.", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(ftyp)
+            out.write(moov_bytes)
+            if mdat_header == 8:
+                out.write(struct.pack(">I4s", data_size + 8, b"mdat"))
+            else:
+                out.write(struct.pack(">I4sQ", 1, b"mdat", data_size + 16))
+            sources = [open(path, "rb") for path in paths]
+            try:
+                for clip, offset, length in copies:
+                    source = sources[clip]
+                    source.seek(offset)
+                    while length > 0:
+                        block = source.read(min(length, COPY_BUFFER_SIZE))
+                        if not block:
+                            raise ValueError(f"{os.path.basename(paths[clip])}: truncated sample data")
+                        out.write(block)
+                        length -= len(block)
+            finally:
+                for source in sources:
+                    source.close()
+        os.replace(temp_path, output_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return output_path
+
+
+def concat_with_ffmpeg(paths: List[str], output_path: str, ffmpeg: str) -> str:
+    """Join clips with ffmpeg's concat demuxer (stream copy, no re-encode)"""
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    list_fd, list_path = tempfile.mkstemp(dir=output_dir, prefix=".concat.", suffix=".txt")
+    temp_path = os.path.join(output_dir, f".{os.path.basename(output_path)}.part.mp4")
+    try:
+        with os.fdopen(list_fd, "w") as f:
+            for path in paths:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        subprocess.run(
+            [ffmpeg, "-hide_banner", "-loglevel", "error", "-y", "-f", "concat", "-safe", "0",
+             "-i", list_path, "-c", "copy", "-movflags", "+faststart", temp_path],
+            check=True, capture_output=True, timeout=FFMPEG_TIMEOUT,
+        )
+        os.replace(temp_path, output_path)
+    finally:
+        for path in (list_path, temp_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return output_path
+
+
+def concat_videos(paths: List[str], output_path: str, method: str = VIDEO_CONCAT) -> str:
+    """Losslessly join MP4 clips in order (blocking; run via run_blocking)"""
+    ffmpeg = shutil.which(FFMPEG_BINARY) if method in ("auto", "ffmpeg") else None
+    if method == "ffmpeg" and ffmpeg is None:
+        raise RuntimeError(f"VIDEO_CONCAT=ffmpeg but {FFMPEG_BINARY!r} was not found")
+    if ffmpeg:
+        return concat_with_ffmpeg(paths, output_path, ffmpeg)
+    return concat_mp4(paths, output_path)
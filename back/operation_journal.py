@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+import uuid
+from typing import List, Optional
+
+from concurrency import run_blocking
+
+# On-disk journal of video operations, so in-flight upstream jobs survive
+# restarts and can be read by every worker
+OPERATION_JOURNAL_PATH = os.getenv("OPERATION_JOURNAL_PATH", "video_operations.db")
+
+# A job owned by another host is taken over when its journal entry has not
+# been updated for this long (same-host owners are checked by pid instead).
+# Live owners refresh their rows with heartbeat(), so keep this well above
+# the reaper interval.
+JOURNAL_STALE_AFTER = float(os.getenv("JOURNAL_STALE_AFTER", "1800"))
+
+# Statuses of jobs that still need work after a restart
+RESUMABLE_STATUSES = ("queued", "pending", "finalizing", "processing")
+
+# Statuses of jobs that are done; their rows are deleted once old enough
+FINISHED_STATUSES = ("completed", "error")
+
+# Record fields that only make sense in memory
+_TRANSIENT_FIELDS = ("operation",)
+
+# host:pid:boot-nonce - the nonce tells a restarted process apart from its
+# previous incarnation when the pid is reused (e.g. pid 1 in a container)
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _owner_is_alive(owner: Optional[str]) -> bool:
+    if not owner:
+        return False
+    try:
+        host, pid, _ = owner.rsplit(":", 2)
+        pid = int(pid)
+    except ValueError:
+        return False
+    if host != socket.gethostname():
+        return True  # can't tell, rely on staleness
+    if pid == os.getpid():
+        return False  # our pid, but an earlier process
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def serialize_record(record: dict) -> str:
+    """JSON-encode an operation record, keeping the upstream operation name only"""
+    data = {key: value for key, value in record.items() if key not in _TRANSIENT_FIELDS}
+    operation = record.get("operation")
+    if operation is not None and getattr(operation, "name", None):
+        data["upstream_operation"] = operation.name
+    return json.dumps(data, default=str)
+
+
+class OperationJournal:
+    """SQLite journal of video operation records (write-through from the registry)"""
+
+    def __init__(self, db_path: str = OPERATION_JOURNAL_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS video_operations ("
+                " operation_id TEXT PRIMARY KEY,"
+                " status TEXT NOT NULL,"
+                " owner TEXT,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " record TEXT NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS video_operations_status ON video_operations (status)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS video_operations_updated_at ON video_operations (updated_at)")
+            self._db.commit()
+
+    def _save(self, operation_id: str, status: str, created_at: float, record_json: str):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO video_operations (operation_id, status, owner, created_at, updated_at, record)"
+                " VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(operation_id) DO UPDATE SET"
+                " status = excluded.status, owner = excluded.owner,"
+                " updated_at = excluded.updated_at, record = excluded.record",
+                (operation_id, status, WORKER_ID, created_at, time.time(), record_json),
+            )
+            self._db.commit()
+
+    async def save(self, operation_id: str, record: dict):
+        """Persist the current state of an operation record"""
+        record_json = serialize_record(record)
+        await run_blocking(
+            self._save, operation_id, record.get("status", "pending"),
+            record.get("created_at", time.time()), record_json,
+        )
+
+    def _load(self, operation_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT record FROM video_operations WHERE operation_id = ?", (operation_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def load(self, operation_id: str) -> Optional[dict]:
+        return await run_blocking(self._load, operation_id)
+
+    def _delete(self, operation_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM video_operations WHERE operation_id = ?", (operation_id,))
+            self._db.commit()
+
+    async def delete(self, operation_id: str):
+        await run_blocking(self._delete, operation_id)
+
+    def _heartbeat(self) -> int:
+        placeholders = ",".join("?" for _ in RESUMABLE_STATUSES)
+        with self._lock:
+            cursor = self._db.execute(
+                f"UPDATE video_operations SET updated_at = ? WHERE owner = ? AND status IN ({placeholders})",
+                (time.time(), WORKER_ID, *RESUMABLE_STATUSES),
+            )
+            self._db.commit()
+        return cursor.rowcount
+
+    async def heartbeat(self) -> int:
+        """
+        Mark the unfinished jobs of this worker as alive, including those that
+        sit unchanged for a while (queued, long polls), so no other host takes
+        them over; returns the number of rows refreshed.
+        """
+        return await run_blocking(self._heartbeat)
+
+    def _claim_unfinished(self) -> List[dict]:
+        placeholders = ",".join("?" for _ in RESUMABLE_STATUSES)
+        stale_before = time.time() - JOURNAL_STALE_AFTER
+        claimed = []
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT operation_id, owner, updated_at, record FROM video_operations WHERE status IN ({placeholders})",
+                RESUMABLE_STATUSES,
+            ).fetchall()
+            for operation_id, owner, updated_at, record_json in rows:
+                if owner == WORKER_ID:
+                    continue  # already running here
+                if _owner_is_alive(owner) and updated_at > stale_before:
+                    continue
+                # Compare-and-set on the owner so concurrent workers never both resume a job
+                cursor = self._db.execute(
+                    "UPDATE video_operations SET owner = ?, updated_at = ? WHERE operation_id = ? AND owner IS ?",
+                    (WORKER_ID, time.time(), operation_id, owner),
+                )
+                if cursor.rowcount == 1:
+                    record = json.loads(record_json)
+                    record["operation_id"] = operation_id
+                    claimed.append(record)
+            self._db.commit()
+        return claimed
+
+    async def claim_unfinished(self) -> List[dict]:
+        """Take ownership of jobs left unfinished by a dead worker and return their records"""
+        return await run_blocking(self._claim_unfinished)
+
+    def _claim(self, operation_id: str, status: str, new_status: str) -> Optional[dict]:
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE video_operations SET owner = ?, status = ?, updated_at = ? WHERE operation_id = ? AND status = ?",
+                (WORKER_ID, new_status, time.time(), operation_id, status),
+            )
+            self._db.commit()
+            if cursor.rowcount != 1:
+                return None
+        return self._load(operation_id)
+
+    async def claim(self, operation_id: str, status: str, new_status: str) -> Optional[dict]:
+        """
+        Take ownership of one record if it is in `status`, moving it to
+        `new_status` (e.g. to resume a failed job). Only one caller wins.
+        """
+        return await run_blocking(self._claim, operation_id, status, new_status)
+
+    def _expire_finished(self, before: float) -> List[dict]:
+        placeholders = ",".join("?" for _ in FINISHED_STATUSES)
+        expired = []
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT operation_id, updated_at, record FROM video_operations"
+                f" WHERE status IN ({placeholders}) AND updated_at < ?",
+                (*FINISHED_STATUSES, before),
+            ).fetchall()
+            for operation_id, updated_at, record_json in rows:
+                # Skip rows another worker changed meanwhile (e.g. claimed for a resume)
+                cursor = self._db.execute(
+                    f"DELETE FROM video_operations WHERE operation_id = ? AND updated_at = ?"
+                    f" AND status IN ({placeholders})",
+                    (operation_id, updated_at, *FINISHED_STATUSES),
+                )
+                if cursor.rowcount == 1:
+                    record = json.loads(record_json)
+                    record["operation_id"] = operation_id
+                    expired.append(record)
+            self._db.commit()
+        return expired
+
+    async def expire_finished(self, before: float) -> List[dict]:
+        """
+        Delete rows of operations that finished (last updated) before a time,
+        whichever worker ran them, and return their records for file cleanup.
+        """
+        return await run_blocking(self._expire_finished, before)
@@ -0,0 +1,198 @@
+import os
+import time
+import asyncio
+from typing import Callable, Dict, List, Optional, Tuple
+
+from concurrency import spawn
+from retry import call_once, call_with_retry
+from logs import get_logger, log_context
+
+log = get_logger(__name__)
+
+# Polling schedule for long-running Veo operations. The first check happens
+# quickly, then the interval grows by POLL_BACKOFF up to POLL_MAX_INTERVAL.
+POLL_INITIAL_INTERVAL = float(os.getenv("VIDEO_POLL_INITIAL_INTERVAL", "5"))
+POLL_MAX_INTERVAL = float(os.getenv("VIDEO_POLL_MAX_INTERVAL", "20"))
+POLL_BACKOFF = float(os.getenv("VIDEO_POLL_BACKOFF", "1.5"))
+POLL_TIMEOUT = float(os.getenv("VIDEO_POLL_TIMEOUT", "900"))  # 15 minutes
+
+
+class OperationTimeout(Exception):
+    """Raised when an operation is still running after the poll timeout"""
+
+
+class OperationFailed(Exception):
+    """Raised when a finished operation reports an error of its own"""
+
+
+async def refresh_operation(client, operation, retry: bool = True):
+    """
+    Fetch the latest state of an operation without blocking the event loop.
+    retry=False makes a single rate limited attempt, for the poller, which
+    already checks again on its next tick.
+    """
+    if not retry:
+        return await call_once("operations_get", client.aio.operations.get, operation)
+    return await call_with_retry("operations_get", client.aio.operations.get, operation)
+
+
+async def wait_for_operation(
+    client,
+    operation,
+    initial_interval: Optional[float] = None,
+    max_interval: Optional[float] = None,
+    backoff: Optional[float] = None,
+    timeout: Optional[float] = None,
+):
+    """
+    Poll an operation until it is done, sleeping with asyncio.sleep and an
+    exponential backoff between checks. Returns the finished operation.
+    """
+    interval = POLL_INITIAL_INTERVAL if initial_interval is None else initial_interval
+    max_interval = POLL_MAX_INTERVAL if max_interval is None else max_interval
+    backoff = POLL_BACKOFF if backoff is None else backoff
+    timeout = POLL_TIMEOUT if timeout is None else timeout
+
+    deadline = time.monotonic() + timeout
+    while not operation.done:
+        if time.monotonic() >= deadline:
+            raise OperationTimeout(f"Operation still running after {timeout:.0f}s")
+        await asyncio.sleep(interval)
+        operation = await refresh_operation(client, operation)
+        interval = min(interval * backoff, max_interval)
+
+    if operation.error:
+        raise OperationFailed(f"Video operation failed: {operation.error}")
+
+    return operation
+
+
+def generated_video(operation):
+    """
+    First video of a finished operation. Raises OperationFailed when the
+    operation reports an error or its result is empty (e.g. every video was
+    removed by the safety filters).
+    """
+    if operation.error:
+        raise OperationFailed(f"Video operation failed: {operation.error}")
+    response = operation.response
+    if not (response and response.generated_videos):
+        if response and response.rai_media_filtered_reasons:
+            raise OperationFailed(f"Video blocked by safety filters: {'; '.join(response.rai_media_filtered_reasons)}")
+        raise OperationFailed("Video operation finished without a video")
+    return response.generated_videos[0]
+
+
+# Central poller settings: how many operations are refreshed per tick and
+# how long the poller may sleep when nothing is due.
+POLLER_BATCH_SIZE = int(os.getenv("VIDEO_POLLER_BATCH_SIZE", "20"))
+POLLER_IDLE_INTERVAL = float(os.getenv("VIDEO_POLLER_IDLE_INTERVAL", "30"))
+
+
+class OperationPoller:
+    """
+    Single background task that refreshes every pending operation in a
+    registry, so status requests never have to call upstream themselves.
+    Each operation has its own adaptive schedule: checked quickly at first,
+    then less often the longer it runs.
+    """
+
+    def __init__(self, registry: Dict[str, dict], refresh: Callable, on_done: Callable,
+                 batch_size: int = POLLER_BATCH_SIZE):
+        self.registry = registry
+        self.refresh = refresh  # async (operation) -> operation
+        self.on_done = on_done  # async (operation_id, operation) -> None
+        self.batch_size = batch_size
+        self._schedule: Dict[str, Tuple[float, float]] = {}  # op_id -> (next_check, interval)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def watch(self, operation_id: str):
+        """Schedule a newly registered operation for its first check"""
+        self._schedule[operation_id] = (time.monotonic() + POLL_INITIAL_INTERVAL, POLL_INITIAL_INTERVAL)
+        self._wakeup.set()
+
+    def _pending_ids(self) -> List[str]:
+        return [
+            op_id for op_id, data in self.registry.items()
+            if data.get('status') == 'pending' and data.get('operation') is not None
+        ]
+
+    async def tick(self) -> float:
+        """Refresh one batch of due operations; returns seconds until the next one is due"""
+        now = time.monotonic()
+        pending = self._pending_ids()
+
+        # Forget schedules of operations that finished or were cleaned up
+        for op_id in set(self._schedule) - set(pending):
+            del self._schedule[op_id]
+
+        for op_id in pending:
+            if op_id not in self._schedule:
+                self._schedule[op_id] = (now, POLL_INITIAL_INTERVAL)
+
+        due = sorted(
+            (next_check, op_id) for op_id, (next_check, _) in self._schedule.items()
+            if next_check <= now
+        )[:self.batch_size]
+
+        if due:
+            await asyncio.gather(*(self._check(op_id) for _, op_id in due))
+
+        if not self._schedule:
+            return POLLER_IDLE_INTERVAL
+        next_due = min(next_check for next_check, _ in self._schedule.values())
+        return max(0.0, min(next_due - time.monotonic(), POLLER_IDLE_INTERVAL))
+
+    async def _check(self, operation_id: str):
+        with log_context(operation_id=operation_id):
+            await self._check_operation(operation_id)
+
+    async def _check_operation(self, operation_id: str):
+        data = self.registry.get(operation_id)
+        if data is None:
+            return
+        _, interval = self._schedule.get(operation_id, (0, POLL_INITIAL_INTERVAL))
+        try:
+            operation = await self.refresh(data['operation'])
+            data['operation'] = operation
+            data['last_polled_at'] = time.time()
+        except Exception as e:
+            log.warning("Operation refresh failed", error=str(e))
+            operation = None
+
+        if operation is not None and operation.done:
+            # Hand over to the download/finalize step without holding up the tick
+            self._schedule.pop(operation_id, None)
+            data['status'] = 'finalizing'
+            spawn(self.on_done(operation_id, operation))
+            return
+
+        interval = min(interval * POLL_BACKOFF, POLL_MAX_INTERVAL)
+        self._schedule[operation_id] = (time.monotonic() + interval, interval)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                delay = await self.tick()
+            except Exception as e:
+                log.exception("Operation poller tick failed")
+                delay = POLL_INITIAL_INTERVAL
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
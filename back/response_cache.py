@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+from collections import OrderedDict
+from typing import List, Optional
+
+from concurrency import run_blocking
+from logs import get_logger
+from metrics import RESPONSE_CACHE_LOOKUPS
+
+log = get_logger(__name__)
+
+# Reuse responses to identical stateless chat requests (opt-in: generation
+# is not deterministic, a hit returns the first answer again)
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "false").lower() in ("1", "true", "yes")
+
+# How long a stored response is served, in seconds
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(24 * 3600)))
+
+# Responses kept in memory per worker (the disk tier is only bounded by the TTL)
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+
+# Disk tier, shared by the workers. Must not be under OUTPUT_DIR, which is
+# served publicly: entries hold other users' answers.
+RESPONSE_CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR", "response_cache")
+
+
+def cache_key(**fields) -> str:
+    """SHA-256 over everything that determines a response (model, config, prompt, image digests)"""
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache key -> response parts, in two tiers: an LRU-bounded dict in memory
+    and one JSON file per key in a directory, so entries survive restarts and
+    are shared by workers. Both tiers expire entries after ttl seconds; disk
+    hits are promoted to memory. A file's mtime is its expiry time, so a
+    sweep only stats the directory.
+    """
+
+    def __init__(self, directory: str = RESPONSE_CACHE_DIR, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 ttl: float = RESPONSE_CACHE_TTL):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, parts)
+        os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _remember(self, key: str, expires_at: float, parts: List[dict]):
+        self._entries[key] = (expires_at, parts)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[List[dict]]:
+        """Stored parts for a key, or None (counted as a memory hit, disk hit or miss)"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.time():
+                self._entries.move_to_end(key)
+                RESPONSE_CACHE_LOOKUPS.inc(result="memory")
+                return entry[1]
+            del self._entries[key]
+
+        stored = await run_blocking(self._read, key)
+        if stored is None:
+            RESPONSE_CACHE_LOOKUPS.inc(result="miss")
+            return None
+        self._remember(key, stored['expires_at'], stored['parts'])
+        RESPONSE_CACHE_LOOKUPS.inc(result="disk")
+        return stored['parts']
+
+    async def put(self, key: str, parts: List[dict]):
+        expires_at = time.time() + self.ttl
+        self._remember(key, expires_at, parts)
+        await run_blocking(self._write, key, {'expires_at': expires_at, 'parts': parts})
+
+    async def discard(self, key: str):
+        """Forget an entry whose parts can no longer be served (e.g. a deleted image)"""
+        self._entries.pop(key, None)
+        await run_blocking(self._remove, self._path(key))
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _read(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            log.warning("Unreadable response cache entry", key=key, error=str(e))
+            return None
+        if stored.get('expires_at', 0) <= time.time():
+            return None
+        return stored
+
+    def _write(self, key: str, stored: dict):
+        # Write then rename, so a concurrent reader never sees half a file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(stored, f)
+            os.utime(tmp_path, (stored['expires_at'], stored['expires_at']))
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    async def expire(self) -> int:
+        """Delete expired entries from both tiers; returns the number of files removed"""
+        now = time.time()
+        for key in [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            del self._entries[key]
+        return await run_blocking(self._remove_expired, now)
+
+    def _remove_expired(self, now: float) -> int:
+        removed = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    expired = entry.name.endswith(".json") and entry.stat().st_mtime <= now
+                except FileNotFoundError:
+                    continue
+                if expired and self._remove(entry.path):
+                    removed += 1
+        return removed
@@ -0,0 +1,316 @@
+import os
+import time
+import random
+import asyncio
+import datetime
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+from google.genai import errors
+
+from metrics import GEMINI_CALL_SECONDS, GEMINI_RETRIES, GEMINI_THROTTLED_SECONDS
+from logs import get_logger
+
+log = get_logger(__name__)
+
+# Kill switch for the whole layer (calls go straight through when off)
+GEMINI_RETRY = os.getenv("GEMINI_RETRY", "true").lower() in ("1", "true", "yes")
+
+# Client-side request rates per worker (requests per minute), kept under the
+# project quota so bursts queue here instead of coming back as 429s (0 = no limit)
+CHAT_RATE_PER_MINUTE = float(os.getenv("CHAT_RATE_PER_MINUTE", "300"))
+VEO_SUBMIT_RATE_PER_MINUTE = float(os.getenv("VEO_SUBMIT_RATE_PER_MINUTE", "10"))
+OPERATIONS_RATE_PER_MINUTE = float(os.getenv("OPERATIONS_RATE_PER_MINUTE", "600"))
+FILES_RATE_PER_MINUTE = float(os.getenv("FILES_RATE_PER_MINUTE", "300"))
+
+# Longest we ever wait between two attempts, whatever Retry-After says
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "60"))
+
+# Status codes worth another attempt. Veo submissions skip the ambiguous
+# ones (500/504), where the job may have been created anyway and a retry
+# would pay for a second video.
+RETRYABLE_CODES = (429, 500, 502, 503, 504)
+SUBMIT_RETRYABLE_CODES = (429, 503)
+
+# Transport errors where the request never reached the server, and those
+# where it may have
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+TRANSPORT_ERRORS = (httpx.TransportError, asyncio.TimeoutError)
+
+
+@dataclass
+class RetryPolicy:
+    """How one kind of call is retried and rate limited"""
+    attempts: int           # tries in total, including the first
+    base_delay: float       # first backoff step, doubled on every retry
+    max_delay: float        # backoff cap
+    deadline: float         # time budget for all attempts of one call
+    rate_per_minute: float  # client-side request rate (0 = unlimited)
+    burst: int              # requests allowed back to back before the rate applies
+    retry_ratio: float      # retries allowed per first attempt, over time
+    codes: Tuple[int, ...] = RETRYABLE_CODES
+    idempotent: bool = True  # retry transport errors after the request was sent
+
+
+RETRY_POLICIES: Dict[str, RetryPolicy] = {
+    "chat": RetryPolicy(attempts=4, base_delay=1.0, max_delay=20.0, deadline=90.0,
+                        rate_per_minute=CHAT_RATE_PER_MINUTE, burst=24, retry_ratio=0.2),
+    "generate_videos": RetryPolicy(attempts=5, base_delay=4.0, max_delay=60.0, deadline=300.0,
+                                   rate_per_minute=VEO_SUBMIT_RATE_PER_MINUTE, burst=4, retry_ratio=0.5,
+                                   codes=SUBMIT_RETRYABLE_CODES, idempotent=False),
+    "operations_get": RetryPolicy(attempts=5, base_delay=1.0, max_delay=30.0, deadline=120.0,
+                                  rate_per_minute=OPERATIONS_RATE_PER_MINUTE, burst=20, retry_ratio=0.5),
+    "files_download": RetryPolicy(attempts=4, base_delay=2.0, max_delay=30.0, deadline=300.0,
+                                  rate_per_minute=FILES_RATE_PER_MINUTE, burst=10, retry_ratio=0.5),
+    "files_upload": RetryPolicy(attempts=3, base_delay=1.0, max_delay=10.0, deadline=60.0,
+                                rate_per_minute=FILES_RATE_PER_MINUTE, burst=10, retry_ratio=0.2),
+}
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` tokens per second up to `capacity`
+    (rate 0 = unlimited). pause() holds every caller back until a point in
+    time, used to honor Retry-After.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self.paused_until = 0.0
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float = 1.0) -> float:
+        """Seconds until `amount` tokens could be taken"""
+        wait = max(0.0, self.paused_until - self.clock())
+        if self.rate > 0:
+            self._refill()
+            if self.tokens < amount:
+                wait = max(wait, (amount - self.tokens) / self.rate)
+        return wait
+
+    def try_take(self, amount: float = 1.0) -> bool:
+        if self.wait_time(amount) > 0:
+            return False
+        if self.rate > 0:
+            self.tokens -= amount
+        return True
+
+    async def take(self, amount: float = 1.0):
+        while not self.try_take(amount):
+            await asyncio.sleep(self.wait_time(amount))
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+
+
+class RetryStats:
+    """Per call kind counters (calls, retries, failures, throttled waits)"""
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.budget_exhausted = 0
+        self.throttled_seconds = 0.0
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """
+    Server-requested delay in seconds, from the Retry-After header or the
+    google.rpc.RetryInfo detail of a 429, or None
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                when = parsedate_to_datetime(value)
+                return max(0.0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        for detail in (details.get("error") or details).get("details") or []:
+            delay = detail.get("retryDelay") if isinstance(detail, dict) else None
+            if isinstance(delay, str) and delay.endswith("s"):
+                try:
+                    return max(0.0, float(delay[:-1]))
+                except ValueError:
+                    pass
+    return None
+
+
+def is_retryable(error: BaseException, policy: RetryPolicy) -> bool:
+    if isinstance(error, errors.APIError):
+        return error.code in policy.codes
+    if isinstance(error, CONNECT_ERRORS):
+        return True
+    if isinstance(error, TRANSPORT_ERRORS):
+        return policy.idempotent
+    return False
+
+
+def backoff_delay(policy: RetryPolicy, retry: int, rng: random.Random = random) -> float:
+    """Full jitter: uniform between 0 and the capped exponential step"""
+    return rng.uniform(0, min(policy.max_delay, policy.base_delay * (2 ** retry)))
+
+
+class RetryLayer:
+    """
+    Shared retry policy for every Gemini call. Each call kind has its own
+    rate limiter, retry budget and counters; a Retry-After from the server
+    pauses the whole kind, not just the call that got it.
+    """
+
+    def __init__(self, policies: Dict[str, RetryPolicy] = RETRY_POLICIES, enabled: bool = GEMINI_RETRY,
+                 rng: Optional[random.Random] = None):
+        self.policies = dict(policies)
+        self.enabled = enabled
+        self.rng = rng or random.Random()
+        self.limiters = {kind: TokenBucket(p.rate_per_minute / 60.0, p.burst) for kind, p in self.policies.items()}
+        # Retry budget: every first attempt earns retry_ratio credits and every
+        # retry spends one, so a failing upstream sees at most (1 + ratio)x
+        # the normal traffic instead of a retry storm. Starts with a little slack.
+        self.budget_caps = {kind: max(1.0, p.burst * p.retry_ratio) for kind, p in self.policies.items()}
+        self.budgets = dict(self.budget_caps)
+        self.stats = {kind: RetryStats() for kind in self.policies}
+
+    async def _throttle(self, kind: str):
+        limiter = self.limiters[kind]
+        started = time.monotonic()
+        await limiter.take()
+        waited = time.monotonic() - started
+        self.stats[kind].throttled_seconds += waited
+        if waited > 0:
+            GEMINI_THROTTLED_SECONDS.inc(waited, call=kind)
+
+    async def _attempt(self, kind: str, fn: Callable[..., Awaitable], args, kwargs):
+        """One attempt, timed into the per-call latency histogram"""
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await fn(*args, **kwargs)
+            outcome = "ok"
+            return result
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            GEMINI_CALL_SECONDS.observe(time.perf_counter() - started, call=kind, outcome=outcome)
+
+    async def call(self, kind: str, fn: Callable[..., Awaitable], *args, **kwargs):
+        """Await fn(*args, **kwargs) under the policy for `kind`, retrying transient failures"""
+        return await self._call(kind, self.policies[kind].attempts, fn, args, kwargs)
+
+    async def call_once(self, kind: str, fn: Callable[..., Awaitable], *args, **kwargs):
+        """
+        Rate limited single attempt, for callers with their own retry loop
+        (the operation poller). A Retry-After still pauses the whole kind.
+        """
+        return await self._call(kind, 1, fn, args, kwargs)
+
+    async def _call(self, kind: str, attempts: int, fn: Callable[..., Awaitable], args, kwargs):
+        if not self.enabled:
+            return await self._attempt(kind, fn, args, kwargs)
+        policy = self.policies[kind]
+        stats = self.stats[kind]
+        stats.calls += 1
+        self.budgets[kind] = min(self.budget_caps[kind], self.budgets[kind] + policy.retry_ratio)
+        started = time.monotonic()
+
+        retry = 0
+        while True:
+            await self._throttle(kind)
+            try:
+                return await self._attempt(kind, fn, args, kwargs)
+            except Exception as e:
+                delay = self._next_delay(kind, policy, e, retry, attempts, started)
+                if delay is None:
+                    stats.failures += 1
+                    raise
+                retry += 1
+                stats.retries += 1
+                GEMINI_RETRIES.inc(call=kind)
+                log.warning("Gemini call failed, retrying", call=kind, error=type(e).__name__,
+                            code=getattr(e, 'code', None), retry=retry, retries=attempts - 1, retry_in=round(delay, 2))
+                await asyncio.sleep(delay)
+
+    def _next_delay(self, kind: str, policy: RetryPolicy, error: Exception, retry: int, attempts: int,
+                    started: float) -> Optional[float]:
+        """Delay before the next attempt, or None to give up"""
+        if not is_retryable(error, policy):
+            return None
+        delay = backoff_delay(policy, retry, self.rng)
+        requested = retry_after(error)
+        if requested is not None:
+            if requested > RETRY_MAX_DELAY:
+                return None  # quota reset is too far out, surface the 429
+            self.limiters[kind].pause(requested)
+            delay = requested + self.rng.uniform(0, policy.base_delay)
+        if retry + 1 >= attempts or time.monotonic() - started + delay > policy.deadline:
+            return None
+        if self.budgets[kind] < 1:
+            self.stats[kind].budget_exhausted += 1
+            return None
+        self.budgets[kind] -= 1
+        return delay
+
+    async def stream(self, kind: str, fn: Callable[..., Awaitable[AsyncIterator]], *args, **kwargs) -> AsyncIterator:
+        """
+        Open a streaming call and wait for its first chunk under the policy.
+        Once something has been yielded a failure is final, since the caller
+        has already forwarded part of the response.
+        """
+        async def first_chunk():
+            iterator = (await fn(*args, **kwargs)).__aiter__()
+            try:
+                return iterator, await iterator.__anext__()
+            except StopAsyncIteration:
+                return iterator, None
+
+        iterator, chunk = await self.call(kind, first_chunk)
+
+        async def chunks():
+            if chunk is None:
+                return
+            yield chunk
+            async for rest in iterator:
+                yield rest
+
+        return chunks()
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {kind: stats.as_dict() for kind, stats in self.stats.items()}
+
+
+# Process-wide layer used by every call site
+gemini_retry = RetryLayer()
+
+
+async def call_with_retry(kind: str, fn: Callable[..., Awaitable], *args, **kwargs):
+    return await gemini_retry.call(kind, fn, *args, **kwargs)
+
+
+async def call_once(kind: str, fn: Callable[..., Awaitable], *args, **kwargs):
+    return await gemini_retry.call_once(kind, fn, *args, **kwargs)
+
+
+async def stream_with_retry(kind: str, fn: Callable[..., Awaitable[AsyncIterator]], *args, **kwargs) -> AsyncIterator:
+    return await gemini_retry.stream(kind, fn, *args, **kwargs)
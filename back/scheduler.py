@@ -0,0 +1,181 @@
+import os
+import asyncio
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Iterator, Optional, Tuple
+
+# Priority classes: interactive requests first, long video segments second
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+# Grants per round when both classes are waiting, so batch work is slowed
+# down by interactive traffic but never starved
+PRIORITY_WEIGHTS = {INTERACTIVE: 3, BATCH: 1}
+
+# Veo jobs in flight upstream (submitted and not finished), in total and per session
+VEO_MAX_CONCURRENT = int(os.getenv("VEO_MAX_CONCURRENT", "10"))
+VEO_MAX_PER_SESSION = int(os.getenv("VEO_MAX_PER_SESSION", "3"))
+
+
+class JobScheduler:
+    """
+    Admission control for upstream video jobs. A job holds a slot from
+    submission until its operation finishes (release()); jobs beyond the
+    global or per-session cap wait in priority queues. Within a class,
+    sessions take turns (round robin), so one session's burst cannot push
+    everyone else back; across classes, grants follow PRIORITY_WEIGHTS.
+    Jobs without a session are each their own session.
+    """
+
+    def __init__(self, max_concurrent: int = VEO_MAX_CONCURRENT,
+                 max_per_session: int = VEO_MAX_PER_SESSION,
+                 weights: Dict[str, int] = PRIORITY_WEIGHTS):
+        self.max_concurrent = max_concurrent
+        self.max_per_session = max_per_session
+        self.weights = dict(weights)
+        self._credits = dict(weights)
+        self._running: Dict[str, str] = {}  # job_id -> session key
+        self._per_session: Counter = Counter()
+        # class -> session key -> waiting job ids (oldest first)
+        self._queues: Dict[str, "OrderedDict[str, Deque[str]]"] = {cls: OrderedDict() for cls in weights}
+        self._waiters: Dict[str, Tuple[asyncio.Future, str, str]] = {}  # job_id -> (future, session, class)
+
+    @property
+    def running(self) -> int:
+        return len(self._running)
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def is_running(self, job_id: str) -> bool:
+        return job_id in self._running
+
+    @staticmethod
+    def _session_key(job_id: str, session_id: Optional[str]) -> str:
+        return session_id or f"job:{job_id}"
+
+    def enqueue(self, job_id: str, session_id: Optional[str] = None,
+                priority: str = INTERACTIVE) -> asyncio.Future:
+        """
+        Queue a job and return a future resolved when it gets a slot (already
+        done if one was free). Pair with release(job_id), or cancel(job_id).
+        """
+        future = asyncio.get_running_loop().create_future()
+        if job_id in self._running:
+            future.set_result(None)
+            return future
+        session = self._session_key(job_id, session_id)
+        self._waiters[job_id] = (future, session, priority)
+        self._queues[priority].setdefault(session, deque()).append(job_id)
+        self._dispatch()
+        return future
+
+    async def acquire(self, job_id: str, session_id: Optional[str] = None, priority: str = INTERACTIVE):
+        """Wait for a slot"""
+        future = self.enqueue(job_id, session_id, priority)
+        try:
+            await future
+        except asyncio.CancelledError:
+            self.cancel(job_id)
+            raise
+
+    def adopt(self, job_id: str, session_id: Optional[str] = None):
+        """Count a job that is already running upstream (e.g. resumed after a restart), even over the caps"""
+        if job_id not in self._running:
+            session = self._session_key(job_id, session_id)
+            self._running[job_id] = session
+            self._per_session[session] += 1
+
+    def release(self, job_id: str):
+        """Free the slot of a finished job and admit the next ones"""
+        session = self._running.pop(job_id, None)
+        if session is not None:
+            self._per_session[session] -= 1
+            if self._per_session[session] <= 0:
+                del self._per_session[session]
+            self._dispatch()
+
+    def cancel(self, job_id: str):
+        """Drop a job whether it is still waiting or already running"""
+        waiter = self._waiters.pop(job_id, None)
+        if waiter is None:
+            self.release(job_id)
+            return
+        future, session, priority = waiter
+        jobs = self._queues[priority].get(session)
+        if jobs is not None:
+            jobs.remove(job_id)
+            if not jobs:
+                del self._queues[priority][session]
+        if not future.done():
+            future.cancel()
+
+    @asynccontextmanager
+    async def slot(self, job_id: str, session_id: Optional[str] = None, priority: str = INTERACTIVE):
+        """Hold a slot for the duration of a block"""
+        await self.acquire(job_id, session_id, priority)
+        try:
+            yield
+        finally:
+            self.release(job_id)
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based place of a waiting job in the admission order, None if not waiting"""
+        if job_id not in self._waiters:
+            return None
+        for index, (waiting_id, _, _) in enumerate(self._admission_order(simulate=True), 1):
+            if waiting_id == job_id:
+                return index
+        return None
+
+    def _admission_order(self, simulate: bool) -> Iterator[Tuple[str, str, str]]:
+        """
+        Yield (job_id, session, class) in the order jobs would be admitted.
+        When simulating, state is copied and caps are ignored (so a position
+        counts every job ahead); otherwise jobs are popped from the queues and
+        sessions at their cap are skipped.
+        """
+        queues = {cls: OrderedDict((s, deque(jobs)) for s, jobs in sessions.items())
+                  for cls, sessions in self._queues.items()} if simulate else self._queues
+        credits = dict(self._credits)
+
+        while True:
+            picked = None
+            waiting = [cls for cls in self.weights if queues[cls]]
+            if not waiting:
+                return
+            if all(credits[cls] <= 0 for cls in waiting):
+                credits = dict(self.weights)
+            # Classes with credit left first, in priority order
+            for cls in sorted(waiting, key=lambda c: (credits[c] <= 0, list(self.weights).index(c))):
+                for session in list(queues[cls]):
+                    if not simulate and self._per_session[session] >= self.max_per_session:
+                        continue
+                    picked = (cls, session)
+                    break
+                if picked:
+                    break
+            if picked is None:
+                return
+            cls, session = picked
+            jobs = queues[cls].pop(session)
+            job_id = jobs.popleft()
+            if jobs:
+                queues[cls][session] = jobs  # back of the rotation
+            credits[cls] -= 1
+            if not simulate:
+                self._credits = credits
+            yield job_id, session, cls
+
+    def _dispatch(self):
+        while len(self._running) < self.max_concurrent:
+            admitted = next(self._admission_order(simulate=False), None)
+            if admitted is None:
+                return
+            job_id, session, _ = admitted
+            future, _, _ = self._waiters.pop(job_id)
+            self._running[job_id] = session
+            self._per_session[session] += 1
+            if not future.done():
+                future.set_result(None)
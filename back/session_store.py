@@ -0,0 +1,304 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+from google.genai import types
+
+from concurrency import run_blocking
+from expiry import ExpiryIndex
+from logs import get_logger
+
+log = get_logger(__name__)
+
+# Which backend holds chat sessions: "memory" (per process) or "sqlite"
+# (history persisted on disk, chats rebuilt on demand by any worker)
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE", "memory")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+
+# Hard cap on live chat objects kept in memory per worker
+SESSION_MAX_ACTIVE = int(os.getenv("SESSION_MAX_ACTIVE", "500"))
+
+
+class SessionStore(ABC):
+    """
+    Interface shared by session backends. A session record is a dict with
+    'chat', 'created_at' and 'last_used'.
+    """
+
+    @abstractmethod
+    async def get(self, session_id: str) -> Optional[dict]:
+        """Return the live session record (refreshing last_used), or None"""
+
+    @abstractmethod
+    async def add(self, session_id: str, chat) -> dict:
+        """Register a new session"""
+
+    @abstractmethod
+    async def save(self, session_id: str, chat) -> bool:
+        """Persist the chat after a turn; False if another worker saved the session first"""
+
+    @abstractmethod
+    async def touch(self, session_id: str):
+        """Mark a session as used without loading its chat"""
+
+    @abstractmethod
+    async def delete(self, session_id: str):
+        """Forget a session"""
+
+    @abstractmethod
+    async def expire(self) -> List[str]:
+        """Drop sessions idle for longer than the timeout; returns their ids"""
+
+    @abstractmethod
+    async def list_sessions(self) -> List[dict]:
+        """Session metadata (no chat objects), for debugging"""
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Live chat objects in an LRU ordered by last use, with an idle TTL and a
+    hard cap on the number of sessions. Idle deadlines live in an ExpiryIndex.
+    """
+
+    def __init__(self, timeout: float, max_sessions: int = SESSION_MAX_ACTIVE):
+        self.timeout = timeout
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, dict]" = OrderedDict()
+        self._expiry = ExpiryIndex()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _is_expired(self, record: dict, now: float) -> bool:
+        return now - record['last_used'] > self.timeout
+
+    def peek(self, session_id: str) -> Optional[dict]:
+        """Return a record without refreshing it"""
+        return self._sessions.get(session_id)
+
+    def _used(self, session_id: str, record: dict):
+        self._sessions.move_to_end(session_id)
+        self._expiry.schedule(session_id, record['last_used'] + self.timeout)
+
+    def put(self, session_id: str, record: dict) -> dict:
+        self._sessions[session_id] = record
+        self._used(session_id, record)
+        while len(self._sessions) > self.max_sessions:
+            evicted_id, _ = self._sessions.popitem(last=False)
+            self._expiry.discard(evicted_id)
+            log.info("Least recently used session evicted", session_id=evicted_id)
+        return record
+
+    def pop(self, session_id: str) -> Optional[dict]:
+        self._expiry.discard(session_id)
+        return self._sessions.pop(session_id, None)
+
+    async def get(self, session_id: str) -> Optional[dict]:
+        record = self._sessions.get(session_id)
+        if record is None:
+            return None
+        now = time.time()
+        if self._is_expired(record, now):
+            self.pop(session_id)
+            return None
+        record['last_used'] = now
+        self._used(session_id, record)
+        return record
+
+    async def add(self, session_id: str, chat) -> dict:
+        now = time.time()
+        return self.put(session_id, {'chat': chat, 'created_at': now, 'last_used': now})
+
+    async def save(self, session_id: str, chat) -> bool:
+        await self.touch(session_id)
+        return True
+
+    async def touch(self, session_id: str):
+        record = self._sessions.get(session_id)
+        if record is not None:
+            record['last_used'] = time.time()
+            self._used(session_id, record)
+
+    async def delete(self, session_id: str):
+        self.pop(session_id)
+
+    async def expire(self) -> List[str]:
+        # O(expired): only sessions whose idle deadline passed are touched
+        expired = self._expiry.pop_expired()
+        for session_id in expired:
+            self._sessions.pop(session_id, None)
+        return expired
+
+    async def list_sessions(self) -> List[dict]:
+        return [
+            {'session_id': sid, 'created_at': data['created_at'], 'last_used': data['last_used']}
+            for sid, data in self._sessions.items()
+        ]
+
+
+def serialize_history(history: List[types.Content]) -> bytes:
+    """Encode a chat history as JSON bytes (inline image data is base64'd)"""
+    return json.dumps([content.model_dump(mode='json', exclude_none=True) for content in history]).encode('utf-8')
+
+
+def deserialize_history(data: Optional[bytes]) -> List[types.Content]:
+    if not data:
+        return []
+    return [types.Content.model_validate(content) for content in json.loads(data)]
+
+
+class SqliteSessionStore(SessionStore):
+    """
+    Chat history stored as bytes in SQLite, so any worker (or a restarted one)
+    can rebuild a chat from it. Live chats are cached in a bounded in-memory
+    LRU and rebuilt when another worker has advanced the conversation.
+    """
+
+    def __init__(self, chat_factory: Callable, db_path: str, timeout: float,
+                 max_cached: int = SESSION_MAX_ACTIVE):
+        self.chat_factory = chat_factory  # (history) -> chat
+        self.db_path = db_path
+        self.timeout = timeout
+        self._cache = MemorySessionStore(timeout, max_cached)
+        self._save_lock = asyncio.Lock()  # saves of one worker compare against each other's versions
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " session_id TEXT PRIMARY KEY,"
+                " created_at REAL NOT NULL,"
+                " last_used REAL NOT NULL,"
+                " version INTEGER NOT NULL DEFAULT 0,"
+                " history BLOB)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used)")
+            self._db.commit()
+
+    def _execute(self, query: str, params=(), fetch: Optional[str] = None):
+        with self._lock:
+            cursor = self._db.execute(query, params)
+            if fetch == 'one':
+                result = cursor.fetchone()
+            elif fetch == 'all':
+                result = cursor.fetchall()
+            else:
+                result = cursor.rowcount
+            self._db.commit()
+            return result
+
+    async def get(self, session_id: str) -> Optional[dict]:
+        now = time.time()
+        row = await run_blocking(
+            self._execute,
+            "SELECT created_at, last_used, version FROM sessions WHERE session_id = ?",
+            (session_id,), 'one',
+        )
+        if row is None:
+            self._cache.pop(session_id)
+            return None
+
+        created_at, last_used, version = row
+        if now - last_used > self.timeout:
+            await self.delete(session_id)
+            return None
+
+        await run_blocking(self._execute, "UPDATE sessions SET last_used = ? WHERE session_id = ?", (now, session_id))
+
+        record = self._cache.peek(session_id)
+        if record is None or record['version'] != version:
+            # Not cached here, or another worker added turns since: rebuild from history
+            blob = await run_blocking(
+                self._execute, "SELECT history FROM sessions WHERE session_id = ?", (session_id,), 'one'
+            )
+            history = await run_blocking(deserialize_history, blob[0] if blob else None)
+            record = {'chat': self.chat_factory(history), 'created_at': created_at, 'version': version}
+            log.info("Session rebuilt from history", session_id=session_id, history_entries=len(history))
+
+        record['last_used'] = now
+        return self._cache.put(session_id, record)
+
+    async def add(self, session_id: str, chat) -> dict:
+        now = time.time()
+        await run_blocking(
+            self._execute,
+            "INSERT OR REPLACE INTO sessions (session_id, created_at, last_used, version, history) VALUES (?, ?, ?, 0, NULL)",
+            (session_id, now, now),
+        )
+        return self._cache.put(session_id, {'chat': chat, 'created_at': now, 'last_used': now, 'version': 0})
+
+    async def save(self, session_id: str, chat) -> bool:
+        """
+        Compare-and-swap on the version the chat was built from: when another
+        worker saved a turn in between, its history is kept, this turn is not
+        persisted and the next get() rebuilds the chat from the stored history.
+        """
+        blob = await run_blocking(serialize_history, chat.get_history())
+        async with self._save_lock:
+            now = time.time()
+            record = self._cache.peek(session_id)
+            if record is None:
+                # Evicted from this worker's cache mid-turn: the base version is unknown
+                await run_blocking(
+                    self._execute,
+                    "UPDATE sessions SET history = ?, last_used = ?, version = version + 1 WHERE session_id = ?",
+                    (blob, now, session_id),
+                )
+                return True
+            updated = await run_blocking(
+                self._execute,
+                "UPDATE sessions SET history = ?, last_used = ?, version = version + 1"
+                " WHERE session_id = ? AND version = ?",
+                (blob, now, session_id, record['version']),
+            )
+            if not updated:
+                self._cache.pop(session_id)
+                log.warning("Session saved by another worker, turn not persisted", session_id=session_id)
+                return False
+            record['version'] += 1
+            record['last_used'] = now
+            return True
+
+    async def touch(self, session_id: str):
+        await run_blocking(
+            self._execute, "UPDATE sessions SET last_used = ? WHERE session_id = ?", (time.time(), session_id)
+        )
+        await self._cache.touch(session_id)
+
+    async def delete(self, session_id: str):
+        self._cache.pop(session_id)
+        await run_blocking(self._execute, "DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    async def expire(self) -> List[str]:
+        cutoff = time.time() - self.timeout
+        rows = await run_blocking(
+            self._execute, "SELECT session_id FROM sessions WHERE last_used < ?", (cutoff,), 'all'
+        )
+        await run_blocking(self._execute, "DELETE FROM sessions WHERE last_used < ?", (cutoff,))
+        expired = [row[0] for row in rows]
+        for session_id in expired:
+            self._cache.pop(session_id)
+        await self._cache.expire()
+        return expired
+
+    async def list_sessions(self) -> List[dict]:
+        rows = await run_blocking(
+            self._execute, "SELECT session_id, created_at, last_used FROM sessions ORDER BY last_used", (), 'all'
+        )
+        return [{'session_id': sid, 'created_at': created, 'last_used': used} for sid, created, used in rows]
+
+
+def create_session_store(chat_factory: Callable, timeout: float) -> SessionStore:
+    """Build the session backend selected by SESSION_STORE"""
+    if SESSION_STORE_BACKEND == "sqlite":
+        return SqliteSessionStore(chat_factory, SESSION_DB_PATH, timeout)
+    if SESSION_STORE_BACKEND != "memory":
+        log.warning("Unknown SESSION_STORE, falling back to memory", session_store=SESSION_STORE_BACKEND)
+    return MemorySessionStore(timeout)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Load benchmark: latency of / and /api/sessions while chats are in progress.
+Runs fully offline against the fake Gemini client (no server, no API key).
+
+Usage: cd back && python testss/bench_chat_load.py [concurrent_chats] [chat_latency_s]
+"""
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import statistics
+
+BACK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACK_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(BACK_DIR)
+
+import httpx
+import main
+from fake_gemini import FakeClient
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def probe(http, path, stop, samples):
+    """Hit a cheap endpoint in a loop and record its latency"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await http.get(path)
+        samples.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200
+        await asyncio.sleep(0.01)
+
+
+async def run(concurrent_chats=20, chat_latency=2.0):
+    main.client = FakeClient(latency=chat_latency)
+    main.UPLOAD_DIR = tempfile.mkdtemp(prefix="bench_uploads_")
+    main.OUTPUT_DIR = tempfile.mkdtemp(prefix="bench_outputs_")
+    transport = httpx.ASGITransport(app=main.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as http:
+        stop = asyncio.Event()
+        root_samples, sessions_samples = [], []
+        probes = [
+            asyncio.create_task(probe(http, "/", stop, root_samples)),
+            asyncio.create_task(probe(http, "/api/sessions", stop, sessions_samples)),
+        ]
+
+        start = time.perf_counter()
+        chats = [
+            http.post("/api/chat", data={"message": f"Draw banana #{i}"})
+            for i in range(concurrent_chats)
+        ]
+        responses = await asyncio.gather(*chats)
+        wall = time.perf_counter() - start
+
+        stop.set()
+        await asyncio.gather(*probes)
+
+    failed = [r for r in responses if r.status_code != 200 or "session_id" not in r.json()]
+
+    print(f"🍌 {concurrent_chats} concurrent chats, fake upstream latency {chat_latency:.1f}s")
+    print(f"  chats wall time: {wall:.2f}s (serial would be {concurrent_chats * chat_latency:.1f}s), failures: {len(failed)}")
+    for name, samples in (("/", root_samples), ("/api/sessions", sessions_samples)):
+        print(f"  {name:<14} n={len(samples):<5} p50={percentile(samples, 50):7.2f}ms "
+              f"p99={percentile(samples, 99):7.2f}ms mean={statistics.mean(samples):7.2f}ms")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(run(
+        concurrent_chats=int(args[0]) if len(args) > 0 else 20,
+        chat_latency=float(args[1]) if len(args) > 1 else 2.0,
+    ))
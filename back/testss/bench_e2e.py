@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end load benchmark. Virtual users drive /api/chat,
+/api/video_chat/generate_unified, /api/video_chat/status and
+/api/video_chat/generate_long against the app (with its background poller,
+scheduler and retry layer running) on top of the fake Gemini client, then
+report throughput, latency percentiles, job completion times and RSS.
+Runs fully offline (no server, no API key) and is repeatable with --seed.
+
+Usage: cd back && python testss/bench_e2e.py [--users 40] [--duration 20]
+           [--mix chat=70,video=20,long=5,storyboard=5] [--chat-latency 2] [--video-latency 5]
+           [--failure-rate 0.02] [--json baseline.json] [--compare baseline.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+import dataclasses
+from collections import defaultdict
+
+BACK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACK_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(BACK_DIR)
+
+BENCH_DIR = tempfile.mkdtemp(prefix="bench_e2e_")
+os.environ.setdefault("OPERATION_JOURNAL_PATH", os.path.join(BENCH_DIR, "video_operations.db"))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import httpx
+import main
+import polling
+import retry
+from upload_store import UploadStore
+from fake_gemini import FakeClient, make_png
+
+REFERENCE_IMAGE = make_png((640, 360), color='teal')
+FINISHED = ('completed', 'error')
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def current_rss_mb():
+    """Resident set size of this process (Linux /proc, else the peak)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB on Linux
+
+
+class Stats:
+    """Per endpoint request latencies and per kind job completion times"""
+
+    def __init__(self):
+        self.requests = defaultdict(list)  # endpoint -> [seconds]
+        self.request_errors = defaultdict(int)
+        self.jobs = defaultdict(list)  # kind -> [seconds from submit to completed]
+        self.job_errors = defaultdict(int)
+        self.rss = []
+
+    async def request(self, name, call):
+        """Time one request; returns the response, or None when it failed"""
+        started = time.perf_counter()
+        try:
+            response = await call
+        except Exception:
+            response = None
+        self.requests[name].append(time.perf_counter() - started)
+        if response is None or response.status_code >= 400:
+            self.request_errors[name] += 1
+            return None
+        return response
+
+    def job(self, kind, seconds, ok):
+        if ok:
+            self.jobs[kind].append(seconds)
+        else:
+            self.job_errors[kind] += 1
+
+    def summary(self, wall):
+        def latency(samples):
+            return {
+                'p50_ms': percentile(samples, 50) * 1000,
+                'p95_ms': percentile(samples, 95) * 1000,
+                'p99_ms': percentile(samples, 99) * 1000,
+                'max_ms': max(samples) * 1000,
+            }
+        return {
+            'wall_seconds': wall,
+            'requests': {
+                name: {'count': len(samples), 'errors': self.request_errors[name],
+                       'per_second': len(samples) / wall, **latency(samples)}
+                for name, samples in sorted(self.requests.items())
+            },
+            'jobs': {
+                kind: {'completed': len(self.jobs[kind]), 'errors': self.job_errors[kind],
+                       'per_minute': len(self.jobs[kind]) / wall * 60,
+                       **({'p50_s': percentile(self.jobs[kind], 50), 'p95_s': percentile(self.jobs[kind], 95),
+                           'max_s': max(self.jobs[kind])} if self.jobs[kind] else {})}
+                for kind in sorted(set(self.jobs) | set(self.job_errors))
+            },
+            'rss_mb': {'start': self.rss[0], 'end': self.rss[-1], 'peak': max(max(self.rss), peak_rss_mb())}
+            if self.rss else {},
+        }
+
+
+async def wait_for_job(http, stats, operation_id, interval, timeout):
+    """Poll /status like the frontend does; returns the final status or None on timeout"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(interval)
+        response = await stats.request("POST /api/video_chat/status", http.post(
+            "/api/video_chat/status", json={"operation_id": operation_id}))
+        if response is not None and response.json()['status'] in FINISHED:
+            return response.json()['status']
+    return None
+
+
+async def chat_scenario(http, stats, rng, user, config):
+    """One chat turn; half of them continue the user's previous session"""
+    data = {"message": "Draw a banana wearing sunglasses"}
+    if user.get('session_id') and rng.random() < 0.5:
+        data['session_id'] = user['session_id']
+    response = await stats.request("POST /api/chat", http.post("/api/chat", data=data))
+    if response is not None:
+        if 'session_id' not in response.json():
+            stats.request_errors["POST /api/chat"] += 1  # the endpoint reports model errors in the body
+        user['session_id'] = response.json().get('session_id')
+
+
+async def video_scenario(http, stats, rng, user, config):
+    """An 8s video, with a reference image half of the time, polled until done"""
+    files = [("image_files", ("reference.png", REFERENCE_IMAGE, "image/png"))] if rng.random() < 0.5 else None
+    started = time.perf_counter()
+    response = await stats.request("POST /api/video_chat/generate_unified", http.post(
+        "/api/video_chat/generate_unified", data={"prompt": "A cat surfing at sunset", "duration": "8"}, files=files))
+    if response is None:
+        return stats.job("video", 0, False)
+    status = await wait_for_job(http, stats, response.json()['operation_id'], config.status_interval, config.job_timeout)
+    stats.job("video", time.perf_counter() - started, status == 'completed')
+
+
+def long_scenario(mode):
+    async def scenario(http, stats, rng, user, config):
+        """A 22s long video (three segments or shots), polled until done"""
+        started = time.perf_counter()
+        response = await stats.request("POST /api/video_chat/generate_long", http.post(
+            "/api/video_chat/generate_long", json={"prompt": "A day at the harbour", "duration": 22, "mode": mode}))
+        if response is None:
+            return stats.job(mode, 0, False)
+        status = await wait_for_job(http, stats, response.json()['operation_id'], config.status_interval,
+                                    config.job_timeout * 3)
+        stats.job(mode, time.perf_counter() - started, status == 'completed')
+    return scenario
+
+
+SCENARIOS = {
+    'chat': chat_scenario,
+    'video': video_scenario,
+    'long': long_scenario("extend"),
+    'storyboard': long_scenario("storyboard"),
+}
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario '{name}', expected one of {list(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def virtual_user(http, stats, rng, config, mix, end):
+    """Pick scenarios by weight until the end of the run, with a short think time between them"""
+    user = {}
+    names, weights = list(mix), list(mix.values())
+    while time.monotonic() < end:
+        await SCENARIOS[rng.choices(names, weights)[0]](http, stats, rng, user, config)
+        await asyncio.sleep(rng.uniform(0, config.think_time))
+
+
+async def sample_rss(stats, stop):
+    while not stop.is_set():
+        stats.rss.append(current_rss_mb())
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.25)
+        except asyncio.TimeoutError:
+            pass
+    stats.rss.append(current_rss_mb())
+
+
+async def run(config):
+    rng = random.Random(config.seed)
+    main.client = FakeClient(
+        latency=config.chat_latency, video_latency=config.video_latency, latency_jitter=config.jitter,
+        failure_rate=config.failure_rate, seed=config.seed,
+    )
+    main.OUTPUT_DIR = os.path.join(BENCH_DIR, "outputs")
+    os.makedirs(main.OUTPUT_DIR, exist_ok=True)
+    os.makedirs(os.path.join(BENCH_DIR, "uploads"), exist_ok=True)
+    main.upload_store = UploadStore(os.path.join(BENCH_DIR, "uploads"))
+    # Server-side polling scaled to the fake job time (5s/20s against ~1 minute Veo jobs)
+    polling.POLL_INITIAL_INTERVAL = config.video_latency / 12
+    polling.POLL_MAX_INTERVAL = config.video_latency / 3
+    if not config.rate_limits:
+        # The fake upstream has no quota; the client-side limits would only measure themselves
+        retry.gemini_retry = retry.RetryLayer({
+            kind: dataclasses.replace(policy, rate_per_minute=0) for kind, policy in retry.RETRY_POLICIES.items()
+        })
+
+    stats = Stats()
+    stop = asyncio.Event()
+    await main.on_startup()
+    rss_task = asyncio.create_task(sample_rss(stats, stop))
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        limits = httpx.Limits(max_connections=None)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600, limits=limits) as http:
+            started = time.monotonic()
+            end = started + config.duration
+            await asyncio.gather(*(
+                virtual_user(http, stats, random.Random(rng.random()), config, config.mix, end)
+                for _ in range(config.users)
+            ))
+            wall = time.monotonic() - started
+    finally:
+        stop.set()
+        await rss_task
+        await main.on_shutdown()
+
+    summary = stats.summary(wall)
+    summary['config'] = {key: value for key, value in vars(config).items() if key not in ('json', 'compare')}
+    summary['upstream_calls'] = dict(main.client.calls)
+    summary['retries'] = {kind: s['retries'] for kind, s in retry.gemini_retry.snapshot().items() if s['retries']}
+    return summary
+
+
+def report(summary, baseline=None):
+    config = summary['config']
+    print(f"🍌 {config['users']} users for {config['duration']:.0f}s, mix {config['mix']}, "
+          f"fake latency chat {config['chat_latency']}s / video {config['video_latency']}s, "
+          f"failure rate {config['failure_rate']}")
+    print(f"  wall {summary['wall_seconds']:.1f}s\n")
+    print(f"  {'endpoint':<38}{'count':>7}{'err':>5}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, r in summary['requests'].items():
+        line = (f"  {name:<38}{r['count']:>7}{r['errors']:>5}{r['per_second']:>9.1f}"
+                f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['max_ms']:>10.1f}")
+        previous = (baseline or {}).get('requests', {}).get(name)
+        if previous:
+            line += f"   p99 {r['p99_ms'] - previous['p99_ms']:+.1f}ms, req/s {r['per_second'] - previous['per_second']:+.1f}"
+        print(line)
+    print(f"\n  {'job':<38}{'done':>7}{'err':>5}{'per min':>9}{'p50 s':>10}{'p95 s':>10}{'max s':>10}")
+    for kind, j in summary['jobs'].items():
+        print(f"  {kind:<38}{j['completed']:>7}{j['errors']:>5}{j['per_minute']:>9.1f}"
+              f"{j.get('p50_s', 0):>10.2f}{j.get('p95_s', 0):>10.2f}{j.get('max_s', 0):>10.2f}")
+    rss = summary['rss_mb']
+    if rss:
+        line = f"\n  RSS start {rss['start']:.0f} MB, end {rss['end']:.0f} MB, peak {rss['peak']:.0f} MB"
+        if baseline and baseline.get('rss_mb'):
+            line += f" (peak {rss['peak'] - baseline['rss_mb']['peak']:+.0f} MB vs baseline)"
+        print(line)
+    print(f"  upstream calls: {summary['upstream_calls']}")
+    if summary['retries']:
+        print(f"  retries: {summary['retries']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=40, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=20, help="seconds during which users start new scenarios")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("chat=70,video=20,long=5,storyboard=5"))
+    parser.add_argument("--chat-latency", type=float, default=2.0, help="fake seconds per chat turn")
+    parser.add_argument("--video-latency", type=float, default=5.0, help="fake seconds per Veo job")
+    parser.add_argument("--jitter", type=float, default=0.3, help="latency variation (fraction)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="probability that an upstream call fails (503)")
+    parser.add_argument("--think-time", type=float, default=0.5, help="max pause between a user's scenarios")
+    parser.add_argument("--status-interval", type=float, default=0.5, help="client /status poll interval")
+    parser.add_argument("--job-timeout", type=float, default=120, help="give up waiting for a video after this")
+    parser.add_argument("--rate-limits", action="store_true", help="keep the client-side Gemini rate limits")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the results to this file (a baseline for --compare)")
+    parser.add_argument("--compare", help="show differences against a previous --json result")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    config = parse_args()
+    summary = asyncio.run(run(config))
+    baseline = None
+    if config.compare:
+        with open(config.compare) as f:
+            baseline = json.load(f)
+    report(summary, baseline)
+    if config.json:
+        with open(config.json, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\n  results written to {config.json}")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark: CPU time and response size for generated images in /api/chat.
+Compares the old path (PIL decode + PNG save + second PNG encode + base64)
+with the raw-bytes path returning an /outputs URL, and the opt-in inline mode.
+
+Usage: cd back && python testss/bench_image_response.py [repeats]
+"""
+import os
+import io
+import sys
+import json
+import time
+import base64
+import tempfile
+
+BACK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACK_DIR)
+os.chdir(BACK_DIR)
+
+from PIL import Image
+import main
+
+
+def make_generated_png(size):
+    """A noisy PNG of the given size, compressing roughly like a real render"""
+    gradient = Image.linear_gradient('L').resize(size)
+    noise = Image.blend(gradient, Image.effect_noise(size, 20), 0.2)
+    img = Image.merge('RGB', (noise, gradient.rotate(90), noise.transpose(Image.FLIP_LEFT_RIGHT)))
+    buffered = io.BytesIO()
+    img.save(buffered, format='PNG')
+    return buffered.getvalue()
+
+
+def old_path(data):
+    """What chat_endpoint used to do for every inline_data part"""
+    img = Image.open(io.BytesIO(data))
+    output_path = os.path.join(main.OUTPUT_DIR, "gen_old.png")
+    img.save(output_path)
+    buffered = io.BytesIO()
+    img.save(buffered, format="PNG")
+    img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    return {"type": "image", "content": f"data:image/png;base64,{img_str}", "path": output_path}
+
+
+def new_path(data, inline):
+    output_path, mime_type = main.save_generated_image(data, "image/png")
+    image_url = f"/outputs/{os.path.basename(output_path)}"
+    content = f"data:{mime_type};base64,{base64.b64encode(data).decode('utf-8')}" if inline else image_url
+    return {"type": "image", "content": content, "url": image_url, "mime_type": mime_type, "path": output_path}
+
+
+def measure(func, repeats):
+    cpu_start = time.process_time()
+    for _ in range(repeats):
+        part = func()
+    cpu_ms = (time.process_time() - cpu_start) / repeats * 1000
+    return cpu_ms, len(json.dumps({"parts": [part]}))
+
+
+def main_bench(repeats=5):
+    main.OUTPUT_DIR = tempfile.mkdtemp(prefix="bench_outputs_")
+
+    print(f"🖼  Generated image handling, {repeats} repeats each")
+    for label, size in (("1K", (1024, 1024)), ("4K", (4096, 4096))):
+        data = make_generated_png(size)
+        print(f"\n  {label} {size[0]}x{size[1]}, model PNG = {len(data) / 1024:.0f} KiB")
+        results = [
+            ("old (decode+2x PNG+b64)", measure(lambda: old_path(data), repeats)),
+            ("raw bytes + URL", measure(lambda: new_path(data, inline=False), repeats)),
+            ("raw bytes + inline b64", measure(lambda: new_path(data, inline=True), repeats)),
+        ]
+        baseline_cpu = results[0][1][0]
+        for name, (cpu_ms, size_bytes) in results:
+            print(f"    {name:<26} cpu={cpu_ms:9.2f}ms  ({baseline_cpu / max(cpu_ms, 1e-6):7.1f}x)  "
+                  f"response={size_bytes / 1024:9.1f} KiB")
+
+
+if __name__ == "__main__":
+    main_bench(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,14 @@
+"""
+Shared setup for the offline tests: the backend modules and the fake
+Gemini client are imported by name, and the operation journal goes to a
+temporary directory instead of back/.
+"""
+import os
+import sys
+import tempfile
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+sys.path.insert(0, TESTS_DIR)
+
+os.environ.setdefault("OPERATION_JOURNAL_PATH", os.path.join(tempfile.mkdtemp(prefix="journal_"), "video_operations.db"))
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Local fake Gemini client for offline tests and benchmarks.
+Mimics the parts of genai.Client used by main.py (chats, Files API, Veo
+generate_videos / operations, downloads), in process, with configurable
+latency and jitter, scripted or random failures and canned payloads.
+
+    main.client = FakeClient(latency=2.0, video_latency=30, failure_rate={'generate_videos': 0.05}, seed=1)
+"""
+import io
+import time
+import random
+import struct
+import uuid
+import asyncio
+import datetime
+from collections import defaultdict, deque
+
+import httpx
+from google.genai import errors, types
+from PIL import Image
+
+
+def make_png(size=(256, 256), color='orange'):
+    """Create PNG bytes for a canned generated image"""
+    img = Image.new('RGB', size, color=color)
+    buffered = io.BytesIO()
+    img.save(buffered, format='PNG')
+    return buffered.getvalue()
+
+
+def _box(kind, *parts):
+    payload = b"".join(parts)
+    return struct.pack(">I4s", len(payload) + 8, kind) + payload
+
+
+def _full_box(kind, body, version=0):
+    return _box(kind, struct.pack(">B3x", version), body)
+
+
+def _table(kind, fmt, rows):
+    return _full_box(kind, struct.pack(">I", len(rows)) + b"".join(struct.pack(fmt, *row) for row in rows))
+
+
+def make_mp4(seconds=1.0, tag=b"A", audio=True):
+    """
+    Small but well-formed progressive MP4 (moov after mdat, like a plain
+    encoder output): a 'vide' track at 25 fps with key frames every 12
+    samples and B-frame style composition offsets, plus an optional 'soun'
+    track. Sample payloads start with `tag` and their sample number.
+    """
+    tracks = [(b"vide", 12800, 512, int(seconds * 25), 5)]
+    if audio:
+        tracks.append((b"soun", 48000, 1024, int(seconds * 48000 / 1024), 9))
+
+    ftyp = _box(b"ftyp", b"isom", struct.pack(">I", 512), b"isomiso2avc1mp41")
+    data = bytearray()
+    layout = []  # per track: chunks of (offset in mdat data, sizes)
+    pending = [[] for _ in tracks]
+    counters = [0] * len(tracks)
+    while any(counters[t] < tracks[t][3] for t in range(len(tracks))):
+        for t, (handler, _, _, count, per_chunk) in enumerate(tracks):
+            n = min(per_chunk, count - counters[t])
+            if n <= 0:
+                continue
+            start = len(data)
+            sizes = []
+            for i in range(counters[t], counters[t] + n):
+                sample = tag + handler + struct.pack(">I", i) + bytes((i * 7 + t) % 256 for _ in range(40 + i % 9))
+                sizes.append(len(sample))
+                data += sample
+            pending[t].append((start, sizes))
+            counters[t] += n
+    layout = pending
+    data_offset = len(ftyp) + 8  # mdat comes right after ftyp
+
+    traks = []
+    for t, (handler, timescale, delta, count, _) in enumerate(tracks):
+        chunks = layout[t]
+        sizes = [size for _, chunk_sizes in chunks for size in chunk_sizes]
+        entry = _box(b"avc1" if handler == b"vide" else b"mp4a", bytes(6), struct.pack(">H", 1), b"fakecodecconfig!")
+        stbl = [
+            _full_box(b"stsd", struct.pack(">I", 1) + entry),
+            _table(b"stts", ">II", [(count, delta)]),
+        ]
+        if handler == b"vide":
+            stbl.append(_table(b"ctts", ">II", [(1, delta * (2 if i % 2 == 0 else 0)) for i in range(count)]))
+            stbl.append(_table(b"stss", ">I", [(i,) for i in range(1, count + 1, 12)]))
+        stbl.append(_full_box(b"stsz", struct.pack(f">II{len(sizes)}I", 0, len(sizes), *sizes)))
+        stbl.append(_table(b"stsc", ">III", [(1, len(chunks[0][1]), 1)] + (
+            [(len(chunks), len(chunks[-1][1]), 1)] if len(chunks) > 1 and len(chunks[-1][1]) != len(chunks[0][1]) else [])))
+        stbl.append(_table(b"stco", ">I", [(data_offset + offset,) for offset, _ in chunks]))
+        duration = count * delta
+        traks.append(_box(b"trak",
+            _full_box(b"tkhd", struct.pack(">IIIII", 0, 0, t + 1, 0, duration * 1000 // timescale) + bytes(60)),
+            _box(b"edts", _table(b"elst", ">IiI", [(duration * 1000 // timescale, 0, 0x10000)])),
+            _box(b"mdia",
+                _full_box(b"mdhd", struct.pack(">IIII", 0, 0, timescale, duration) + bytes(4)),
+                _full_box(b"hdlr", struct.pack(">I4s", 0, handler) + bytes(12) + b"fake\x00"),
+                _box(b"minf", _box(b"dinf"), _box(b"stbl", *stbl)))))
+    mvhd = _full_box(b"mvhd", struct.pack(">IIII", 0, 0, 1000, int(seconds * 1000)) + bytes(76) + struct.pack(">I", len(tracks) + 1))
+    return ftyp + struct.pack(">I4s", len(data) + 8, b"mdat") + bytes(data) + _box(b"moov", mvhd, *traks)
+
+
+def make_response(text="Here is your image", image_bytes=None):
+    """Build a real GenerateContentResponse with a text part and an image part"""
+    parts = [types.Part(text="thinking...", thought=True), types.Part(text=text)]
+    if image_bytes:
+        parts.append(types.Part(inline_data=types.Blob(data=image_bytes, mime_type='image/png')))
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role='model', parts=parts))]
+    )
+
+
+def make_chunk(parts):
+    """Wrap parts in a streaming GenerateContentResponse chunk"""
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role='model', parts=parts))]
+    )
+
+
+STATUS_NAMES = {429: 'RESOURCE_EXHAUSTED', 500: 'INTERNAL', 502: 'BAD_GATEWAY', 503: 'UNAVAILABLE',
+                504: 'DEADLINE_EXCEEDED', 400: 'INVALID_ARGUMENT'}
+
+
+def make_api_error(code, retry_after=None, retry_delay=None):
+    """Build the genai error the SDK raises for an HTTP error response"""
+    headers = {'retry-after': str(retry_after)} if retry_after is not None else {}
+    error = {'code': code, 'message': f'fake {code}', 'status': STATUS_NAMES.get(code, 'UNKNOWN')}
+    if retry_delay is not None:
+        error['details'] = [{'@type': 'type.googleapis.com/google.rpc.RetryInfo', 'retryDelay': f'{retry_delay}s'}]
+    cls = errors.ClientError if code < 500 else errors.ServerError
+    return cls(code, {'error': error}, httpx.Response(code, headers=headers))
+
+
+class FakeAsyncChat:
+    def __init__(self, client, model, config=None, history=None):
+        self._client = client
+        self._model = model
+        self._config = config
+        self._history = list(history or [])
+
+    async def send_message(self, message, config=None):
+        self._client.calls['send_message'] += 1
+        self._client.maybe_fail('send_message')
+        await asyncio.sleep(self._client.jitter(self._client.latency))
+        response = make_response(image_bytes=self._client.image_bytes)
+        self._history.append(types.Content(role='user', parts=[types.Part(text=str(message[0]) if isinstance(message, list) else str(message))]))
+        self._history.append(response.candidates[0].content)
+        return response
+
+    async def send_message_stream(self, message, config=None):
+        """Yield a text delta right away, then the image after the full latency"""
+        self._client.calls['send_message_stream'] += 1
+        response = make_response(image_bytes=self._client.image_bytes)
+        parts = response.candidates[0].content.parts
+        latency = self._client.jitter(self._client.latency)
+
+        async def chunks():
+            # Like the SDK, the request goes out on the first iteration
+            self._client.maybe_fail('send_message_stream')
+            await asyncio.sleep(latency * 0.1)
+            for part in parts[:-1]:
+                yield make_chunk([part])
+            await asyncio.sleep(latency * 0.9)
+            yield make_chunk(parts[-1:])
+
+        return chunks()
+
+    def get_history(self, curated=False):
+        return list(self._history)
+
+
+class FakeAsyncChats:
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, *, model, config=None, history=None):
+        return FakeAsyncChat(self._client, model, config, history)
+
+
+class FakeAsyncFiles:
+    """Files API stand-in: stores uploads in memory, files expire after file_ttl"""
+
+    def __init__(self, client):
+        self._client = client
+        self.uploaded = {}
+
+    async def upload(self, *, file, config=None):
+        self._client.calls['upload'] += 1
+        await asyncio.sleep(self._client.jitter(self._client.upload_latency))
+        self._client.maybe_fail('upload')
+        if self._client.fail_uploads:
+            raise RuntimeError("fake upload failure")
+        data = file.read() if hasattr(file, 'read') else open(file, 'rb').read()
+        name = f"files/{uuid.uuid4().hex[:12]}"
+        now = datetime.datetime.now(datetime.timezone.utc)
+        uploaded = types.File(
+            name=name,
+            uri=f"https://generativelanguage.googleapis.com/v1beta/{name}",
+            mime_type=getattr(config, 'mime_type', None) or 'application/octet-stream',
+            size_bytes=len(data),
+            create_time=now,
+            expiration_time=now + datetime.timedelta(seconds=self._client.file_ttl),
+            state='ACTIVE',
+        )
+        self.uploaded[name] = data
+        return uploaded
+
+
+class FakeAsyncModels:
+    """Veo stand-in: records submissions and returns pending operations"""
+
+    def __init__(self, client):
+        self._client = client
+        self.submissions = []
+
+    async def generate_videos(self, *, model, prompt=None, image=None, video=None, config=None):
+        self._client.calls['generate_videos'] += 1
+        self._client.maybe_fail('generate_videos')
+        if video is not None and not (isinstance(video, types.Video) and video.uri):
+            # Extensions only take videos Veo generated, by their upstream handle
+            raise make_api_error(400)
+        self.submissions.append({'model': model, 'prompt': prompt, 'image': image, 'video': video, 'config': config})
+        name = f"models/{model}/operations/{uuid.uuid4().hex[:12]}"
+        self._client.video_jobs[name] = time.monotonic() + self._client.jitter(self._client.video_latency)
+        if self._client.calls['generate_videos'] in self._client.failing_submissions:
+            self._client.failed_jobs.add(name)
+        if self._client.calls['generate_videos'] in self._client.filtered_submissions:
+            self._client.filtered_jobs.add(name)
+        return types.GenerateVideosOperation(name=name, done=False)
+
+
+class FakeAsyncOperations:
+    """Operations are done video_latency seconds (give or take the jitter) after submission"""
+
+    def __init__(self, client):
+        self._client = client
+
+    async def get(self, operation, config=None):
+        self._client.calls['operations_get'] += 1
+        self._client.maybe_fail('operations_get')
+        ready_at = self._client.video_jobs.get(operation.name)
+        if ready_at is None or time.monotonic() < ready_at:
+            return types.GenerateVideosOperation(name=operation.name, done=False)
+        if operation.name in self._client.failed_jobs:
+            return types.GenerateVideosOperation(name=operation.name, done=True,
+                                                 error={'code': 13, 'message': 'fake generation failure'})
+        if operation.name in self._client.filtered_jobs:
+            return types.GenerateVideosOperation(name=operation.name, done=True, response=types.GenerateVideosResponse(
+                rai_media_filtered_count=1, rai_media_filtered_reasons=['fake safety filter']))
+        # Like the Developer API: a handle to download, no inline bytes
+        video = types.Video(uri=f"https://generativelanguage.googleapis.com/v1beta/files/{operation.name.rsplit('/', 1)[-1]}:download",
+                            mime_type='video/mp4')
+        return types.GenerateVideosOperation(
+            name=operation.name,
+            done=True,
+            response=types.GenerateVideosResponse(generated_videos=[types.GeneratedVideo(video=video)]),
+        )
+
+
+class FakeFiles:
+    """Sync Files API, used to download generated videos"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def download(self, *, file, destination=None, config=None):
+        self._client.calls['download'] += 1
+        self._client.maybe_fail('download')
+        data = self._client.video_bytes or make_mp4(tag=(getattr(file, 'uri', None) or 'clip').encode()[-6:])
+        if destination is not None:
+            destination.write(data)
+        return data
+
+
+class FakeAio:
+    def __init__(self, client):
+        self.chats = FakeAsyncChats(client)
+        self.files = FakeAsyncFiles(client)
+        self.models = FakeAsyncModels(client)
+        self.operations = FakeAsyncOperations(client)
+
+
+class FakeClient:
+    """
+    Drop-in replacement for genai.Client.
+    latency / upload_latency / video_latency: seconds per chat turn, upload
+    and Veo job, each varied by +/- latency_jitter (a fraction).
+    failure_rate: probability that a call fails with one of failure_codes,
+    for every call kind or per kind ({'generate_videos': 0.1}).
+    image_bytes / video_bytes: canned payloads (default: a PNG of image_size
+    and a small MP4 per video). seed makes jitter and failures repeatable.
+    """
+
+    def __init__(self, latency=1.0, image_size=(256, 256), upload_latency=0.0, file_ttl=48 * 3600,
+                 video_latency=1.0, latency_jitter=0.0, failure_rate=0.0, failure_codes=(503,),
+                 image_bytes=None, video_bytes=None, seed=None):
+        self.latency = latency
+        self.video_latency = video_latency
+        self.latency_jitter = latency_jitter
+        self.failure_rate = failure_rate
+        self.failure_codes = tuple(failure_codes)
+        self.rng = random.Random(seed)
+        self.video_jobs = {}
+        self.failing_submissions = set()  # generate_videos call numbers (1-based) whose job ends in an error
+        self.failed_jobs = set()
+        self.filtered_submissions = set()  # ... whose job ends with its video removed by the safety filters
+        self.filtered_jobs = set()
+        self.upload_latency = upload_latency
+        self.file_ttl = file_ttl
+        self.fail_uploads = False
+        self.vertexai = False
+        self.image_bytes = image_bytes or (make_png(image_size) if image_size else None)
+        self.video_bytes = video_bytes
+        self.calls = {'send_message': 0, 'send_message_stream': 0, 'upload': 0, 'generate_videos': 0,
+                      'operations_get': 0, 'download': 0, 'failed': 0}
+        self.faults = defaultdict(deque)
+        self.aio = FakeAio(self)
+        self.files = FakeFiles(self)
+
+    def inject(self, call, *failures, retry_after=None, retry_delay=None):
+        """
+        Make the next calls of `call` fail, one failure per call, in order.
+        A failure is an HTTP status code (raised as the SDK's APIError) or an
+        exception instance (e.g. httpx.ConnectError).
+        """
+        for failure in failures:
+            if isinstance(failure, int):
+                failure = make_api_error(failure, retry_after=retry_after, retry_delay=retry_delay)
+            self.faults[call].append(failure)
+
+    def maybe_fail(self, call):
+        if self.faults[call]:
+            raise self.faults[call].popleft()
+        rate = self.failure_rate.get(call, 0.0) if isinstance(self.failure_rate, dict) else self.failure_rate
+        if rate and self.rng.random() < rate:
+            self.calls['failed'] += 1
+            raise make_api_error(self.rng.choice(self.failure_codes))
+
+    def jitter(self, seconds):
+        """A latency varied by +/- latency_jitter"""
+        if not self.latency_jitter or not seconds:
+            return seconds
+        return max(0.0, seconds * (1 + self.rng.uniform(-self.latency_jitter, self.latency_jitter)))
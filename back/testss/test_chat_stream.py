@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaming chat endpoint (/api/chat/stream) against the fake
+Gemini client. Runs offline (no server, no API key).
+
+Usage: cd back && python -m pytest testss/test_chat_stream.py
+"""
+import json
+import asyncio
+import tempfile
+import dataclasses
+
+import main
+import retry
+from concurrency import ENDPOINT_LIMITS, get_limiter
+from fake_gemini import FakeClient
+
+main.OUTPUT_DIR = tempfile.mkdtemp(prefix="chat_stream_test_")
+retry.gemini_retry = retry.RetryLayer({
+    kind: dataclasses.replace(policy, rate_per_minute=0) for kind, policy in retry.RETRY_POLICIES.items()
+})
+
+
+async def open_stream(message="draw a cat", **fields):
+    """Body iterator of a /api/chat/stream response, as the server would write it"""
+    form = {"files": None, "session_id": None, "inline_images": None, "cache": None, **fields}
+    response = await main.chat_stream_endpoint(message=message, **form)
+    return response.body_iterator
+
+
+async def read_events(body):
+    """(event, data) pairs of a whole stream"""
+    events = []
+    async for message in body:
+        fields = dict(line.split(": ", 1) for line in message.strip().splitlines())
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def test_events_in_order_without_thoughts():
+    async def run():
+        main.client = FakeClient(latency=0.05)
+        events = await read_events(await open_stream(cache="bypass"))
+        assert [event for event, _ in events] == ["session", "text", "image", "done"]
+        session_id = events[0][1]['session_id']
+        assert session_id and events[-1][1] == {"session_id": session_id}
+        # The model's thought part is not sent, only its answer
+        assert events[1][1]['content'] == "Here is your image"
+        assert events[2][1]['url'].startswith("/outputs/")
+
+        # The next turn continues the same session
+        follow_up = await read_events(await open_stream("now a dog", session_id=session_id))
+        assert follow_up[0][1]['session_id'] == session_id
+
+    asyncio.run(run())
+
+
+def test_upstream_failure_ends_with_an_error_event():
+    async def run():
+        main.client = FakeClient(latency=0.05)
+        main.client.inject('send_message_stream', 400)
+        events = await read_events(await open_stream(cache="bypass"))
+        assert [event for event, _ in events] == ["session", "error"]
+        assert events[1][1]['content'].startswith("Error: ")
+        assert get_limiter("chat")._value == ENDPOINT_LIMITS["chat"]
+
+    asyncio.run(run())
+
+
+def test_slow_reader_does_not_hold_a_chat_slot():
+    async def run():
+        main.client = FakeClient(latency=0.05)
+        body = await open_stream()
+        assert "event: session" in await body.__anext__()
+        assert "event: text" in await body.__anext__()
+
+        # The answer is done upstream while the client has not read it yet
+        await asyncio.sleep(0.2)
+        assert get_limiter("chat")._value == ENDPOINT_LIMITS["chat"]
+        rest = [event async for event in body]
+        assert "event: image" in rest[0] and "event: done" in rest[-1]
+
+    asyncio.run(run())
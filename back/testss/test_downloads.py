@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Tests for streaming generated videos to disk against the fake Gemini client.
+Runs offline (no server, no API key).
+
+Usage: cd back && python -m pytest testss/test_downloads.py
+"""
+import os
+import tempfile
+
+import pytest
+from google.genai import errors, types
+
+from downloads import download_to_file
+from fake_gemini import FakeClient
+
+VIDEO = types.Video(uri="https://generativelanguage.googleapis.com/v1beta/files/abc:download", mime_type="video/mp4")
+
+
+def test_download_replaces_the_file_in_one_step():
+    output_dir = tempfile.mkdtemp(prefix="downloads_test_")
+    client = FakeClient(video_bytes=b"new video")
+    path = os.path.join(output_dir, "video.mp4")
+    with open(path, "wb") as f:
+        f.write(b"old video")
+
+    assert download_to_file(client, VIDEO, output_dir, "video.mp4") == path
+    assert open(path, "rb").read() == b"new video"
+    assert os.listdir(output_dir) == ["video.mp4"]  # no .part file left behind
+
+    # Bytes inlined in the operation response are written without a download
+    inline = types.Video(video_bytes=b"inline video", mime_type="video/mp4")
+    download_to_file(client, inline, output_dir, "inline.mp4")
+    assert open(os.path.join(output_dir, "inline.mp4"), "rb").read() == b"inline video"
+    assert client.calls['download'] == 1
+
+
+def test_failed_download_leaves_no_partial_file():
+    output_dir = tempfile.mkdtemp(prefix="downloads_test_")
+    client = FakeClient(video_bytes=b"new video")
+    path = os.path.join(output_dir, "video.mp4")
+    with open(path, "wb") as f:
+        f.write(b"old video")
+
+    client.inject('download', 404)
+    with pytest.raises(errors.ClientError):
+        download_to_file(client, VIDEO, output_dir, "video.mp4")
+    assert os.listdir(output_dir) == ["video.mp4"]
+    assert open(path, "rb").read() == b"old video"
+
+    # Failing halfway through the write is cleaned up the same way
+    def broken_download(*, file, destination=None, config=None):
+        destination.write(b"half a vid")
+        raise ConnectionError("connection reset")
+
+    client.files.download = broken_download
+    with pytest.raises(ConnectionError):
+        download_to_file(client, VIDEO, output_dir, "fresh.mp4")
+    assert os.listdir(output_dir) == ["video.mp4"]
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Tests for video operation events: the in-process pub/sub and the
+Server-Sent Events stream of one operation. Runs offline.
+
+Usage: cd back && python -m pytest testss/test_events.py
+"""
+import json
+import asyncio
+
+import events
+from events import OperationEvents, stream_operation_events
+
+
+def test_slow_subscriber_keeps_the_newest_events():
+    async def run():
+        hub = OperationEvents(max_queue_size=2)
+        hub.publish("op", {"status": "pending"})  # nobody listening: dropped
+        queue = hub.subscribe("op")
+        for progress in (1, 2, 3):
+            hub.publish("op", {"status": "pending", "progress": progress})
+        assert [queue.get_nowait()["progress"] for _ in range(queue.qsize())] == [2, 3]
+
+        hub.unsubscribe("op", queue)
+        assert hub.subscriber_count() == 0 and "op" not in hub._subscribers
+
+    asyncio.run(run())
+
+
+def test_stream_closes_on_a_terminal_status(monkeypatch):
+    monkeypatch.setattr(events, "KEEPALIVE_INTERVAL", 0.05)
+
+    async def run():
+        hub = OperationEvents()
+        stream = stream_operation_events(hub, "op", lambda: {"operation_id": "op", "status": "pending"})
+        assert await stream.__anext__() == 'event: snapshot\ndata: {"operation_id": "op", "status": "pending"}\n\n'
+        assert hub.subscriber_count("op") == 1
+
+        # Idle streams get keep-alive comments
+        assert await stream.__anext__() == ": keep-alive\n\n"
+
+        hub.publish("op", {"event": "progress", "status": "pending"})
+        hub.publish("op", {"event": "completed", "status": "completed"})
+        hub.publish("op", {"event": "late", "status": "completed"})
+        messages = [message async for message in stream]
+        assert [message.split("\n")[0] for message in messages] == ["event: progress", "event: completed"]
+        assert json.loads(messages[-1].split("data: ")[1])["status"] == "completed"
+        assert hub.subscriber_count() == 0
+
+        # An operation that already finished only gets its snapshot
+        finished = stream_operation_events(hub, "done", lambda: {"status": "error"})
+        assert [message async for message in finished] == ['event: snapshot\ndata: {"status": "error"}\n\n']
+        assert hub.subscriber_count() == 0
+
+    asyncio.run(run())
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Tests for the expiry index, expiring registries and the background reaper.
+Runs offline (no server, no API key).
+
+Usage: cd back && python -m pytest testss/test_expiry.py
+"""
+import asyncio
+
+from expiry import ExpiryIndex, ExpiringRegistry, Reaper
+
+
+def test_index_order_and_stale_entries():
+    index = ExpiryIndex()
+    index.schedule("c", 30)
+    index.schedule("a", 10)
+    index.schedule("b", 20)
+    index.schedule("a", 40)   # moved: its old (10) heap entry is stale
+    index.schedule("d", 5)
+    index.discard("d")        # removed: its heap entry is stale too
+
+    assert index.pop_expired(now=15) == []
+    assert index.pop_expired(now=35) == ["b", "c"]
+    assert "a" in index and index.deadline("a") == 40
+    assert index.pop_expired(now=100) == ["a"]
+    assert len(index) == 0
+
+    # Rescheduling the same keys over and over keeps the heap compact
+    for i in range(1000):
+        index.schedule(i % 10, 1000 + i)
+    assert len(index) == 10 and len(index._heap) <= 2 * 10 + 64
+    assert sorted(index.pop_expired(now=10 ** 6)) == list(range(10))
+
+
+def test_registry_expires_finished_records_only():
+    registry = ExpiringRegistry(100, timestamp_key='completed_at',
+                                expires=lambda record: record['status'] == 'completed')
+    registry['running'] = {'status': 'processing'}
+    registry['done'] = {'status': 'completed', 'completed_at': 1}
+    assert [key for key, _ in registry.pop_expired(now=10 ** 9)] == ['done']
+
+    # Finishing starts the countdown, a later status change restarts or stops it
+    registry['running']['status'] = 'completed'
+    registry.touch('running', now=1000)
+    assert registry.pop_expired(now=1050) == []
+    registry.touch('running', now=1080)
+    assert registry.pop_expired(now=1150) == []
+    registry['running']['status'] = 'processing'  # resumed
+    registry.touch('running')
+    assert registry.pop_expired(now=10 ** 12) == []
+    assert 'running' in registry
+
+    # Records removed directly never come back from the index
+    registry['gone'] = {'status': 'completed', 'completed_at': 1}
+    del registry['gone']
+    assert registry.pop_expired(now=10 ** 12) == []
+
+
+def test_failing_reaper_job_does_not_stop_the_others():
+    async def run():
+        runs = []
+
+        async def broken():
+            runs.append('broken')
+            raise RuntimeError("cleanup failed")
+
+        async def healthy():
+            runs.append('healthy')
+
+        reaper = Reaper(interval=0.01)
+        reaper.add_job("broken", broken)
+        reaper.add_job("healthy", healthy)
+        reaper.start()
+        await asyncio.sleep(0.1)
+        await reaper.stop()
+        assert runs.count('healthy') >= 2
+        assert runs.count('broken') == runs.count('healthy')
+
+    asyncio.run(run())
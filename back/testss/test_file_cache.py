@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Tests for the Gemini Files API reuse cache, against the local fake Files API.
+Runs offline (no server, no API key).
+
+Usage: cd back && python -m pytest testss/test_file_cache.py
+"""
+import asyncio
+
+from file_cache import FileCache
+from upload_store import content_digest
+from fake_gemini import FakeClient, make_png
+
+
+def test_repeat_reference_uploads_once():
+    """The same image bytes are uploaded once and then served from the cache"""
+    async def run():
+        client = FakeClient(latency=0)
+        cache = FileCache(client)
+        data = make_png((64, 64), color='red')
+        digest = content_digest(data)
+
+        first = await cache.get_or_upload(digest, data, 'image/png')
+        second = await cache.get_or_upload(digest, data, 'image/png')
+        assert first.uri == second.uri
+        assert client.calls['upload'] == 1
+        assert cache.hits == 1
+
+        other = make_png((64, 64), color='blue')
+        third = await cache.get_or_upload(content_digest(other), other, 'image/png')
+        assert third.uri != first.uri
+        assert client.calls['upload'] == 2
+        assert client.aio.files.uploaded[first.name] == data
+
+    asyncio.run(run())
+
+
+def test_concurrent_requests_share_one_upload():
+    async def run():
+        client = FakeClient(latency=0, upload_latency=0.05)
+        cache = FileCache(client)
+        data = make_png((64, 64))
+        digest = content_digest(data)
+
+        files = await asyncio.gather(*(cache.get_or_upload(digest, data, 'image/png') for _ in range(10)))
+        assert len({f.uri for f in files}) == 1
+        assert client.calls['upload'] == 1
+
+    asyncio.run(run())
+
+
+def test_expiring_files_are_uploaded_again():
+    """Handles are dropped expiry_margin seconds before the upstream file expires"""
+    async def run():
+        client = FakeClient(latency=0, file_ttl=0.2)
+        cache = FileCache(client, expiry_margin=0.1)
+        data = make_png((64, 64))
+        digest = content_digest(data)
+
+        first = await cache.get_or_upload(digest, data, 'image/png')
+        await asyncio.sleep(0.15)
+        assert cache.get(digest) is None
+        second = await cache.get_or_upload(digest, data, 'image/png')
+        assert second.uri != first.uri
+        assert client.calls['upload'] == 2
+
+        # Files already within the margin are never cached
+        client.file_ttl = 0.05
+        cache.discard(digest)
+        await cache.get_or_upload(digest, data, 'image/png')
+        assert len(cache) == 0
+
+    asyncio.run(run())
+
+
+def test_failed_upload_is_not_cached():
+    async def run():
+        client = FakeClient(latency=0)
+        cache = FileCache(client)
+        data = make_png((64, 64))
+        digest = content_digest(data)
+
+        client.fail_uploads = True
+        try:
+            await cache.get_or_upload(digest, data, 'image/png')
+            assert False, "upload failure should propagate"
+        except RuntimeError:
+            pass
+        assert len(cache) == 0
+
+        client.fail_uploads = False
+        await cache.get_or_upload(digest, data, 'image/png')
+        assert len(cache) == 1
+
+    asyncio.run(run())
+
+
+def test_lru_bound():
+    async def run():
+        client = FakeClient(latency=0)
+        cache = FileCache(client, max_entries=2)
+        images = [make_png((32, 32), color=color) for color in ('red', 'green', 'blue')]
+        for data in images:
+            await cache.get_or_upload(content_digest(data), data, 'image/png')
+        assert len(cache) == 2
+        assert cache.get(content_digest(images[0])) is None
+
+    asyncio.run(run())
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Tests for upload image ingestion (validation limits, oversized request
+bodies, downscaling).
+Runs offline.
+
+Usage: cd back && python -m pytest testss/test_image_ingest.py
+"""
+import io
+import asyncio
+import hashlib
+import tempfile
+
+import httpx
+from fastapi import FastAPI, File, UploadFile
+from PIL import Image
+import image_ingest
+from image_ingest import InvalidImage, UploadLimitMiddleware, inspect_image, normalize_image, scan_upload
+
+
+def encode(size, format='JPEG', mode='RGB'):
+    buffered = io.BytesIO()
+    Image.new(mode, size, color='teal' if mode == 'RGB' else (0, 128, 128, 128)).save(buffered, format=format)
+    return buffered.getvalue()
+
+
+def expect_invalid(data, status_code):
+    try:
+        inspect_image(data)
+    except InvalidImage as e:
+        assert e.status_code == status_code, e.status_code
+        return
+    assert False, "image should have been rejected"
+
+
+def test_small_images_pass_through_unchanged():
+    for format, mime_type in (('JPEG', 'image/jpeg'), ('PNG', 'image/png'), ('WEBP', 'image/webp')):
+        data = encode((640, 480), format)
+        assert normalize_image(data) == (data, mime_type)
+
+
+def test_large_photo_is_downscaled_to_max_side():
+    data = encode((6000, 4000))
+    normalized, mime_type = normalize_image(data, max_side=2048)
+    assert mime_type == 'image/jpeg'
+    with Image.open(io.BytesIO(normalized)) as image:
+        assert max(image.size) == 2048
+        assert image.size == (2048, 1365)
+
+
+def test_alpha_is_kept_as_png_and_other_formats_are_converted():
+    normalized, mime_type = normalize_image(encode((3000, 1000), 'PNG', 'RGBA'), max_side=1000)
+    assert mime_type == 'image/png'
+    normalized, mime_type = normalize_image(encode((64, 64), 'BMP'))
+    assert mime_type == 'image/jpeg'
+
+
+def test_limits_are_checked_from_the_header():
+    expect_invalid(b'not an image', 400)
+    expect_invalid(encode((64, 64), 'ICO'), 400)
+
+    old_pixels, old_bytes = image_ingest.INPUT_IMAGE_MAX_PIXELS, image_ingest.UPLOAD_MAX_BYTES
+    try:
+        image_ingest.INPUT_IMAGE_MAX_PIXELS = 1000 * 1000
+        expect_invalid(encode((1001, 1000), 'PNG'), 413)
+        image_ingest.UPLOAD_MAX_BYTES = 100
+        expect_invalid(encode((64, 64), 'PNG'), 413)
+    finally:
+        image_ingest.INPUT_IMAGE_MAX_PIXELS, image_ingest.UPLOAD_MAX_BYTES = old_pixels, old_bytes
+
+
+def test_uploads_are_scanned_and_normalized_from_files():
+    data = encode((3000, 2000))
+    with tempfile.SpooledTemporaryFile(max_size=1024) as upload:
+        upload.write(data)
+        assert scan_upload(upload) == (hashlib.sha256(data).hexdigest(), len(data))
+        assert normalize_image(upload, max_side=4096) == (data, 'image/jpeg')
+        normalized, _ = normalize_image(upload, max_side=1000)
+        with Image.open(io.BytesIO(normalized)) as image:
+            assert image.size == (1000, 667)
+
+    old_bytes = image_ingest.UPLOAD_MAX_BYTES
+    try:
+        image_ingest.UPLOAD_MAX_BYTES = len(data) - 1
+        with tempfile.TemporaryFile() as upload:
+            upload.write(data)
+            try:
+                scan_upload(upload)
+                assert False, "oversized upload should have been rejected"
+            except InvalidImage as e:
+                assert e.status_code == 413
+    finally:
+        image_ingest.UPLOAD_MAX_BYTES = old_bytes
+
+
+def test_oversized_request_is_refused_while_received():
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": file.size}
+
+    app.add_middleware(UploadLimitMiddleware, max_bytes=1024 ** 2)
+    chunk, chunks = b"x" * 64 * 1024, 64  # a 4 MB file
+    sent = 0
+
+    async def chunked_body():
+        # No Content-Length: only counting the body can stop it
+        nonlocal sent
+        yield b'--b\r\nContent-Disposition: form-data; name="file"; filename="a.png"\r\n\r\n'
+        for _ in range(chunks):
+            sent += 1
+            yield chunk
+        yield b"\r\n--b--\r\n"
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            small = await http.post("/upload", files={"file": ("a.png", b"x" * 1000)})
+            assert small.status_code == 200 and small.json() == {"size": 1000}
+
+            # Refused from Content-Length, or after a little more than the limit
+            declared = await http.post("/upload", files={"file": ("a.png", b"x" * 2 * 1024 ** 2)})
+            assert declared.status_code == 413
+            streamed = await http.post("/upload", content=chunked_body(),
+                                       headers={"Content-Type": "multipart/form-data; boundary=b"})
+            assert streamed.status_code == 413, streamed.text
+            assert streamed.json()['detail'] == "Upload is larger than 1 MB"
+            assert sent * len(chunk) <= 1024 ** 2 + len(chunk)
+
+    asyncio.run(run())
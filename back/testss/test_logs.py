@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tests for the structured logging (JSON records, correlation IDs, sampling,
+non-blocking queue) and for tracing one operation_id through the long video
+pipeline. Runs offline (no server, no API key).
+
+Usage: cd back && python -m pytest testss/test_logs.py
+"""
+import json
+import queue
+import asyncio
+import logging
+import tempfile
+import dataclasses
+
+import httpx
+import concurrency
+import logs
+import main
+import polling
+import retry
+from logs import ContextQueueHandler, JsonFormatter, StructuredLogger, log_context
+from fake_gemini import FakeClient
+
+TEST_DIR = tempfile.mkdtemp(prefix="logs_test_")
+
+
+class captured_records:
+    """Collect app log records (as the writer thread would receive them) for a block"""
+
+    def __init__(self, maxsize: int = 0):
+        self.queue = queue.Queue(maxsize)
+        self.handler = ContextQueueHandler(self.queue)
+
+    def __enter__(self):
+        logging.getLogger(logs.ROOT_LOGGER).addHandler(self.handler)
+        return self
+
+    def __exit__(self, *exc):
+        logging.getLogger(logs.ROOT_LOGGER).removeHandler(self.handler)
+
+    def json(self):
+        formatter = JsonFormatter()
+        lines = []
+        while not self.queue.empty():
+            lines.append(json.loads(formatter.format(self.queue.get_nowait())))
+        return lines
+
+
+def test_json_records_carry_correlation_ids():
+    log = logs.get_logger("test")
+    with captured_records() as captured:
+        with log_context(request_id="req-1", session_id="s1"):
+            log.info("Something happened to %s", "x", segment_index=2)
+            try:
+                raise ValueError("boom")
+            except ValueError:
+                log.exception("It failed")
+        log.info("Outside")
+
+    first, failure, outside = captured.json()
+    assert first['msg'] == "Something happened to x" and first['level'] == "INFO"
+    assert first['request_id'] == "req-1" and first['session_id'] == "s1"
+    assert first['segment_index'] == 2 and first['logger'] == "app.test"
+    assert "ValueError: boom" in failure['exc']
+    assert 'request_id' not in outside
+
+
+def test_sampling_levels_and_full_queue():
+    log = StructuredLogger(logging.getLogger("app.sampled"))
+    with captured_records(maxsize=5) as captured:
+        logs.LOG_SAMPLE_RATE, rate = 0.0, logs.LOG_SAMPLE_RATE
+        try:
+            log.info("never kept", sampled=True)
+        finally:
+            logs.LOG_SAMPLE_RATE = rate
+        log.debug("below the level")  # app logger is at INFO
+        for i in range(10):
+            log.info("burst", i=i)  # the caller never waits on a full queue
+        assert captured.handler.dropped == 5
+        assert [r['i'] for r in captured.json()] == [0, 1, 2, 3, 4]
+
+
+def test_operation_traced_through_long_video():
+    polling.POLL_INITIAL_INTERVAL = 0.01
+    polling.POLL_MAX_INTERVAL = 0.02
+    main.OUTPUT_DIR = TEST_DIR
+    retry.gemini_retry = retry.RetryLayer({
+        kind: dataclasses.replace(policy, rate_per_minute=0) for kind, policy in retry.RETRY_POLICIES.items()
+    })
+    prompt = "a secret walk through the old harbour"
+
+    async def run():
+        main.client = FakeClient(latency=0, video_latency=0.02)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as http:
+            response = await http.post("/api/video_chat/generate_long", json={"prompt": prompt, "duration": 15},
+                                       headers={"X-Request-ID": "trace-me"})
+            assert response.headers['x-request-id'] == "trace-me"
+            operation_id = response.json()['operation_id']
+            for _ in range(500):
+                status = (await http.post("/api/video_chat/status", json={"operation_id": operation_id})).json()
+                if status['status'] in ('completed', 'error'):
+                    break
+                await asyncio.sleep(0.01)
+            assert status['status'] == 'completed', status
+            # The pipeline logs its last line after publishing the status
+            await asyncio.gather(*concurrency._tasks)
+            return operation_id
+
+    with captured_records() as captured:
+        operation_id = asyncio.run(run())
+    records = captured.json()
+
+    trace = [r['msg'] for r in records if r.get('operation_id') == operation_id]
+    assert trace == ["Long video requested", "Segment started", "Segment completed",
+                     "Segment started", "Segment completed", "Long video completed"], trace
+    assert all(r.get('request_id') == "trace-me" for r in records if r.get('operation_id') == operation_id)
+    assert not any(prompt in json.dumps(r) for r in records)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Tests for the checkpointed long video pipeline (segment retries and /resume),
+against the fake Gemini client. Runs offline (no server, no API key).
+
+Usage: cd back && python -m pytest testss/test_long_video.py
+"""
+import os
+import time
+import asyncio
+import tempfile
+import dataclasses
+
+import httpx
+import main
+import polling
+import retry
+from fake_gemini import FakeClient
+from mp4_concat import read_movie
+
+TEST_DIR = tempfile.mkdtemp(prefix="long_video_test_")
+
+polling.POLL_INITIAL_INTERVAL = 0.01
+polling.POLL_MAX_INTERVAL = 0.02
+main.LONG_VIDEO_RETRY_DELAY = 0
+main.OUTPUT_DIR = TEST_DIR
+# No client-side rate limits (the Veo default would throttle the second test)
+retry.gemini_retry = retry.RetryLayer({
+    kind: dataclasses.replace(policy, rate_per_minute=0) for kind, policy in retry.RETRY_POLICIES.items()
+})
+
+
+async def wait_for_status(http, operation_id, statuses=('completed', 'error')):
+    for _ in range(500):
+        response = await http.post("/api/video_chat/status", json={"operation_id": operation_id})
+        data = response.json()
+        if data['status'] in statuses:
+            return data
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"operation stuck in {data['status']}")
+
+
+def run_with_client(scenario, attempts=3, video_latency=0.02):
+    async def run():
+        main.client = FakeClient(latency=0, video_latency=video_latency)
+        main.LONG_VIDEO_SEGMENT_ATTEMPTS = attempts
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as http:
+            await scenario(http, main.client)
+    asyncio.run(run())
+
+
+def test_failed_segment_is_retried_alone():
+    async def scenario(http, client):
+        client.failing_submissions = {2}  # the first attempt at segment 2 fails
+        response = await http.post("/api/video_chat/generate_long", json={"prompt": "a long walk", "duration": 22})
+        operation_id = response.json()['operation_id']
+
+        data = await wait_for_status(http, operation_id)
+        assert data['status'] == 'completed', data
+        record = main.video_operations[operation_id]
+        assert [c['segment_index'] for c in record['checkpoints']] == [0, 1, 2]
+        assert client.calls['generate_videos'] == 4  # 3 segments + 1 retry
+
+        # Segments are chained by upstream handle; only the final video is downloaded
+        submissions = client.aio.models.submissions
+        assert submissions[0]['video'] is None
+        assert submissions[-1]['video'].uri == record['checkpoints'][1]['video']['uri']
+        assert [c['video_path'] for c in record['checkpoints'][:2]] == [None, None]
+        assert os.path.exists(data['video_path'])
+        assert client.calls['download'] == 1
+
+    run_with_client(scenario)
+
+
+def test_submitted_segment_is_polled_again_not_resubmitted():
+    async def scenario(http, client):
+        # Errors the retry layer gives up on at once: a failed status check, then a failed download
+        client.inject('operations_get', 400)
+        client.inject('download', 404)
+        response = await http.post("/api/video_chat/generate_long", json={"prompt": "a long walk", "duration": 15})
+        operation_id = response.json()['operation_id']
+
+        data = await wait_for_status(http, operation_id)
+        assert data['status'] == 'completed', data
+        assert client.calls['generate_videos'] == 2  # one job per segment, each kept across its retries
+        assert client.calls['download'] == 2
+        assert os.path.exists(data['video_path'])
+
+    run_with_client(scenario)
+
+
+def test_filtered_segment_is_submitted_again():
+    async def scenario(http, client):
+        client.filtered_submissions = {1}
+        response = await http.post("/api/video_chat/generate_long", json={"prompt": "a long walk", "duration": 15})
+        data = await wait_for_status(http, response.json()['operation_id'])
+        assert data['status'] == 'completed', data
+        assert client.calls['generate_videos'] == 3  # 2 segments + the filtered one again
+
+    run_with_client(scenario)
+
+
+def test_intermediate_segments_can_be_kept():
+    async def scenario(http, client):
+        main.LONG_VIDEO_SAVE_SEGMENTS = True
+        try:
+            response = await http.post("/api/video_chat/generate_long", json={"prompt": "a long walk", "duration": 15})
+            data = await wait_for_status(http, response.json()['operation_id'])
+        finally:
+            main.LONG_VIDEO_SAVE_SEGMENTS = False
+        assert data['status'] == 'completed', data
+        record = main.video_operations[data['operation_id']]
+        assert all(os.path.exists(c['video_path']) for c in record['checkpoints'])
+        assert client.calls['download'] == 2
+
+    run_with_client(scenario)
+
+
+def test_resume_continues_from_last_checkpoint():
+    async def scenario(http, client):
+        client.failing_submissions = {3}  # segment 3 fails and retries are off
+        response = await http.post("/api/video_chat/generate_long", json={
+            "prompt": "a long walk", "duration": 22, "extension_prompts": ["turn left", "turn right"],
+        })
+        operation_id = response.json()['operation_id']
+
+        data = await wait_for_status(http, operation_id)
+        assert data['status'] == 'error' and data['resumable'] and data['failed_segment'] == 2
+        assert len(main.video_operations[operation_id]['checkpoints']) == 2
+
+        # Once running again it cannot be resumed a second time
+        resumed = await http.post("/api/video_chat/resume", json={"operation_id": operation_id})
+        assert resumed.status_code == 200 and resumed.json()['resumed_from_segment'] == 2
+        again = await http.post("/api/video_chat/resume", json={"operation_id": operation_id})
+        assert again.status_code == 409
+
+        data = await wait_for_status(http, operation_id)
+        assert data['status'] == 'completed', data
+        prompts = [s['prompt'] for s in client.aio.models.submissions]
+        assert prompts == ["a long walk", "turn left", "turn right", "turn right"]
+        assert data['video_path'] == main.video_operations[operation_id]['checkpoints'][-1]['video_path']
+
+        missing = await http.post("/api/video_chat/resume", json={"operation_id": "nope"})
+        assert missing.status_code == 404
+
+    run_with_client(scenario, attempts=1)
+
+
+def test_storyboard_shots():
+    assert main.calculate_storyboard_shots(40, 6) == [8, 8, 6, 6, 6, 6]
+    assert main.calculate_storyboard_shots(22) == [8, 8, 6]
+    assert main.calculate_storyboard_shots(16) == [8, 8]
+    assert main.calculate_storyboard_shots(8, 3) == [4, 4, 4]  # rounded up to 4s shots
+
+
+def test_storyboard_shots_run_in_parallel():
+    """A 6-shot storyboard takes about one shot's latency, not six"""
+    latency = 0.3
+
+    async def scenario(http, client):
+        started = time.monotonic()
+        response = await http.post("/api/video_chat/generate_long", json={
+            "prompt": "shot one", "duration": 40, "mode": "storyboard",
+            "extension_prompts": ["shot two", "shot three", "shot four", "shot five", "shot six"],
+        })
+        assert response.json()['segments'] == [8, 8, 6, 6, 6, 6]
+        data = await wait_for_status(http, response.json()['operation_id'])
+        elapsed = time.monotonic() - started
+        assert data['status'] == 'completed', data
+        assert elapsed < 3 * latency, f"{elapsed:.2f}s"
+
+        # Shots are joined in storyboard order, and their clips removed
+        prompts = [s['prompt'] for s in client.aio.models.submissions]
+        assert sorted(prompts) == sorted(["shot one", "shot two", "shot three", "shot four", "shot five", "shot six"])
+        _, _, tracks = read_movie(data['video_path'])
+        assert len(tracks[0].deltas) == 6 * 25
+        record = main.video_operations[data['operation_id']]
+        assert all(c['video_path'] is None for c in record['checkpoints'])
+
+    run_with_client(scenario, video_latency=latency)
+
+
+def test_storyboard_resume_regenerates_only_failed_shots():
+    async def scenario(http, client):
+        client.failing_submissions = {2}
+        response = await http.post("/api/video_chat/generate_long", json={
+            "prompt": "shot one", "duration": 24, "mode": "storyboard", "session_id": "s1",
+        })
+        operation_id = response.json()['operation_id']
+        data = await wait_for_status(http, operation_id)
+        assert data['status'] == 'error' and data['resumable'], data
+        assert len(main.video_operations[operation_id]['checkpoints']) == 2
+
+        resumed = await http.post("/api/video_chat/resume", json={"operation_id": operation_id})
+        assert resumed.status_code == 200
+        data = await wait_for_status(http, operation_id)
+        assert data['status'] == 'completed', data
+        assert client.calls['generate_videos'] == 4
+
+    run_with_client(scenario, attempts=1)
+
+
+def test_storyboard_shot_retry_keeps_its_job_and_frees_its_slot():
+    async def scenario(http, client):
+        client.inject('download', 404)
+        retries = []
+        notify_operation = main.notify_operation
+
+        async def recording_notify(operation_id, event_type, **fields):
+            if event_type == 'segment_retry':
+                job_id = main.storyboard_job_id(operation_id, fields['segment_index'])
+                retries.append(main.video_scheduler.is_running(job_id))
+            await notify_operation(operation_id, event_type, **fields)
+
+        main.notify_operation = recording_notify
+        try:
+            response = await http.post("/api/video_chat/generate_long", json={
+                "prompt": "shot one", "duration": 16, "mode": "storyboard",
+            })
+            data = await wait_for_status(http, response.json()['operation_id'])
+        finally:
+            main.notify_operation = notify_operation
+        assert data['status'] == 'completed', data
+        assert retries == [False]  # not holding a slot while backing off
+        assert client.calls['generate_videos'] == 2  # the shot's job was downloaded again, not resubmitted
+        assert client.calls['download'] == 3
+
+    run_with_client(scenario)
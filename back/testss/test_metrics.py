@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Tests for the Prometheus metrics (exposition format, instrumentation, the
+/metrics endpoint) and the event loop watchdog. Runs offline (no server,
+no API key).
+
+Usage: cd back && python -m pytest testss/test_metrics.py
+"""
+import time
+import types
+import asyncio
+
+import httpx
+import main
+import retry
+from metrics import (
+    Registry, LoopLagMonitor, LoopWatchdog, EVENT_LOOP_BLOCKED, EVENT_LOOP_LAG_SECONDS, GEMINI_CALL_SECONDS,
+)
+from fake_gemini import FakeClient
+
+
+def test_exposition_format():
+    registry = Registry()
+    counter = registry.counter("demo_total", "A counter", ["kind"])
+    histogram = registry.histogram("demo_seconds", "A histogram", ["step"], buckets=(0.1, 1.0))
+    registry.gauge("demo_items", "A gauge", ["status"], collect=lambda: {("ok",): 3, ('say "hi"',): 1})
+
+    counter.inc(kind="a")
+    counter.inc(2, kind="a")
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, step="x")
+
+    text = registry.render()
+    assert '# TYPE demo_total counter' in text
+    assert 'demo_total{kind="a"} 3' in text
+    assert 'demo_seconds_bucket{step="x",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{step="x",le="1"} 2' in text
+    assert 'demo_seconds_bucket{step="x",le="+Inf"} 3' in text
+    assert 'demo_seconds_count{step="x"} 3' in text
+    assert 'demo_items{status="say \\"hi\\""} 1' in text
+    try:
+        counter.inc(other="a")
+        assert False, "unknown labels should be rejected"
+    except ValueError:
+        pass
+
+
+def test_loop_lag_monitor_sees_blocking_callbacks():
+    async def run():
+        monitor = LoopLagMonitor(interval=0.01)
+        monitor.start()
+        await asyncio.sleep(0.02)
+        time.sleep(0.1)  # block the loop
+        await asyncio.sleep(0.02)
+        await monitor.stop()
+        assert monitor.take_max() >= 0.08
+        assert monitor.take_max() == 0.0
+
+    before = EVENT_LOOP_LAG_SECONDS.count()
+    asyncio.run(run())
+    assert EVENT_LOOP_LAG_SECONDS.count() > before
+
+
+def test_loop_watchdog_reports_blocking_endpoint():
+    def blocking_handler():
+        time.sleep(0.25)
+
+    async def run():
+        watchdog = LoopWatchdog(threshold=0.05, enabled=True)
+        watchdog.start()
+        try:
+            async def request():
+                route = types.SimpleNamespace(path="/api/items/{item_id}")
+                watchdog.track_request({"type": "http", "method": "POST", "path": "/api/items/7", "route": route})
+                await asyncio.sleep(0.1)
+                blocking_handler()
+
+            await asyncio.create_task(request())
+            await asyncio.sleep(0.2)
+        finally:
+            watchdog.stop()
+        return watchdog.reports
+
+    before = EVENT_LOOP_BLOCKED.value(endpoint="POST /api/items/{item_id}")
+    reports = asyncio.run(run())
+    assert len(reports) == 1, list(reports)
+    assert reports[0]['endpoint'] == "POST /api/items/7"
+    assert reports[0]['duration'] >= 0.2
+    assert "blocking_handler" in reports[0]['stack']
+    assert EVENT_LOOP_BLOCKED.value(endpoint="POST /api/items/{item_id}") == before + 1
+
+
+def test_metrics_endpoint():
+    async def run():
+        client = FakeClient(latency=0)
+        chat = client.aio.chats.create(model="fake")
+        await retry.RetryLayer().call("chat", chat.send_message, "hi")
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            await http.get("/")
+            await http.get("/api/video_chat/events/missing-op")
+            response = await http.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith("text/plain; version=0.0.4")
+        return response.text
+
+    text = asyncio.run(run())
+    assert GEMINI_CALL_SECONDS.count(call="chat", outcome="ok") >= 1
+    assert 'gemini_call_duration_seconds_count{call="chat",outcome="ok"}' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/",status="200"}' in text
+    # Labelled by route template, not by raw path
+    assert 'route="/api/video_chat/events/{operation_id}"' in text
+    assert 'video_operations{status="pending"}' in text
+    assert 'chat_sessions ' in text
+    assert 'video_jobs_running 0' in text
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Tests for lossless MP4 concatenation (pure-Python path), on synthetic clips.
+Runs offline (no ffmpeg needed).
+
+Usage: cd back && python -m pytest testss/test_mp4_concat.py
+"""
+import os
+import struct
+import tempfile
+
+import mp4_concat
+from mp4_concat import concat_mp4, concat_videos, read_movie, top_level_boxes
+from fake_gemini import make_mp4
+
+
+def write_clips(directory, tags, **kwargs):
+    paths = []
+    for tag in tags:
+        path = os.path.join(directory, f"{tag.decode()}.mp4")
+        with open(path, "wb") as f:
+            f.write(make_mp4(tag=tag, **kwargs))
+        paths.append(path)
+    return paths
+
+
+def read_samples(path):
+    """Sample payloads of each track, in decode order"""
+    _, _, tracks = read_movie(path)
+    samples = []
+    with open(path, "rb") as f:
+        for track in tracks:
+            payloads = []
+            for offset, sizes, _ in track.chunks:
+                f.seek(offset)
+                payloads.extend(f.read(size) for size in sizes)
+            samples.append(payloads)
+    return tracks, samples
+
+
+def test_samples_and_timing_survive_concat():
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_clips(directory, [b"A", b"B", b"C"])
+        output = concat_mp4(paths, os.path.join(directory, "joined.mp4"))
+
+        tracks, samples = read_samples(output)
+        clips = [read_samples(path) for path in paths]
+        for t, track in enumerate(tracks):
+            assert samples[t] == [s for _, clip in clips for s in clip[t]]
+            assert sum(track.deltas) == sum(sum(clip[0][t].deltas) for clip in clips)
+            assert len(track.descriptions) == 1  # identical codec settings share one entry
+
+        # Key frames and composition offsets follow their samples
+        video, clip_video = tracks[0], clips[0][0][0]
+        frames = len(clip_video.deltas)
+        assert video.sync_samples == [n + k * frames for k in range(3) for n in clip_video.sync_samples]
+        assert video.composition_offsets == clip_video.composition_offsets * 3
+
+        # Fast start: moov before mdat, edit lists dropped, movie duration updated
+        with open(output, "rb") as f:
+            kinds = [kind for kind, _, _, _ in top_level_boxes(f)]
+        assert kinds == [b"ftyp", b"moov", b"mdat"]
+        _, moov, _ = read_movie(output)
+        assert all(trak.child(b"edts") is None for trak in moov.children if trak.kind == b"trak")
+        mvhd = moov.child(b"mvhd").payload
+        assert struct.unpack_from(">I", mvhd, 16)[0] == 3000
+
+
+def test_mismatched_clips_are_rejected():
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_clips(directory, [b"A"]) + write_clips(directory, [b"B"], audio=False)
+        try:
+            concat_mp4(paths, os.path.join(directory, "joined.mp4"))
+            assert False, "different track layouts should be rejected"
+        except ValueError:
+            pass
+        assert sorted(os.listdir(directory)) == ["A.mp4", "B.mp4"]  # no partial output
+
+
+def test_concat_videos_method_selection():
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_clips(directory, [b"A", b"B"])
+        output = concat_videos(paths, os.path.join(directory, "joined.mp4"), method="python")
+        assert read_samples(output)[1][0][0].startswith(b"Avide")
+
+        binary, mp4_concat.FFMPEG_BINARY = mp4_concat.FFMPEG_BINARY, "ffmpeg-that-does-not-exist"
+        try:
+            concat_videos(paths, output, method="ffmpeg")
+            assert False, "missing ffmpeg should be reported"
+        except RuntimeError:
+            pass
+        finally:
+            mp4_concat.FFMPEG_BINARY = binary
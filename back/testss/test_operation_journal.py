@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Tests for the video operation journal: ownership claims between workers,
+restart recovery, and operations owned by another worker (or by a previous
+process) seen through the journal. Runs offline (no server, no API key).
+
+Usage: cd back && python -m pytest testss/test_operation_journal.py
+"""
+import os
+import json
+import time
+import socket
+import asyncio
+import tempfile
+import subprocess
+
+import httpx
+import events
+import main
+import polling
+import operation_journal
+from operation_journal import OperationJournal, WORKER_ID
+from fake_gemini import FakeClient
+
+TEST_DIR = tempfile.mkdtemp(prefix="journal_test_")
+
+
+def dead_owner() -> str:
+    """Owner id of a process on this host that has exited"""
+    process = subprocess.Popen(["true"])
+    process.wait()
+    return f"{socket.gethostname()}:{process.pid}:00000000"
+
+
+def set_owner(journal, operation_id, owner, updated_at=None):
+    journal._db.execute("UPDATE video_operations SET owner = ?, updated_at = ? WHERE operation_id = ?",
+                        (owner, updated_at or time.time(), operation_id))
+    journal._db.commit()
+
+
+def test_claim_is_won_by_one_worker():
+    async def run():
+        db_path = os.path.join(TEST_DIR, "claim.db")
+        worker_a, worker_b = OperationJournal(db_path), OperationJournal(db_path)
+        await worker_a.save("op", {'status': 'error', 'created_at': time.time()})
+
+        results = await asyncio.gather(*(journal.claim("op", 'error', 'processing') for journal in (worker_a, worker_b)))
+        assert sum(record is not None for record in results) == 1
+        assert await worker_b.claim("op", 'error', 'processing') is None
+        assert worker_a._db.execute("SELECT status FROM video_operations").fetchone() == ('processing',)
+
+    asyncio.run(run())
+
+
+def test_claim_unfinished_takes_only_abandoned_rows():
+    async def run():
+        journal = OperationJournal(os.path.join(TEST_DIR, "unfinished.db"))
+        stale = time.time() - 10 * 3600
+        owners = {
+            'mine': (WORKER_ID, None),
+            'dead-pid': (dead_owner(), None),
+            'live-pid': (f"{socket.gethostname()}:{os.getppid()}:00000000", None),
+            'other-host-fresh': ("elsewhere:1:00000000", None),
+            'other-host-stale': ("elsewhere:1:00000000", stale),
+            'no-owner': (None, None),
+        }
+        for operation_id, (owner, updated_at) in owners.items():
+            await journal.save(operation_id, {'status': 'pending', 'created_at': time.time()})
+            set_owner(journal, operation_id, owner, updated_at)
+        await journal.save("finished", {'status': 'completed', 'created_at': time.time()})
+        set_owner(journal, "finished", dead_owner())
+
+        claimed = sorted(record['operation_id'] for record in await journal.claim_unfinished())
+        assert claimed == ['dead-pid', 'no-owner', 'other-host-stale']
+        assert await journal.claim_unfinished() == []  # now owned by this worker
+
+    asyncio.run(run())
+
+
+def test_live_job_of_another_host_is_not_taken_over():
+    operation_id = "queued-elsewhere"
+    other_host = "elsewhere:1:00000000"
+    stale_after = operation_journal.JOURNAL_STALE_AFTER
+
+    async def heartbeat_of_other_host(journal):
+        operation_journal.WORKER_ID = other_host
+        try:
+            return await journal.heartbeat()
+        finally:
+            operation_journal.WORKER_ID = WORKER_ID
+
+    async def run():
+        main.client = FakeClient(latency=0)
+        other_worker = OperationJournal(main.operation_journal.db_path)
+        await other_worker.save(operation_id, {'status': 'queued', 'created_at': time.time(), 'prompt': "p",
+                                               'params': {'prompt': "waiting for a slot"}})
+        set_owner(other_worker, operation_id, other_host)
+
+        # Queued for longer than the stale window, but its owner keeps beating
+        for _ in range(4):
+            await asyncio.sleep(0.05)
+            assert await heartbeat_of_other_host(other_worker) == 1
+        await main.resume_video_operations()
+        assert operation_id not in main.video_operations
+        assert main.client.calls['generate_videos'] == 0
+
+        # Once the beats stop it counts as abandoned
+        await asyncio.sleep(0.15)
+        assert [r['operation_id'] for r in await OperationJournal(other_worker.db_path).claim_unfinished()] == [operation_id]
+        await other_worker.delete(operation_id)
+
+    operation_journal.JOURNAL_STALE_AFTER = 0.1
+    try:
+        asyncio.run(run())
+    finally:
+        operation_journal.JOURNAL_STALE_AFTER = stale_after
+
+
+def test_pending_operation_recovered_after_restart():
+    polling.POLL_INITIAL_INTERVAL = 0.01
+    polling.POLL_MAX_INTERVAL = 0.02
+    main.OUTPUT_DIR = TEST_DIR
+    operation_id = "left-by-dead-worker"
+
+    async def run():
+        main.client = FakeClient(latency=0, video_latency=0.05)
+        upstream = await main.client.aio.models.generate_videos(model="veo", prompt="a quiet lake")
+        previous_process = OperationJournal(main.operation_journal.db_path)
+        await previous_process.save(operation_id, {
+            'status': 'pending', 'created_at': time.time(), 'prompt': "a quiet lake", 'operation': upstream,
+        })
+        set_owner(previous_process, operation_id, dead_owner())
+
+        await main.resume_video_operations()
+        main.operation_poller.start()
+        try:
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as http:
+                for _ in range(500):
+                    status = (await http.post("/api/video_chat/status", json={"operation_id": operation_id})).json()
+                    if status['status'] in ('completed', 'error'):
+                        break
+                    await asyncio.sleep(0.01)
+        finally:
+            await main.operation_poller.stop()
+        assert status['status'] == 'completed', status
+        assert os.path.exists(status['video_path'])
+        assert main.client.calls['generate_videos'] == 1  # re-attached, not submitted again
+        assert (await previous_process.load(operation_id))['status'] == 'completed'
+
+    asyncio.run(run())
+
+
+def long_video_record(**fields):
+    record = {'type': 'long_video', 'mode': 'extend', 'status': 'processing', 'created_at': time.time(),
+              'prompt': "a walk", 'segments': [8, 7], 'current_segment': 0, 'progress_percentage': 0}
+    record.update(fields)
+    return record
+
+
+def test_event_stream_follows_operation_of_another_worker():
+    events.JOURNAL_POLL_INTERVAL = 0.01
+    operation_id = "other-worker-op"
+
+    async def run():
+        other_worker = OperationJournal(main.operation_journal.db_path)
+        await other_worker.save(operation_id, long_video_record())
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as http:
+            assert (await http.get("/api/video_chat/events/unknown")).status_code == 404
+
+            async def other_worker_progress():
+                await asyncio.sleep(0.05)
+                await other_worker.save(operation_id, long_video_record(current_segment=1, progress_percentage=50))
+                await asyncio.sleep(0.05)
+                await other_worker.save(operation_id, long_video_record(
+                    status='completed', progress_percentage=100, video_path="/tmp/done.mp4"))
+
+            progress = asyncio.create_task(other_worker_progress())
+            response = await http.get(f"/api/video_chat/events/{operation_id}")  # returns once the stream closes
+            await progress
+            lines = response.text.splitlines()
+            received = [line[len("event: "):] for line in lines if line.startswith("event: ")]
+            payloads = [json.loads(line[len("data: "):]) for line in lines if line.startswith("data: ")]
+            assert [p['progress_percentage'] for p in payloads] == [0, 50, 100]
+            assert received == ["snapshot", "processing", "completed"], received
+            assert payloads[-1]['video_url'] == "/outputs/done.mp4"
+
+    asyncio.run(run())
+
+
+def test_resume_checks_type_before_claiming():
+    operation_id = "failed-single-video"
+
+    async def run():
+        main.client = FakeClient(latency=0)
+        other_worker = OperationJournal(main.operation_journal.db_path)
+        await other_worker.save(operation_id, {'status': 'error', 'created_at': time.time(), 'prompt': "p"})
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as http:
+            response = await http.post("/api/video_chat/resume", json={"operation_id": operation_id})
+            assert response.status_code == 400
+        # Still failed and not taken over, so no restart will try to resume it
+        assert (await other_worker.load(operation_id))['status'] == 'error'
+        assert operation_id not in main.video_operations
+
+    asyncio.run(run())
+
+
+def test_reaper_deletes_old_finished_rows_of_other_processes():
+    async def run():
+        previous_process = OperationJournal(main.operation_journal.db_path)
+        video_path = os.path.join(TEST_DIR, "old_video.mp4")
+        with open(video_path, "wb") as f:
+            f.write(b"video")
+        await previous_process.save("old-done", {'status': 'completed', 'created_at': 1, 'video_path': video_path})
+        await previous_process.save("old-running", {'status': 'processing', 'created_at': 1})
+        await previous_process.save("recent-done", {'status': 'completed', 'created_at': 1})
+        old = time.time() - main.VIDEO_OPERATION_TTL - 60
+        previous_process._db.execute("UPDATE video_operations SET updated_at = ? WHERE operation_id != 'recent-done'", (old,))
+        previous_process._db.commit()
+
+        await main.cleanup_old_video_operations()
+        assert await previous_process.load("old-done") is None
+        assert not os.path.exists(video_path)
+        assert await previous_process.load("old-running") is not None
+        assert await previous_process.load("recent-done") is not None
+        for operation_id in ("old-running", "recent-done"):
+            await previous_process.delete(operation_id)
+
+    asyncio.run(run())
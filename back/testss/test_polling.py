@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Tests for polling Veo operations: the central poller, wait_for_operation,
+background tasks and finalizing finished operations. Runs offline (no
+server, no API key).
+
+Usage: cd back && python -m pytest testss/test_polling.py
+"""
+import time
+import asyncio
+import dataclasses
+
+import pytest
+from google.genai import types
+
+import main
+import retry
+import polling
+import concurrency
+from polling import OperationFailed, OperationPoller, OperationTimeout, refresh_operation, wait_for_operation
+from fake_gemini import FakeClient
+
+retry.gemini_retry = retry.RetryLayer({
+    kind: dataclasses.replace(policy, rate_per_minute=0) for kind, policy in retry.RETRY_POLICIES.items()
+})
+
+
+def finished(name, **fields):
+    return types.GenerateVideosOperation(name=name, done=True, **fields)
+
+
+def test_empty_or_filtered_result_fails_the_job():
+    async def run():
+        results = {
+            'filtered': finished('f', response=types.GenerateVideosResponse(
+                rai_media_filtered_count=1, rai_media_filtered_reasons=['unsafe content'])),
+            'empty': finished('e', response=types.GenerateVideosResponse(generated_videos=[])),
+            'no-response': finished('n'),
+        }
+        for operation_id, operation in results.items():
+            main.video_operations[operation_id] = {'status': 'finalizing', 'created_at': time.time(), 'prompt': "p"}
+            await main.finalize_video_operation(operation_id, operation)
+        errors = {operation_id: main.video_operations[operation_id]['error'] for operation_id in results}
+        assert all(main.video_operations[operation_id]['status'] == 'error' for operation_id in results)
+        assert errors == {
+            'filtered': "Video blocked by safety filters: unsafe content",
+            'empty': "Video operation finished without a video",
+            'no-response': "Video operation finished without a video",
+        }
+
+    asyncio.run(run())
+
+
+def test_wait_for_operation_backs_off_until_done(monkeypatch):
+    sleeps = []
+    sleep = asyncio.sleep
+
+    async def recording_sleep(delay):
+        sleeps.append(delay)
+        await sleep(delay)
+
+    async def run():
+        client = FakeClient(latency=0, video_latency=0.15)
+        operation = await client.aio.models.generate_videos(model="veo", prompt="p")
+        monkeypatch.setattr(asyncio, "sleep", recording_sleep)
+        done = await wait_for_operation(client, operation, initial_interval=0.01, max_interval=0.04, backoff=2, timeout=5)
+        monkeypatch.undo()
+        assert done.done and done.response.generated_videos
+        # One status check per sleep, the interval doubling up to its cap
+        assert sleeps[:3] == [0.01, 0.02, 0.04] and set(sleeps[3:]) == {0.04}
+        assert client.calls['operations_get'] == len(sleeps)
+
+    asyncio.run(run())
+
+
+def test_wait_for_operation_times_out_or_fails():
+    async def run():
+        client = FakeClient(latency=0, video_latency=10)
+        operation = await client.aio.models.generate_videos(model="veo", prompt="p")
+        with pytest.raises(OperationTimeout):
+            await wait_for_operation(client, operation, initial_interval=0.01, timeout=0.05)
+
+        client = FakeClient(latency=0, video_latency=0.02)
+        client.failing_submissions = {1}
+        operation = await client.aio.models.generate_videos(model="veo", prompt="p")
+        with pytest.raises(OperationFailed, match="fake generation failure"):
+            await wait_for_operation(client, operation, initial_interval=0.01, timeout=5)
+
+    asyncio.run(run())
+
+
+def test_poller_backs_off_and_hands_over_once(monkeypatch):
+    monkeypatch.setattr(polling, "POLL_INITIAL_INTERVAL", 0.01)
+    monkeypatch.setattr(polling, "POLL_MAX_INTERVAL", 0.04)
+    monkeypatch.setattr(polling, "POLL_BACKOFF", 2)
+
+    async def run():
+        client = FakeClient(latency=0, video_latency=0.2)
+        registry = {}
+        for operation_id in ('ok', 'flaky'):
+            operation = await client.aio.models.generate_videos(model="veo", prompt=operation_id)
+            registry[operation_id] = {'status': 'pending', 'operation': operation}
+        finished_ids = []
+
+        async def on_done(operation_id, operation):
+            finished_ids.append(operation_id)
+
+        poller = OperationPoller(registry, lambda operation: refresh_operation(client, operation, retry=False), on_done)
+
+        # A failed refresh is only logged; the operation is checked again later
+        client.inject('operations_get', 503)
+        delay = await poller.tick()
+        assert client.calls['operations_get'] == 2
+        assert {operation_id: interval for operation_id, (_, interval) in poller._schedule.items()} == {'ok': 0.02, 'flaky': 0.02}
+        assert registry['flaky']['status'] == 'pending' and 0 < delay <= 0.02
+
+        # Nothing is due yet
+        await poller.tick()
+        assert client.calls['operations_get'] == 2
+
+        intervals = []
+        while True:
+            delay = await poller.tick()
+            intervals += [interval for _, interval in poller._schedule.values()]
+            if not any(data['status'] == 'pending' for data in registry.values()):
+                break
+            await asyncio.sleep(delay)
+        assert max(intervals) == 0.04
+
+        # Each finished operation is handed to on_done exactly once
+        await asyncio.gather(*concurrency._tasks)
+        assert sorted(finished_ids) == ['flaky', 'ok']
+        assert all(data['status'] == 'finalizing' for data in registry.values())
+        calls = client.calls['operations_get']
+        assert await poller.tick() == polling.POLLER_IDLE_INTERVAL
+        assert client.calls['operations_get'] == calls and len(finished_ids) == 2
+
+    asyncio.run(run())
+
+
+def test_failed_background_task_is_logged(caplog):
+    async def run():
+        async def fail():
+            raise RuntimeError("finalize broke")
+
+        task = concurrency.spawn(fail())
+        assert task in concurrency._tasks
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert task not in concurrency._tasks
+
+    asyncio.run(run())
+    assert "Background task failed" in caplog.text and "finalize broke" in caplog.text
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Tests for the exact-match chat response cache (memory and disk tiers, TTL,
+the stateless /api/chat path with cache=bypass, and /api/chat/stream).
+Runs offline (no server, no API key).
+
+Usage: cd back && python -m pytest testss/test_response_cache.py
+"""
+import os
+import json
+import time
+import asyncio
+import tempfile
+import dataclasses
+
+import httpx
+import main
+import retry
+from metrics import RESPONSE_CACHE_LOOKUPS
+from response_cache import ResponseCache, cache_key
+from upload_store import UploadStore
+from fake_gemini import FakeClient, make_png
+
+TEST_DIR = tempfile.mkdtemp(prefix="response_cache_test_")
+
+
+def test_memory_and_disk_tiers_expire():
+    async def run():
+        directory = tempfile.mkdtemp(dir=TEST_DIR)
+        parts = [{"type": "text", "content": "a red fox"}]
+        key = cache_key(model="m", message="fox", images=[])
+        assert key == cache_key(images=[], message="fox", model="m")
+        assert key != cache_key(model="m", message="fox", images=["abc"])
+
+        cache = ResponseCache(directory, max_entries=2, ttl=60)
+        assert await cache.get(key) is None
+        await cache.put(key, parts)
+        memory = RESPONSE_CACHE_LOOKUPS.value(result="memory")
+        assert await cache.get(key) == parts
+        assert RESPONSE_CACHE_LOOKUPS.value(result="memory") == memory + 1
+
+        # Memory is LRU-bounded; evicted entries are still found on disk
+        for other in ("k1", "k2"):
+            await cache.put(other, parts)
+        assert len(cache) == 2 and key not in cache._entries
+        disk = RESPONSE_CACHE_LOOKUPS.value(result="disk")
+        assert await ResponseCache(directory).get(key) == parts
+        assert await cache.get(key) == parts
+        assert RESPONSE_CACHE_LOOKUPS.value(result="disk") == disk + 2
+
+        # Past the TTL, neither tier serves the entry and the reaper deletes the file
+        expired = ResponseCache(directory, ttl=-1)
+        await expired.put("old", parts)
+        assert await expired.get("old") is None
+        assert await expired.expire() == 1
+        assert not os.path.exists(os.path.join(directory, "old.json"))
+        assert os.path.exists(os.path.join(directory, f"{key}.json"))
+
+        # The sweep goes by mtime (the expiry time), without reading the files
+        assert os.stat(os.path.join(directory, f"{key}.json")).st_mtime > time.time() + 50
+        await cache.discard("k1")
+        assert "k1" not in cache._entries and not os.path.exists(os.path.join(directory, "k1.json"))
+        os.utime(os.path.join(directory, "k2.json"), (1, 1))
+        assert await cache.expire() == 1 and os.listdir(directory) == [f"{key}.json"]
+
+    asyncio.run(run())
+
+
+def test_stateless_chat_served_from_cache():
+    main.OUTPUT_DIR = TEST_DIR
+    main.upload_store = UploadStore(tempfile.mkdtemp(dir=TEST_DIR))
+    main.response_cache = ResponseCache(os.path.join(TEST_DIR, "response_cache"))
+    retry.gemini_retry = retry.RetryLayer({
+        kind: dataclasses.replace(policy, rate_per_minute=0) for kind, policy in retry.RETRY_POLICIES.items()
+    })
+    fake = FakeClient(latency=0.3)
+    image = make_png((64, 64), color='red')
+
+    async def run():
+        main.client = fake
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as http:
+            async def chat(message="thumbnail: sunset", **fields):
+                files = [("files", ("ref.png", image, "image/png"))]
+                response = await http.post("/api/chat", data={"message": message, **fields}, files=files)
+                assert response.status_code == 200, response.text
+                return response.json()
+
+            first = await chat()
+            assert first['session_id'] and 'cached' not in first
+            assert [p['type'] for p in first['parts']] == ["text", "image"]
+
+            started = time.monotonic()
+            second = await chat()
+            assert time.monotonic() - started < 0.3  # no generation latency
+            assert second['cached'] is True and second['session_id'] is None
+            assert second['parts'] == first['parts']
+            assert fake.calls['send_message'] == 1
+
+            inline = await chat(inline_images="true")
+            assert inline['parts'][1]['content'].startswith("data:image/png;base64,")
+            assert inline['parts'][1]['url'] == first['parts'][1]['url']
+
+            # Different prompt, bypass, and session turns all generate
+            await chat(message="thumbnail: sunrise")
+            bypassed = await chat(cache="bypass")
+            assert 'cached' not in bypassed
+            await chat(session_id=first['session_id'])
+            assert fake.calls['send_message'] == 4
+
+            # A stored image removed from OUTPUT_DIR turns the entry into a miss
+            os.remove(first['parts'][1]['path'])
+            regenerated = await chat()
+            assert 'cached' not in regenerated and fake.calls['send_message'] == 5
+
+            assert (await http.post("/api/chat", data={"message": "x", "cache": "refresh"})).status_code == 400
+
+    asyncio.run(run())
+
+
+def sse_events(text):
+    """(event, data) pairs of a Server-Sent Events body"""
+    events = []
+    for raw in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in raw.splitlines())
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def test_stream_shares_the_cache():
+    main.OUTPUT_DIR = TEST_DIR
+    main.upload_store = UploadStore(tempfile.mkdtemp(dir=TEST_DIR))
+    main.response_cache = ResponseCache(tempfile.mkdtemp(dir=TEST_DIR))
+    fake = FakeClient(latency=0.05)
+
+    async def run():
+        main.client = fake
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as http:
+            streamed = sse_events((await http.post("/api/chat/stream", data={"message": "a logo"})).text)
+            assert [event for event, _ in streamed] == ["session", "text", "image", "done"]
+            assert fake.calls['send_message_stream'] == 1
+
+            # Answered from what the stream stored, by either endpoint
+            cached = sse_events((await http.post("/api/chat/stream", data={"message": "a logo"})).text)
+            assert [event for event, _ in cached] == ["session", "text", "image", "done"]
+            assert cached[0][1]['session_id'] is None and cached[-1][1]['cached'] is True
+            assert [data for _, data in cached[1:3]] == [data for _, data in streamed[1:3]]
+            assert (await http.post("/api/chat", data={"message": "a logo"})).json()['cached'] is True
+
+            bypassed = sse_events((await http.post("/api/chat/stream", data={"message": "a logo", "cache": "bypass"})).text)
+            assert 'cached' not in bypassed[-1][1]
+            assert fake.calls['send_message_stream'] == 2 and fake.calls['send_message'] == 0
+
+    asyncio.run(run())
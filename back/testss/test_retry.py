@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Tests for the Gemini retry layer, against the fault-injecting fake client.
+Runs offline (no server, no API key).
+
+Usage: cd back && python -m pytest testss/test_retry.py
+"""
+import os
+import time
+import asyncio
+import tempfile
+import dataclasses
+import email.utils
+
+import httpx
+from google.genai import errors, types
+
+import retry
+from retry import RETRY_POLICIES, RetryLayer, TokenBucket, retry_after
+from video_jobs import VideoJobSpec, submit_video_job
+from polling import refresh_operation
+from downloads import download_video
+from fake_gemini import FakeClient, make_api_error
+
+
+def fast_layer(**overrides):
+    """Install a layer with the real per-kind rules but millisecond delays"""
+    policies = {
+        kind: dataclasses.replace(policy, base_delay=0.01, max_delay=0.05, deadline=5.0,
+                                  rate_per_minute=0, **overrides)
+        for kind, policy in RETRY_POLICIES.items()
+    }
+    retry.gemini_retry = RetryLayer(policies, enabled=True)
+    return retry.gemini_retry
+
+
+def test_submit_retries_429_and_honors_retry_after():
+    async def run():
+        layer = fast_layer()
+        client = FakeClient(latency=0)
+        client.inject('generate_videos', 429, 429, retry_after=0.05)
+
+        started = time.monotonic()
+        operation = await submit_video_job(client, VideoJobSpec(prompt="a cat"))
+        assert operation.name
+        assert time.monotonic() - started >= 0.1
+        assert client.calls['generate_videos'] == 3
+        assert layer.stats['generate_videos'].retries == 2
+
+    asyncio.run(run())
+
+
+def test_ambiguous_submit_errors_are_not_retried():
+    """A 500 on submit may have created the job, so it is surfaced instead of paying twice"""
+    async def run():
+        fast_layer()
+        client = FakeClient(latency=0)
+        client.inject('generate_videos', 500)
+        try:
+            await submit_video_job(client, VideoJobSpec(prompt="a cat"))
+            assert False, "500 should propagate"
+        except errors.ServerError:
+            pass
+        assert client.calls['generate_videos'] == 1
+
+        # Client errors are never retried
+        client.inject('operations_get', 400)
+        try:
+            await refresh_operation(client, types.GenerateVideosOperation(name="op"))
+            assert False, "400 should propagate"
+        except errors.ClientError:
+            pass
+        assert client.calls['operations_get'] == 1
+
+    asyncio.run(run())
+
+
+def test_retry_budget_stops_retry_storms():
+    async def run():
+        layer = fast_layer(retry_ratio=0.1, burst=10)  # budget of 1 retry, +0.1 per call
+        client = FakeClient(latency=0)
+        for _ in range(10):
+            client.inject('operations_get', 503, 503, 503, 503, 503)
+
+        operation = types.GenerateVideosOperation(name="op")
+        results = await asyncio.gather(*(refresh_operation(client, operation) for _ in range(10)),
+                                       return_exceptions=True)
+        assert all(isinstance(r, errors.ServerError) for r in results)
+        stats = layer.stats['operations_get']
+        assert stats.retries <= 2
+        assert stats.budget_exhausted > 0
+        assert client.calls['operations_get'] <= 12
+
+    asyncio.run(run())
+
+
+def test_stream_retried_only_before_first_chunk():
+    async def run():
+        fast_layer()
+        client = FakeClient(latency=0)
+        chat = client.aio.chats.create(model="fake")
+
+        client.inject('send_message_stream', 503, httpx.ConnectError("refused"))
+        chunks = [chunk async for chunk in await retry.stream_with_retry("chat", chat.send_message_stream, "hi")]
+        assert len(chunks) == 3
+        assert client.calls['send_message_stream'] == 3
+
+    asyncio.run(run())
+
+
+def test_download_and_poller_paths():
+    async def run():
+        layer = fast_layer()
+        client = FakeClient(latency=0)
+
+        client.inject('download', httpx.ReadTimeout("slow"), 502)
+        with tempfile.TemporaryDirectory() as output_dir:
+            path = await download_video(client, types.Video(uri="files/abc"), output_dir, "out.mp4")
+            assert os.path.getsize(path) > 0
+            assert os.listdir(output_dir) == ["out.mp4"]  # no leftover partial files
+        assert client.calls['download'] == 3
+
+        # The poller makes one attempt per tick; a Retry-After pauses the kind
+        client.inject('operations_get', 429, retry_after=0.05)
+        try:
+            await refresh_operation(client, types.GenerateVideosOperation(name="op"), retry=False)
+            assert False, "single attempt should propagate"
+        except errors.ClientError:
+            pass
+        assert layer.limiters['operations_get'].wait_time() > 0
+
+    asyncio.run(run())
+
+
+def test_token_bucket():
+    now = [0.0]
+    bucket = TokenBucket(rate=1.0, capacity=2, clock=lambda: now[0])
+    assert bucket.try_take() and bucket.try_take()
+    assert not bucket.try_take()
+    assert abs(bucket.wait_time() - 1.0) < 1e-9
+    now[0] += 1.0
+    assert bucket.try_take()
+
+    now[0] += 10.0
+    bucket.pause(5.0)
+    assert not bucket.try_take()
+    now[0] += 5.0
+    assert bucket.try_take()
+
+
+def test_retry_after_parsing():
+    assert retry_after(make_api_error(429, retry_after=7)) == 7.0
+    assert retry_after(make_api_error(429, retry_delay=12)) == 12.0
+    assert retry_after(make_api_error(503)) is None
+
+    when = email.utils.formatdate(time.time() + 30, usegmt=True)
+    error = errors.ClientError(429, {'error': {'code': 429}}, httpx.Response(429, headers={'retry-after': when}))
+    assert 25 <= retry_after(error) <= 31
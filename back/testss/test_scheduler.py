@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Tests for the Veo job scheduler: caps, fair queuing across sessions,
+priority weights, queue positions, and storyboards held to the per-session
+cap. Runs offline.
+
+Usage: cd back && python -m pytest testss/test_scheduler.py
+"""
+import asyncio
+import tempfile
+
+import httpx
+import main
+import polling
+from scheduler import JobScheduler, INTERACTIVE, BATCH
+from fake_gemini import FakeClient
+
+
+def test_global_and_per_session_caps():
+    async def run():
+        scheduler = JobScheduler(max_concurrent=3, max_per_session=2)
+        admitted = [scheduler.enqueue(f"a{i}", "A").done() for i in range(3)]
+        assert admitted == [True, True, False]  # session A capped at 2
+        assert scheduler.enqueue("b0", "B").done()  # other sessions still get in
+        assert not scheduler.enqueue("c0", "C").done()  # global cap reached
+        assert (scheduler.running, scheduler.queued) == (3, 2)
+
+        scheduler.release("b0")
+        assert scheduler.is_running("c0") and not scheduler.is_running("a2")
+        scheduler.release("a0")
+        assert scheduler.is_running("a2")
+
+    asyncio.run(run())
+
+
+def test_sessions_take_turns():
+    """A burst from one session does not push back a later request from another"""
+    async def run():
+        scheduler = JobScheduler(max_concurrent=1, max_per_session=1)
+        scheduler.enqueue("running", "X")
+        for i in range(5):
+            scheduler.enqueue(f"a{i}", "A")
+        scheduler.enqueue("b0", "B")
+        assert scheduler.position("a0") == 1
+        assert scheduler.position("b0") == 2
+        assert scheduler.position("a1") == 3
+        assert scheduler.position("running") is None
+
+        order = []
+        current = "running"
+        while current:
+            scheduler.release(current)
+            current = next((job for job in ["a0", "a1", "a2", "a3", "a4", "b0"]
+                            if scheduler.is_running(job) and job not in order), None)
+            if current:
+                order.append(current)
+        assert order[:3] == ["a0", "b0", "a1"]
+
+    asyncio.run(run())
+
+
+def test_priority_weights_do_not_starve_batch():
+    async def run():
+        scheduler = JobScheduler(max_concurrent=1, max_per_session=1, weights={INTERACTIVE: 3, BATCH: 1})
+        scheduler.enqueue("running", "X")
+        scheduler.enqueue("long", "L", BATCH)
+        for i in range(6):
+            scheduler.enqueue(f"i{i}", f"S{i}")
+        # "running" used one of the 3 interactive grants of this round
+        assert [scheduler.position(job) for job in ("i0", "i1", "long", "i2")] == [1, 2, 3, 4]
+        assert scheduler.position("i5") == 7
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiters_leave_the_queue():
+    async def run():
+        scheduler = JobScheduler(max_concurrent=1)
+        scheduler.enqueue("running", "X")
+        waiter = asyncio.create_task(scheduler.acquire("w", "W"))
+        await asyncio.sleep(0)
+        assert scheduler.queued == 1
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert scheduler.queued == 0
+
+        scheduler.release("running")
+        async with scheduler.slot("job"):
+            assert scheduler.is_running("job")
+        assert scheduler.running == 0
+
+    asyncio.run(run())
+
+
+def test_storyboard_without_session_does_not_starve_others():
+    polling.POLL_INITIAL_INTERVAL = 0.01
+    polling.POLL_MAX_INTERVAL = 0.02
+    main.OUTPUT_DIR = tempfile.mkdtemp(prefix="scheduler_test_")
+
+    async def run():
+        main.client = FakeClient(latency=0, video_latency=0.2)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as http:
+            response = await http.post("/api/video_chat/generate_long", json={
+                "prompt": "shot one", "duration": 24, "mode": "storyboard",
+            })
+            operation_id = response.json()['operation_id']
+            await asyncio.sleep(0.05)
+
+            # The shots count as one session: one runs, the others wait
+            shots = [main.storyboard_job_id(operation_id, index) for index in range(3)]
+            assert sum(scheduler.is_running(job_id) for job_id in shots) == 1
+            assert scheduler.enqueue("other-job", "other-session").done()
+            scheduler.release("other-job")
+
+            for _ in range(500):
+                status = (await http.post("/api/video_chat/status", json={"operation_id": operation_id})).json()
+                if status['status'] in ('completed', 'error'):
+                    break
+                await asyncio.sleep(0.01)
+            assert status['status'] == 'completed', status
+
+    original = main.video_scheduler
+    main.video_scheduler = scheduler = JobScheduler(max_concurrent=2, max_per_session=1)
+    try:
+        asyncio.run(run())
+    finally:
+        main.video_scheduler = original
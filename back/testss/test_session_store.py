@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Tests for the session stores: memory LRU and idle TTL, SQLite persistence
+across store instances (workers), and the save compare-and-swap between
+workers. Runs offline (no server, no API key).
+
+Usage: cd back && python -m pytest testss/test_session_store.py
+"""
+import os
+import asyncio
+import tempfile
+
+from session_store import MemorySessionStore, SqliteSessionStore
+from fake_gemini import FakeClient
+
+TEST_DIR = tempfile.mkdtemp(prefix="session_store_test_")
+
+
+def chat_factory(client):
+    return lambda history=None: client.aio.chats.create(model="fake", history=history)
+
+
+def test_memory_round_trip_lru_and_ttl():
+    async def run():
+        store = MemorySessionStore(timeout=60, max_sessions=2)
+        chat_a, chat_b, chat_c = object(), object(), object()
+        await store.add("a", chat_a)
+        await store.add("b", chat_b)
+        assert (await store.get("a"))['chat'] is chat_a
+        assert await store.save("a", chat_a)
+
+        # "a" was used last, so "b" is the least recently used one at the cap
+        await store.add("c", chat_c)
+        assert len(store) == 2
+        assert await store.get("b") is None
+        assert [s['session_id'] for s in await store.list_sessions()] == ["a", "c"]
+
+        idle = MemorySessionStore(timeout=0.2)
+        await idle.add("old", object())
+        await idle.add("fresh", object())
+        await asyncio.sleep(0.12)
+        await idle.touch("fresh")
+        await asyncio.sleep(0.12)
+        assert await idle.expire() == ["old"]
+        assert await idle.get("old") is None
+        assert await idle.get("fresh") is not None
+
+    asyncio.run(run())
+
+
+def test_sqlite_history_survives_store_instances():
+    async def run():
+        client = FakeClient(latency=0)
+        db_path = os.path.join(TEST_DIR, "persist.db")
+        store = SqliteSessionStore(chat_factory(client), db_path, timeout=60)
+        chat = chat_factory(client)()
+        await store.add("s1", chat)
+        await chat.send_message("first turn")
+        assert await store.save("s1", chat)
+
+        # A restarted (or another) worker rebuilds the chat from the stored history
+        other = SqliteSessionStore(chat_factory(client), db_path, timeout=60)
+        record = await other.get("s1")
+        assert record is not None and record['chat'] is not chat
+        assert len(record['chat'].get_history()) == 2
+        assert [s['session_id'] for s in await other.list_sessions()] == ["s1"]
+
+        expiring = SqliteSessionStore(chat_factory(client), db_path, timeout=0.05)
+        await asyncio.sleep(0.1)
+        assert await expiring.expire() == ["s1"]
+        assert await store.get("s1") is None
+
+    asyncio.run(run())
+
+
+def test_sqlite_save_does_not_overwrite_another_worker():
+    async def run():
+        client = FakeClient(latency=0)
+        db_path = os.path.join(TEST_DIR, "cas.db")
+        worker_a = SqliteSessionStore(chat_factory(client), db_path, timeout=60)
+        worker_b = SqliteSessionStore(chat_factory(client), db_path, timeout=60)
+        await worker_a.add("s1", chat_factory(client)())
+
+        chat_a = (await worker_a.get("s1"))['chat']
+        chat_b = (await worker_b.get("s1"))['chat']
+        await chat_a.send_message("turn on worker a")
+        await chat_b.send_message("turn on worker b")
+        assert await worker_a.save("s1", chat_a)
+        assert not await worker_b.save("s1", chat_b)
+
+        # Worker b picks up worker a's history on its next turn
+        rebuilt = (await worker_b.get("s1"))['chat']
+        assert rebuilt is not chat_b
+        assert rebuilt.get_history()[0].parts[0].text == "turn on worker a"
+
+        # Concurrent turns of one worker share the chat and do not conflict
+        await asyncio.gather(rebuilt.send_message("x"), rebuilt.send_message("y"))
+        results = await asyncio.gather(worker_b.save("s1", rebuilt), worker_b.save("s1", rebuilt))
+        assert results == [True, True]
+        assert len((await worker_a.get("s1"))['chat'].get_history()) == 6
+
+    asyncio.run(run())
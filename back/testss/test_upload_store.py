@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests for the content-addressed upload store: deduplication, reference
+counting, eviction under the byte cap, and how video endpoints pin their
+input images. Runs offline (no server, no API key).
+
+Usage: cd back && python -m pytest testss/test_upload_store.py
+"""
+import io
+import os
+import asyncio
+import tempfile
+
+from fastapi import UploadFile
+
+TEST_DIR = tempfile.mkdtemp(prefix="upload_store_test_")
+
+import main
+from upload_store import UploadStore, content_digest
+from fake_gemini import make_png
+
+
+def test_same_content_is_stored_once():
+    store = UploadStore(tempfile.mkdtemp(dir=TEST_DIR))
+    data = b"x" * 100
+    digest, path = store.put(data, "png", acquire=False)
+    again, same_path = store.put_file(io.BytesIO(data), digest, "png", acquire=False)
+    assert (again, same_path) == (digest, path) and digest == content_digest(data)
+    assert len(store) == 1 and store.total_bytes == 100
+    assert os.listdir(store.directory) == [os.path.basename(path)]
+
+    # A restarted store indexes what is already on disk
+    assert UploadStore(store.directory).path(digest) == path
+
+
+def test_eviction_skips_referenced_files():
+    store = UploadStore(tempfile.mkdtemp(dir=TEST_DIR), max_bytes=250)
+    pinned, _ = store.put(b"a" * 100, "png")                  # acquired
+    old, old_path = store.put(b"b" * 100, "png", acquire=False)
+    recent, _ = store.put(b"c" * 100, "png", acquire=False)   # over the cap: oldest unreferenced goes
+    assert store.path(old) is None and not os.path.exists(old_path)
+    assert store.path(pinned) and store.path(recent)
+    assert store.total_bytes == 200
+
+    # Two references: still kept after the first release
+    assert store.acquire(pinned)
+    store.release(pinned)
+    store.put(b"d" * 100, "png", acquire=False)
+    assert store.path(pinned) and store.path(recent) is None
+    store.release(pinned)
+    store.put(b"e" * 100, "png", acquire=False)
+    assert store.path(pinned) is None
+    assert not store.acquire(pinned)
+
+
+def test_video_inputs_are_pinned_when_stored():
+    async def run():
+        png = make_png((32, 32))
+
+        # Named after the detected format, not the client's file name
+        upload = UploadFile(file=io.BytesIO(png), filename="photo.exe")
+        _, digest, path = await main.read_input_image(upload)
+        assert path.endswith(".png")
+
+        # Pinned from the moment it is written, even over the byte cap
+        main.upload_store.put(b"other upload", "png", acquire=False)
+        assert os.path.exists(path)
+
+        # A rejected job gives its reference back
+        spec = main.VideoJobSpec(prompt="", generation_type="reference", images=[object()],
+                                 input_paths=[path], input_digests=[digest])
+        try:
+            await main.start_video_job(spec)
+        except main.InvalidVideoJob:
+            pass
+        main.upload_store.put(b"another upload", "png", acquire=False)
+        assert not os.path.exists(path)
+
+    original = main.upload_store
+    main.upload_store = UploadStore(tempfile.mkdtemp(dir=TEST_DIR), max_bytes=1)
+    try:
+        asyncio.run(run())
+    finally:
+        main.upload_store = original
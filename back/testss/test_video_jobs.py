@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tests for the video job engine: validation rules and mode dispatch.
+Runs offline against the fake Gemini client.
+
+Usage: cd back && python -m pytest testss/test_video_jobs.py
+"""
+import asyncio
+
+from google.genai import types
+from video_jobs import InvalidVideoJob, VideoJobSpec, generate_videos_kwargs, submit_video_job, validate_job
+from fake_gemini import FakeClient, make_png
+
+
+def image():
+    return types.Image(image_bytes=make_png((16, 16)), mime_type='image/png')
+
+
+def expect_invalid(spec):
+    try:
+        validate_job(spec)
+    except InvalidVideoJob:
+        return
+    assert False, f"spec should have been rejected: {spec}"
+
+
+def test_durations_are_normalized_from_strings_and_ints():
+    assert validate_job(VideoJobSpec(prompt="a", duration="6")).duration == 6
+    assert validate_job(VideoJobSpec(prompt="a", duration=8)).duration == 8
+    assert validate_job(VideoJobSpec(prompt="a", duration=20)).needs_extension
+    expect_invalid(VideoJobSpec(prompt="a", duration=5))
+    expect_invalid(VideoJobSpec(prompt="a", duration="eight"))
+    expect_invalid(VideoJobSpec(prompt="a", generation_type="reference", images=[image()], duration=20))
+
+
+def test_image_counts_per_mode():
+    validate_job(VideoJobSpec(prompt="a", generation_type="reference", images=[image()] * 3))
+    expect_invalid(VideoJobSpec(prompt="a", generation_type="reference", images=[image()] * 4))
+    expect_invalid(VideoJobSpec(prompt="a", generation_type="first_frame", images=[image()] * 2))
+    expect_invalid(VideoJobSpec(prompt="a", generation_type="interpolation", images=[image()]))
+    expect_invalid(VideoJobSpec(prompt="a", generation_type="text", images=[image()]))
+    expect_invalid(VideoJobSpec(prompt="a", generation_type="slideshow"))
+    expect_invalid(VideoJobSpec(prompt=" "))
+    expect_invalid(VideoJobSpec(prompt="a", aspect_ratio="1:1"))
+
+
+def test_dispatch_per_mode():
+    first, last = image(), image()
+    kwargs = generate_videos_kwargs(validate_job(
+        VideoJobSpec(prompt="a", generation_type="interpolation", images=[first, last], negative_prompt="blur")
+    ))
+    assert kwargs['image'] is first and kwargs['config'].last_frame is last
+    assert kwargs['config'].negative_prompt == "blur" and kwargs['config'].duration_seconds == 8
+
+    kwargs = generate_videos_kwargs(validate_job(
+        VideoJobSpec(prompt="a", generation_type="reference", images=[first, last])
+    ))
+    assert 'image' not in kwargs
+    assert [ref.image for ref in kwargs['config'].reference_images] == [first, last]
+
+
+def test_submit_uses_async_client():
+    async def run():
+        client = FakeClient(latency=0)
+        operation = await submit_video_job(client, VideoJobSpec(prompt="a", duration="4"))
+        assert operation.name and client.calls['generate_videos'] == 1
+        try:
+            await submit_video_job(client, VideoJobSpec(prompt="a", duration=16))
+            assert False, "long jobs go through the long video pipeline"
+        except InvalidVideoJob:
+            pass
+
+    asyncio.run(run())
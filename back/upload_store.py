@@ -0,0 +1,143 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import BinaryIO, Callable, Optional, Tuple
+
+from metrics import FILE_WRITE_BYTES, FILE_WRITE_SECONDS
+
+# Upper bound on disk used by cached uploads; unreferenced files are evicted
+# least recently used first once it is exceeded
+UPLOAD_CACHE_MAX_BYTES = int(os.getenv("UPLOAD_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class UploadStore:
+    """
+    Content-addressed upload storage: every distinct file is written once,
+    under the SHA-256 of its bytes, so re-sent reference images cost a hash
+    and no write. Entries are reference counted while operations use them,
+    and the directory is kept under max_bytes by evicting unreferenced files.
+    Methods do blocking I/O - call them through run_blocking.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = UPLOAD_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()  # digest -> {path, size, refs}
+        self._lock = threading.Lock()
+        self._load_existing()
+
+    def _load_existing(self):
+        """Index files already on disk from a previous run (none referenced yet)"""
+        files = []
+        for name in os.listdir(self.directory):
+            digest, _, _ = name.partition('.')
+            path = os.path.join(self.directory, name)
+            if len(digest) == 64 and os.path.isfile(path):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, digest, path, stat.st_size))
+        for _, digest, path, size in sorted(files):
+            self._entries[digest] = {'path': path, 'size': size, 'refs': 0}
+            self.total_bytes += size
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, data: bytes, ext: str = "png", acquire: bool = True,
+            digest: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Store bytes (if not already stored) and return (digest, path).
+        With acquire=True the entry is pinned until release(digest).
+        """
+        digest = digest or content_digest(data)
+        return self._store(digest, ext, acquire, lambda f: f.write(data))
+
+    def put_file(self, fileobj: BinaryIO, digest: str, ext: str = "png",
+                 acquire: bool = True) -> Tuple[str, str]:
+        """
+        Like put(), from a file object whose digest is already known; the
+        content is copied in chunks, and not at all when already stored.
+        """
+        def write(f):
+            fileobj.seek(0)
+            shutil.copyfileobj(fileobj, f, 1024 * 1024)
+        return self._store(digest, ext, acquire, write)
+
+    def _store(self, digest: str, ext: str, acquire: bool,
+               write: Callable[[BinaryIO], None]) -> Tuple[str, str]:
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and os.path.exists(entry['path']):
+                self._entries.move_to_end(digest)
+                if acquire:
+                    entry['refs'] += 1
+                return digest, entry['path']
+
+        path = os.path.join(self.directory, f"{digest}.{ext}")
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=f".{digest}.", suffix=".part")
+        try:
+            with FILE_WRITE_SECONDS.time(kind="upload"), os.fdopen(fd, "wb") as f:
+                write(f)
+                size = f.tell()
+            os.replace(temp_path, path)
+            FILE_WRITE_BYTES.inc(size, kind="upload")
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+        with self._lock:
+            previous = self._entries.pop(digest, None)
+            if previous is not None:
+                self.total_bytes -= previous['size']
+            refs = (previous['refs'] if previous else 0) + (1 if acquire else 0)
+            self._entries[digest] = {'path': path, 'size': size, 'refs': refs}
+            self.total_bytes += size
+            self._evict()
+        return digest, path
+
+    def acquire(self, digest: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return False
+            entry['refs'] += 1
+            self._entries.move_to_end(digest)
+            return True
+
+    def release(self, digest: str):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and entry['refs'] > 0:
+                entry['refs'] -= 1
+            self._evict()
+
+    def path(self, digest: str) -> Optional[str]:
+        entry = self._entries.get(digest)
+        return entry['path'] if entry else None
+
+    def _evict(self):
+        """Drop least recently used unreferenced files until under max_bytes (lock held)"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        for digest in list(self._entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            entry = self._entries[digest]
+            if entry['refs'] > 0:
+                continue
+            del self._entries[digest]
+            self.total_bytes -= entry['size']
+            try:
+                os.remove(entry['path'])
+            except OSError:
+                pass
@@ -0,0 +1,155 @@
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Union
+
+from google.genai import types
+
+from retry import call_with_retry
+
+# Veo model used for every video job
+VEO_MODEL = "veo-3.1-generate-preview"
+
+VALID_ASPECT_RATIOS = ("16:9", "9:16")
+VALID_RESOLUTIONS = ("720p", "1080p")
+VALID_DURATIONS = (4, 6, 8)
+
+# Longest clip one generation can produce; longer text-to-video jobs are
+# built by extending it
+MAX_SINGLE_DURATION = 8
+
+# Length of each extension of an existing video
+EXTENSION_DURATION = 7
+
+# How input images are used, and how many each mode takes (min, max)
+GENERATION_TYPES = {
+    "text": (0, 0),
+    "reference": (1, 3),
+    "first_frame": (1, 1),
+    "interpolation": (2, 2),
+    "extension": (0, 0),
+}
+
+
+class InvalidVideoJob(ValueError):
+    """Rejected job spec (answered with a 400)"""
+
+
+@dataclass
+class VideoJobSpec:
+    """Everything needed to submit one Veo generation"""
+    prompt: str
+    generation_type: str = "text"
+    images: List[types.Image] = field(default_factory=list)
+    video: Any = None  # input video, for "extension"
+    aspect_ratio: str = "16:9"
+    resolution: str = "720p"
+    duration: Union[int, str] = 8
+    negative_prompt: Optional[str] = None
+    session_id: Optional[str] = None
+    # Stored copies of the input images (kept for the operation record)
+    input_paths: List[str] = field(default_factory=list)
+    input_digests: List[str] = field(default_factory=list)
+
+    def params(self) -> dict:
+        """JSON-safe fields (no image or video payloads), enough to rebuild the spec from stored inputs"""
+        return {
+            "prompt": self.prompt,
+            "generation_type": self.generation_type,
+            "aspect_ratio": self.aspect_ratio,
+            "resolution": self.resolution,
+            "duration": self.duration,
+            "negative_prompt": self.negative_prompt,
+            "session_id": self.session_id,
+            "input_paths": list(self.input_paths),
+            "input_digests": list(self.input_digests),
+        }
+
+    @property
+    def needs_extension(self) -> bool:
+        """Text-to-video longer than one generation (served by the long video pipeline)"""
+        return self.generation_type == "text" and parse_duration(self.duration) > MAX_SINGLE_DURATION
+
+    @property
+    def mode(self) -> str:
+        """Human readable mode, for logs and responses"""
+        if self.generation_type == "text":
+            return "text-to-video"
+        if self.images:
+            return f"{self.generation_type} with {len(self.images)} images"
+        return self.generation_type
+
+
+def parse_duration(value: Union[int, str]) -> int:
+    """Durations arrive as ints (JSON) or strings (forms)"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise InvalidVideoJob(f"Invalid duration: {value!r}")
+
+
+def validate_job(spec: VideoJobSpec) -> VideoJobSpec:
+    """Check a spec against the rules shared by all video endpoints; normalizes duration to int"""
+    if not spec.prompt or not spec.prompt.strip():
+        raise InvalidVideoJob("Prompt is required")
+    if spec.generation_type not in GENERATION_TYPES:
+        raise InvalidVideoJob(f"Invalid generation_type. Must be one of {[t for t in GENERATION_TYPES if t != 'extension']}")
+    if spec.aspect_ratio not in VALID_ASPECT_RATIOS:
+        raise InvalidVideoJob(f"Invalid aspect_ratio. Must be one of {list(VALID_ASPECT_RATIOS)}")
+    if spec.resolution not in VALID_RESOLUTIONS:
+        raise InvalidVideoJob(f"Invalid resolution. Must be one of {list(VALID_RESOLUTIONS)}")
+
+    min_images, max_images = GENERATION_TYPES[spec.generation_type]
+    if not min_images <= len(spec.images) <= max_images:
+        if min_images == max_images:
+            raise InvalidVideoJob(f"{spec.generation_type} generation requires exactly {min_images} image{'s' if min_images != 1 else ''}")
+        raise InvalidVideoJob(f"{spec.generation_type} generation takes {min_images} to {max_images} images")
+
+    spec.duration = parse_duration(spec.duration)
+    if spec.generation_type == "extension":
+        if spec.video is None:
+            raise InvalidVideoJob("extension requires an input video")
+        if spec.duration != EXTENSION_DURATION:
+            raise InvalidVideoJob(f"Extensions are {EXTENSION_DURATION} seconds")
+    elif spec.needs_extension:
+        pass  # long text-to-video, split into segments by the caller
+    elif spec.duration not in VALID_DURATIONS:
+        if spec.generation_type == "text":
+            raise InvalidVideoJob(f"Invalid duration. Must be one of {list(VALID_DURATIONS)}, or longer than {MAX_SINGLE_DURATION} for text-to-video")
+        raise InvalidVideoJob(f"Invalid duration. Must be one of {list(VALID_DURATIONS)}")
+    return spec
+
+
+def build_config(spec: VideoJobSpec) -> types.GenerateVideosConfig:
+    config = types.GenerateVideosConfig(
+        aspect_ratio=spec.aspect_ratio,
+        resolution=spec.resolution,
+        duration_seconds=str(spec.duration),
+        number_of_videos=1,
+    )
+    if spec.negative_prompt:
+        config.negative_prompt = spec.negative_prompt
+    if spec.generation_type == "reference":
+        config.reference_images = [
+            types.VideoGenerationReferenceImage(image=image, reference_type="asset")
+            for image in spec.images
+        ]
+    elif spec.generation_type == "interpolation":
+        config.last_frame = spec.images[1]
+    return config
+
+
+def generate_videos_kwargs(spec: VideoJobSpec) -> dict:
+    """Dispatch a validated spec to the generate_videos arguments for its mode"""
+    kwargs = {"model": VEO_MODEL, "prompt": spec.prompt, "config": build_config(spec)}
+    if spec.generation_type in ("first_frame", "interpolation"):
+        kwargs["image"] = spec.images[0]
+    elif spec.generation_type == "extension":
+        kwargs["video"] = spec.video
+    return kwargs
+
+
+async def submit_video_job(client, spec: VideoJobSpec):
+    """Validate a spec and submit it upstream; returns the Veo operation"""
+    validate_job(spec)
+    if spec.needs_extension:
+        raise InvalidVideoJob(f"Single generations are at most {MAX_SINGLE_DURATION} seconds")
+    return await call_with_retry("generate_videos", client.aio.models.generate_videos, **generate_videos_kwargs(spec))
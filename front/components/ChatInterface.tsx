@@ -112,40 +112,62 @@ export default function ChatInterface() {
         formData.append('session_id', sessionId);
       }
 
-      const response = await fetch('http://localhost:8000/api/chat', {
+      const response = await fetch('http://localhost:8000/api/chat/stream', {
         method: 'POST',
         body: formData,
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error('Failed to generate response');
       }
 
-      const data = await response.json();
-
-      // Store session ID from response
-      if (data.session_id) {
-        setSessionId(data.session_id);
-        console.log('Session ID:', data.session_id);
-      }
-
+      // Add an empty model message and fill it in as parts stream in
       let modelText = "";
       const modelImages: string[] = [];
-
-      if (data.parts) {
-        data.parts.forEach((part: any) => {
-          if (part.type === 'text') {
+      setMessages((prev) => [...prev, { role: 'model', content: '', images: [] }]);
+
+      const updateModelMessage = () => {
+        setMessages((prev) => [
+          ...prev.slice(0, -1),
+          { role: 'model', content: modelText, images: [...modelImages] },
+        ]);
+      };
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Server-Sent Events are separated by a blank line
+        const events = buffer.split('\n\n');
+        buffer = events.pop() || '';
+
+        for (const rawEvent of events) {
+          const dataLine = rawEvent.split('\n').find(line => line.startsWith('data: '));
+          if (!dataLine) continue;
+          const eventType = rawEvent.split('\n').find(line => line.startsWith('event: '))?.slice(7);
+          const part = JSON.parse(dataLine.slice(6));
+
+          if (eventType === 'session' && part.session_id) {
+            // Store session ID from response
+            setSessionId(part.session_id);
+            console.log('Session ID:', part.session_id);
+          } else if (part.type === 'text') {
             modelText += part.content;
+            updateModelMessage();
           } else if (part.type === 'image') {
-            modelImages.push(part.content);
+            // Images come back as /outputs URLs unless inlined as data URIs
+            modelImages.push(
+              part.content.startsWith('/') ? `http://localhost:8000${part.content}` : part.content
+            );
+            updateModelMessage();
           }
-        });
+        }
       }
-
-      setMessages((prev) => [
-        ...prev,
-        { role: 'model', content: modelText, images: modelImages },
-      ]);
     } catch (error) {
       console.error('Error:', error);
       setMessages((prev) => [
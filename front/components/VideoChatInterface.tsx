@@ -14,7 +14,7 @@ interface VideoGenerationOptions {
 
 interface VideoOperation {
   operation_id: string;
-  status: 'pending' | 'processing' | 'completed' | 'error';
+  status: 'queued' | 'pending' | 'processing' | 'completed' | 'error';
   prompt: string;
   video_url?: string;
   message?: string;
@@ -25,6 +25,9 @@ interface VideoOperation {
   completed_segments?: number[];
   total_duration?: number;
   estimated_time_minutes?: number;
+  queue_position?: number | null;
+  // Set while a failed long video segment is being generated again
+  retry?: { segment_index: number; attempt: number; error?: string } | null;
 }
 
 interface VideoChatInterfaceProps {
@@ -51,72 +54,75 @@ export default function VideoChatInterface({
   const [negativePrompt, setNegativePrompt] = useState('');
   const [playingVideoId, setPlayingVideoId] = useState<string | null>(null);
   const fileInputRef = useRef<HTMLInputElement>(null);
-  const pollingIntervalRef = useRef<NodeJS.Timeout | null>(null);
+  const eventSourcesRef = useRef<Map<string, EventSource>>(new Map());
 
-  // Polling for video status
+  // Live status updates pushed by the backend (Server-Sent Events)
   useEffect(() => {
-    const pollVideoStatus = async () => {
-      const pendingOps = videoOperations.filter(
-        op => op.status === 'pending' || op.status === 'processing'
-      );
-
-      if (pendingOps.length === 0) {
-        if (pollingIntervalRef.current) {
-          clearInterval(pollingIntervalRef.current);
-        }
-        return;
-      }
+    const sources = eventSourcesRef.current;
+    const pendingOps = videoOperations.filter(
+      op => op.status === 'queued' || op.status === 'pending' || op.status === 'processing'
+    );
 
-      for (const op of pendingOps) {
-        try {
-          const response = await fetch('http://localhost:8000/api/video_chat/status', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ operation_id: op.operation_id })
-          });
+    for (const op of pendingOps) {
+      if (sources.has(op.operation_id)) continue;
 
-          if (!response.ok) {
-            throw new Error(`HTTP ${response.status}: ${response.statusText}`);
-          }
+      const source = new EventSource(
+        `http://localhost:8000/api/video_chat/events/${op.operation_id}`
+      );
+      sources.set(op.operation_id, source);
+
+      const handleUpdate = (event: MessageEvent) => {
+        // Connection errors are also dispatched as 'error' events, without data
+        if (!event.data) return;
+        const { segment_index, attempt, error, ...data } = JSON.parse(event.data);
+        // A retry notice stays until the next progress event
+        const retry = event.type === 'segment_retry' ? { segment_index, attempt, error } : null;
+
+        setVideoOperations(prev =>
+          prev.map(operation =>
+            operation.operation_id === op.operation_id
+              ? { ...operation, ...data, retry }
+              : operation
+          )
+        );
+
+        // Stop listening once the operation is finished
+        if (data.status === 'completed' || data.status === 'error') {
+          console.log(`Operation ${op.operation_id} finished with status: ${data.status}`);
+          source.close();
+          sources.delete(op.operation_id);
+        }
+      };
 
-          const data = await response.json();
+      source.onmessage = handleUpdate;
+      ['snapshot', 'queued', 'pending', 'processing', 'segment_started', 'segment_completed', 'segment_retry', 'completed', 'error']
+        .forEach(type => source.addEventListener(type, handleUpdate as EventListener));
 
+      source.onerror = () => {
+        // The browser reconnects automatically; give up only if the stream was closed for good
+        if (source.readyState === EventSource.CLOSED) {
+          console.error('Video status stream closed:', op.operation_id);
+          sources.delete(op.operation_id);
           setVideoOperations(prev =>
             prev.map(operation =>
               operation.operation_id === op.operation_id
-                ? { ...operation, ...data }
-                : operation
-            )
-          );
-
-          // If completed, stop polling for this operation
-          if (data.status === 'completed' || data.status === 'error') {
-            console.log(`Operation ${op.operation_id} finished with status: ${data.status}`);
-          }
-        } catch (error) {
-          console.error('Error polling video status:', error);
-          // Mark operation as error if polling fails
-          setVideoOperations(prev =>
-            prev.map(operation =>
-              operation.operation_id === op.operation_id
-                ? { ...operation, status: 'error', message: 'Polling failed' }
+                ? { ...operation, status: 'error', message: 'Status stream failed' }
                 : operation
             )
           );
         }
-      }
-    };
-
-    if (videoOperations.some(op => op.status === 'pending' || op.status === 'processing')) {
-      pollingIntervalRef.current = setInterval(pollVideoStatus, 5000);
+      };
     }
+  }, [videoOperations]);
 
+  // Close any open streams on unmount
+  useEffect(() => {
+    const sources = eventSourcesRef.current;
     return () => {
-      if (pollingIntervalRef.current) {
-        clearInterval(pollingIntervalRef.current);
-      }
+      sources.forEach(source => source.close());
+      sources.clear();
     };
-  }, [videoOperations]);
+  }, []);
 
   const handleImageSelect = (e: React.ChangeEvent<HTMLInputElement>) => {
     if (e.target.files) {
@@ -251,6 +257,7 @@ export default function VideoChatInterface({
 
   const getStatusIcon = (status: string) => {
     switch (status) {
+      case 'queued':
       case 'pending':
       case 'processing':
         return <Loader className="w-5 h-5 animate-spin text-cyan-400" />;
@@ -594,6 +601,9 @@ export default function VideoChatInterface({
                           {operation.prompt}
                         </p>
                         <p className="text-xs text-gray-500 mt-1">
+                          {operation.status === 'queued' && (
+                            operation.queue_position ? `Waiting for a slot (#${operation.queue_position})...` : 'Waiting for a slot...'
+                          )}
                           {operation.status === 'pending' && 'Queued...'}
                           {operation.status === 'processing' && (
                             operation.progress_percentage !== undefined ? (
@@ -604,6 +614,14 @@ export default function VideoChatInterface({
                                 {operation.estimated_time_minutes && (
                                   <span> • Est. {operation.estimated_time_minutes}min total</span>
                                 )}
+                                {operation.retry && (
+                                  <>
+                                    <br />
+                                    <span className="text-amber-400">
+                                      Segment {operation.retry.segment_index + 1} failed, retrying (attempt {operation.retry.attempt + 1})...
+                                    </span>
+                                  </>
+                                )}
                               </>
                             ) : (
                               `Processing... (${Math.round(operation.elapsed_seconds || 0)}s)`